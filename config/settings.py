@@ -1,3 +1,4 @@
+import json
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -42,6 +43,8 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    # Первым, чтобы время запроса включало остальные middleware
+    'mailing.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -137,6 +140,96 @@ EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'True').lower() == 'true'
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
+# Адрес сайта для абсолютных ссылок в письмах (например, ссылки отписки)
+MAILING_SITE_URL = os.getenv('MAILING_SITE_URL', 'http://127.0.0.1:8000')
+
+
+# Сколько секунд кешировать роль пользователя (сброс — по сигналам)
+MAILING_ROLE_CACHE_TIMEOUT = int(os.getenv('MAILING_ROLE_CACHE_TIMEOUT', 300))
+# Сколько секунд хранить данные страниц списков и карточек (сброс — сменой
+# версии данных владельца)
+MAILING_PAGE_CACHE_TIMEOUT = int(os.getenv('MAILING_PAGE_CACHE_TIMEOUT', 300))
+
+# Размер страницы списков (курсорная пагинация)
+MAILING_PAGE_SIZE = int(os.getenv('MAILING_PAGE_SIZE', 50))
+# Сколько получателей отдает подбор в форме рассылки за один запрос
+MAILING_AUTOCOMPLETE_LIMIT = int(os.getenv('MAILING_AUTOCOMPLETE_LIMIT', 20))
+
+# Доставка рассылок: размер пачки получателей на одну запись попыток
+MAILING_BATCH_SIZE = int(os.getenv('MAILING_BATCH_SIZE', 500))
+# Число параллельных SMTP-соединений на одну рассылку
+MAILING_DELIVERY_CONNECTIONS = int(os.getenv('MAILING_DELIVERY_CONNECTIONS', 1))
+# Движок доставки: 'sync' (потоки и smtplib) или 'asyncio' (aiosmtplib)
+MAILING_DELIVERY_ENGINE = os.getenv('MAILING_DELIVERY_ENGINE', 'sync')
+# Сколько писем движок asyncio держит в полете одновременно
+MAILING_ASYNC_CONCURRENCY = int(os.getenv('MAILING_ASYNC_CONCURRENCY', 100))
+# Задание делится на диапазоны по столько получателей; воркеры всех узлов
+# забирают диапазоны в аренду на MAILING_CHUNK_LEASE секунд и продлевают ее,
+# пока отправляют. Диапазон умершего воркера забирается после истечения аренды
+MAILING_CHUNK_SIZE = int(os.getenv('MAILING_CHUNK_SIZE', 10000))
+MAILING_CHUNK_LEASE = float(os.getenv('MAILING_CHUNK_LEASE', 60))
+# Маршруты по домену получателя: JSON {"имя": {"domains": [...], "host": ...,
+# "port": ..., "username": ..., "password": ..., "use_tls": ...,
+# "use_ssl": ..., "connections": ...}}, см. mailing/routing.py.
+# Остальные домены идут через релей из EMAIL_*
+MAILING_ROUTES = json.loads(os.getenv('MAILING_ROUTES') or '{}')
+# Таймаут движка asyncio на подключение и отправку одного письма, секунд
+MAILING_SEND_TIMEOUT = float(os.getenv('MAILING_SEND_TIMEOUT', 30))
+# Ограничение скорости отправки на SMTP-релей: стартовая скорость, писем
+# в секунду (0 — без ограничения). Скорость общая для всех воркеров узла
+# и подстраивается под ответы релея в пределах MIN..MAX
+MAILING_RATE_LIMIT = float(os.getenv('MAILING_RATE_LIMIT', 0))
+MAILING_RATE_LIMIT_MIN = float(os.getenv('MAILING_RATE_LIMIT_MIN', 1))
+MAILING_RATE_LIMIT_MAX = float(os.getenv('MAILING_RATE_LIMIT_MAX', 1000))
+# Сколько писем можно отправить разом после простоя
+MAILING_RATE_LIMIT_BURST = float(os.getenv('MAILING_RATE_LIMIT_BURST', 10))
+# Каталог с состоянием ограничителей (по умолчанию — во временном каталоге)
+MAILING_RATE_LIMIT_DIR = os.getenv('MAILING_RATE_LIMIT_DIR', '')
+# Коды ответа SMTP, которыми релей просит отправлять медленнее
+MAILING_THROTTLE_CODES = [
+    int(code) for code in
+    os.getenv('MAILING_THROTTLE_CODES', '421,451').split(',') if code
+]
+# Повторы после временных ошибок SMTP (4xx, обрыв соединения): сколько раз
+# повторять и задержка перед первым повтором, которая затем удваивается
+# до MAILING_RETRY_MAX_DELAY, секунд
+MAILING_RETRY_ATTEMPTS = int(os.getenv('MAILING_RETRY_ATTEMPTS', 5))
+MAILING_RETRY_BASE_DELAY = float(os.getenv('MAILING_RETRY_BASE_DELAY', 60))
+MAILING_RETRY_MAX_DELAY = float(os.getenv('MAILING_RETRY_MAX_DELAY', 3600))
+
+# Стоп-лист: коды ответа SMTP, после которых адрес больше не получает
+# рассылок (жесткий отказ по адресу), и как часто процесс отправки
+# дочитывает новые записи стоп-листа, секунд
+MAILING_SUPPRESS_CODES = [
+    int(code) for code in
+    os.getenv('MAILING_SUPPRESS_CODES', '550,551,553').split(',') if code
+]
+MAILING_SUPPRESSION_REFRESH = float(os.getenv('MAILING_SUPPRESSION_REFRESH', 30))
+# Минимальная емкость фильтра Блума стоп-листа, адресов
+MAILING_SUPPRESSION_MIN_CAPACITY = int(
+    os.getenv('MAILING_SUPPRESSION_MIN_CAPACITY', 100_000)
+)
+
+# Журнал попыток: сколько дней хранить строки попыток, прежде чем команда
+# archive_attempts свернет их в итоги по дням и перенесет в архив,
+# и каталог архива (сжатые NDJSON-файлы по дням)
+MAILING_ATTEMPT_RETENTION_DAYS = int(
+    os.getenv('MAILING_ATTEMPT_RETENTION_DAYS', 90)
+)
+MAILING_ARCHIVE_DIR = os.getenv('MAILING_ARCHIVE_DIR') or BASE_DIR / 'archive'
+
+# Метрики Prometheus (/metrics): каталог, куда процессы узла сохраняют свои
+# значения (по умолчанию — во временном каталоге), как часто сохранять,
+# секунд, и токен доступа. Без токена метрики отдаются только адресам
+# из MAILING_METRICS_ALLOWED_IPS (через запятую); по умолчанию — никому
+MAILING_METRICS_DIR = os.getenv('MAILING_METRICS_DIR', '')
+MAILING_METRICS_FLUSH = float(os.getenv('MAILING_METRICS_FLUSH', 5))
+MAILING_METRICS_TOKEN = os.getenv('MAILING_METRICS_TOKEN', '')
+MAILING_METRICS_ALLOWED_IPS = [
+    address.strip()
+    for address in os.getenv('MAILING_METRICS_ALLOWED_IPS', '').split(',')
+    if address.strip()
+]
 
 
 LOGGING = {
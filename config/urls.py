@@ -4,12 +4,17 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import RedirectView
 
+from mailing.views import metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
 
     path('users/', include('users.urls', namespace='users')),
     path('mailing/', include('mailing.urls', namespace='mailing')),
 
+    # Метрики для Prometheus
+    path('metrics', metrics, name='metrics'),
+
     # Главная страница — редирект на список рассылок
     path('', RedirectView.as_view(url='/mailing/mailings/', permanent=True)),
 ]
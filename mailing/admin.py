@@ -1,14 +1,40 @@
 from django.contrib import admin
-from .models import Mailing, Message, Recipient, MailingAttempt
+from .autocomplete import prefix_filter
+from .models import (
+    Mailing, Message, Recipient, RecipientList, MailingAttempt, MailingJob,
+    MailingChunk, MailingDailyStats, MailingRetry, MailingStats, OwnerStats,
+    Suppression,
+)
+from .suppression import normalize
 
 
 @admin.register(Recipient)
 class RecipientAdmin(admin.ModelAdmin):
-    list_display = ('full_name', 'email', 'owner')
+    list_display = ('full_name', 'email', 'owner', 'unsubscribed_at')
     search_fields = ('full_name', 'email')
-    list_filter = ('owner',)
+    list_filter = ('owner', 'unsubscribed_at')
     readonly_fields = ()  # по необходимости
 
+    def get_search_results(self, request, queryset, search_term):
+        # Подбор получателей в карточке рассылки — по началу email
+        # или Ф.И.О., по индексам вместо LIKE '%...%'
+        match = request.resolver_match
+        if match and match.url_name == 'autocomplete' and search_term:
+            return (queryset.filter(prefix_filter(search_term))
+                    .order_by('email'), False)
+        return super().get_search_results(request, queryset, search_term)
+
+
+@admin.register(RecipientList)
+class RecipientListAdmin(admin.ModelAdmin):
+    list_display = ('name', 'owner', 'created_at')
+    search_fields = ('name',)
+    list_filter = ('owner',)
+    # Членство больших списков не выводится в форме целиком;
+    # списки наполняются импортом (import_recipients --list)
+    exclude = ('recipients',)
+    readonly_fields = ('created_at',)
+
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
@@ -29,7 +55,8 @@ class MailingAdmin(admin.ModelAdmin):
     )
     list_filter = ('status', 'owner')
     search_fields = ('message__subject',)
-    filter_horizontal = ('recipients',)  # удобный вид отбора many-to-many
+    # Получатели подгружаются поиском, а не выводятся списком целиком
+    autocomplete_fields = ('recipients', 'recipient_list')
     readonly_fields = ('start_time', 'end_time')
 
     def message_display(self, obj):
@@ -40,6 +67,72 @@ class MailingAdmin(admin.ModelAdmin):
 
 @admin.register(MailingAttempt)
 class MailingAttemptAdmin(admin.ModelAdmin):
-    list_display = ('mailing', 'attempt_time', 'status')
+    list_display = ('mailing', 'recipient', 'attempt_time', 'status',
+                    'smtp_code')
     list_filter = ('status', 'mailing')
+    list_select_related = ('mailing', 'recipient')
+    raw_id_fields = ('mailing', 'recipient')
     search_fields = ('server_response',)
+    ordering = ('-attempt_time',)
+    # Не считать COUNT(*) по всей таблице попыток на каждой странице
+    show_full_result_count = False
+
+
+@admin.register(MailingJob)
+class MailingJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'mailing', 'status', 'created_at',
+                    'claimed_by', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = ('created_at', 'claimed_at', 'claimed_by', 'finished_at')
+
+
+@admin.register(MailingChunk)
+class MailingChunkAdmin(admin.ModelAdmin):
+    list_display = ('id', 'job', 'start_after', 'last_pk', 'status',
+                    'claimed_by', 'lease_until', 'cursor')
+    list_filter = ('status',)
+    raw_id_fields = ('job', 'mailing')
+    readonly_fields = ('created_at', 'claimed_by', 'lease_until',
+                       'heartbeat_at', 'finished_at', 'cursor', 'high_water')
+
+
+@admin.register(MailingRetry)
+class MailingRetryAdmin(admin.ModelAdmin):
+    list_display = ('mailing', 'recipient', 'retries', 'next_attempt_at',
+                    'smtp_code')
+    list_filter = ('smtp_code',)
+    raw_id_fields = ('mailing', 'recipient')
+    ordering = ('next_attempt_at',)
+
+
+@admin.register(MailingStats)
+class MailingStatsAdmin(admin.ModelAdmin):
+    list_display = ('mailing', 'sent', 'failed', 'last_attempt_time')
+    raw_id_fields = ('mailing',)
+
+
+@admin.register(MailingDailyStats)
+class MailingDailyStatsAdmin(admin.ModelAdmin):
+    list_display = ('mailing', 'day', 'sent', 'failed', 'deferred')
+    list_filter = ('day',)
+    raw_id_fields = ('mailing',)
+    ordering = ('-day',)
+
+
+@admin.register(OwnerStats)
+class OwnerStatsAdmin(admin.ModelAdmin):
+    list_display = ('owner', 'sent', 'failed', 'last_attempt_time')
+    raw_id_fields = ('owner',)
+
+
+@admin.register(Suppression)
+class SuppressionAdmin(admin.ModelAdmin):
+    list_display = ('email', 'owner', 'reason', 'created_at')
+    search_fields = ('email',)
+    list_filter = ('reason',)
+    raw_id_fields = ('owner',)
+    readonly_fields = ('created_at',)
+
+    def save_model(self, request, obj, form, change):
+        obj.email = normalize(obj.email)
+        super().save_model(request, obj, form, change)
@@ -0,0 +1,200 @@
+"""Асинхронная доставка рассылок на asyncio.
+
+Один процесс держит в работе до MAILING_ASYNC_CONCURRENCY SMTP-сессий
+одновременно: каждое письмо в полете — это корутина, а не поток со своим
+стеком. Открытые сессии переиспользуются через пул, число одновременных
+отправок ограничено семафором, на каждое письмо действует свой таймаут.
+Обращения к БД выполняются в синхронном потоке через sync_to_async.
+
+У каждого маршрута по доменам (mailing/routing.py) свой пул сессий
+к своему релею со своим ограничителем скорости, поэтому медленный
+релей не занимает места в пулах других маршрутов.
+"""
+import asyncio
+import logging
+import time
+
+import aiosmtplib
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .delivery import (
+    ENGINE_ASYNCIO, AttemptWriter, build_email, recipient_batches,
+)
+from .models import MailingAttempt
+from .personalization import get_compiled
+from .profiling import PHASE_BUILD, PHASE_CONNECT, PHASE_DATA, PHASE_THROTTLE
+from .rate_limit import closes_session, is_throttled
+from .routing import default_route, get_router
+from .signals import delivery_phase, message_sent
+
+
+logger = logging.getLogger(__name__)
+
+
+def route_smtp_factory(route):
+    def factory():
+        return aiosmtplib.SMTP(
+            hostname=route.host,
+            port=route.port,
+            username=route.username or None,
+            password=route.password or None,
+            start_tls=route.use_tls,
+            use_tls=route.use_ssl,
+            timeout=settings.MAILING_SEND_TIMEOUT,
+        )
+    return factory
+
+
+def default_smtp_factory():
+    return route_smtp_factory(default_route())()
+
+
+def keeps_session(error):
+    """Отказ сервера в ответ на команду (5xx, 4xx кроме 421) оставляет
+    сессию рабочей. После разрыва, таймаута, отмены или неожиданной
+    ошибки состояние сессии неизвестно, и ее нужно закрыть."""
+    return (isinstance(error, (aiosmtplib.SMTPResponseException,
+                               aiosmtplib.SMTPRecipientsRefused))
+            and not closes_session(error))
+
+
+class SMTPPool:
+    """Пул SMTP-сессий: не больше size одновременно занятых сессий.
+    Если задан limiter, каждое письмо ждет токен ограничителя скорости."""
+
+    def __init__(self, smtp_factory, size, timeout, limiter=None):
+        self.smtp_factory = smtp_factory
+        self.timeout = timeout
+        self.limiter = limiter
+        self.semaphore = asyncio.Semaphore(size)
+        self.idle = []
+
+    async def sendmail(self, sender, recipients, data):
+        async with self.semaphore:
+            if self.limiter is not None:
+                # Блокировка ведра короткая, ждем токен уже без нее
+                if wait := self.limiter.reserve():
+                    await asyncio.sleep(wait)
+                    delivery_phase.send(sender=PHASE_THROTTLE, duration=wait)
+            # Время считается с момента получения сессии, без ожидания
+            # свободного места в пуле
+            started = time.perf_counter()
+            status = MailingAttempt.STATUS_FAILED
+            smtp = self.idle.pop() if self.idle else None
+            sending = None
+            try:
+                if smtp is None:
+                    smtp = self.smtp_factory()
+                    await asyncio.wait_for(smtp.connect(), self.timeout)
+                    delivery_phase.send(
+                        sender=PHASE_CONNECT,
+                        duration=time.perf_counter() - started,
+                    )
+                sending = time.perf_counter()
+                try:
+                    await asyncio.wait_for(
+                        smtp.sendmail(sender, recipients, data), self.timeout,
+                    )
+                finally:
+                    delivery_phase.send(
+                        sender=PHASE_DATA,
+                        duration=time.perf_counter() - sending,
+                    )
+                status = MailingAttempt.STATUS_SUCCESS
+            except BaseException as e:
+                if self.limiter is not None and is_throttled(e):
+                    self.limiter.on_throttle()
+                if smtp is not None:
+                    if sending is not None and keeps_session(e) \
+                            and await self.reset(smtp):
+                        self.idle.append(smtp)
+                    else:
+                        smtp.close()
+                raise
+            finally:
+                message_sent.send(
+                    sender=ENGINE_ASYNCIO,
+                    status=status,
+                    duration=time.perf_counter() - started,
+                )
+            if self.limiter is not None:
+                self.limiter.on_success()
+            self.idle.append(smtp)
+
+    async def reset(self, smtp):
+        """RSET после отказа сервера; False, если сессия потеряна."""
+        try:
+            await asyncio.wait_for(smtp.rset(), self.timeout)
+        except (aiosmtplib.SMTPException, TimeoutError):
+            return False
+        return smtp.is_connected
+
+    async def close(self):
+        while self.idle:
+            smtp = self.idle.pop()
+            try:
+                await asyncio.wait_for(smtp.quit(), self.timeout)
+            except (aiosmtplib.SMTPException, TimeoutError):
+                smtp.close()
+
+
+async def send_one(pool, message, recipient, writer):
+    started = time.perf_counter()
+    email = build_email(message, recipient, connection=None)
+    try:
+        data = email.message().as_bytes(linesep='\r\n')
+        delivery_phase.send(sender=PHASE_BUILD,
+                            duration=time.perf_counter() - started)
+        await pool.sendmail(email.from_email, email.recipients(), data)
+    except Exception as e:
+        error = str(e) or 'Превышено время ожидания ответа SMTP-сервера'
+        writer.add(recipient, MailingAttempt.STATUS_FAILED, error, e)
+        logger.error(
+            f"Ошибка отправки письма "
+            f"получателю {recipient.email}: {error}",
+        )
+    else:
+        writer.add(recipient, MailingAttempt.STATUS_SUCCESS,
+                   'Отправлено успешно')
+
+
+async def deliver_mailing_async(mailing, batch_size, concurrency=None,
+                                timeout=None, smtp_factory=None, retries=None,
+                                progress=None):
+    """Асинхронный аналог deliver_mailing; возвращает DeliveryResult.
+
+    concurrency — размер пула маршрута, у которого не задано свое число
+    соединений; smtp_factory — сессии маршрута по умолчанию.
+    """
+    concurrency = concurrency or settings.MAILING_ASYNC_CONCURRENCY
+    timeout = timeout or settings.MAILING_SEND_TIMEOUT
+    router = get_router()
+    pools = {
+        route: SMTPPool(
+            (smtp_factory if smtp_factory and route is router.default
+             else route_smtp_factory(route)),
+            route.connections or concurrency,
+            timeout,
+            route.limiter(),
+        )
+        for route in router.routes
+    }
+    writer = AttemptWriter(mailing, retries, progress)
+    batches = recipient_batches(mailing, batch_size, retries, progress)
+    next_batch = sync_to_async(lambda: next(batches, None))
+    flush = sync_to_async(writer.flush)
+    message = get_compiled(mailing.message)
+
+    try:
+        while (batch := await next_batch()) is not None:
+            await asyncio.gather(*(
+                send_one(pools[router.route(recipient.email)], message,
+                         recipient, writer)
+                for recipient in batch
+            ))
+            await flush()
+    finally:
+        for pool in pools.values():
+            await pool.close()
+    return writer.result
@@ -0,0 +1,113 @@
+"""Аудитория рассылки: свои получатели и получатели списка.
+
+У рассылки два источника получателей — связующая таблица
+Mailing.recipients и, если задан recipient_list, связующая таблица
+списка. Обе проиндексированы по (владелец, recipient_id), поэтому каждый
+источник читается по возрастанию pk получателя без сортировки.
+Аудитория — объединение источников без повторов: оно обходится слиянием
+упорядоченных порций pk и нигде не материализуется, так что рассылка
+на список любого размера не копирует его членство.
+"""
+import heapq
+
+from django.db.models import Q
+
+from .models import Mailing, RecipientList
+
+
+def audience_sources(mailing):
+    """Запросы pk получателей каждого источника по возрастанию."""
+    sources = [
+        Mailing.recipients.through.objects.filter(mailing_id=mailing.pk),
+    ]
+    if mailing.recipient_list_id:
+        sources.append(RecipientList.recipients.through.objects.filter(
+            recipientlist_id=mailing.recipient_list_id,
+        ))
+    return [
+        source.order_by('recipient_id').values_list('recipient_id', flat=True)
+        for source in sources
+    ]
+
+
+def merge_unique(portions, limit):
+    # В каждой порции — limit наименьших pk своего источника, поэтому
+    # limit наименьших pk объединения находятся среди них
+    ids = []
+    for pk in heapq.merge(*portions):
+        if not ids or ids[-1] != pk:
+            ids.append(pk)
+            if len(ids) == limit:
+                break
+    return ids
+
+
+def iter_audience_ids(mailing, batch_size, after=0, until=None):
+    """Выдает pk получателей рассылки из (after, until] списками
+    по batch_size, по возрастанию и без повторов."""
+    sources = audience_sources(mailing)
+    if until is not None:
+        sources = [source.filter(recipient_id__lte=until)
+                   for source in sources]
+    last_pk = after
+    while True:
+        portions = [
+            list(source.filter(recipient_id__gt=last_pk)[:batch_size])
+            for source in sources
+        ]
+        ids = (portions[0] if len(portions) == 1
+               else merge_unique(portions, batch_size))
+        if not ids:
+            return
+        last_pk = ids[-1]
+        yield ids
+
+
+def split_bounds(mailing, size):
+    """Границы диапазонов (start_after, last_pk) для деления задания.
+
+    Граница — наименьший из size-х по счету pk источников после начала
+    диапазона, поэтому в диапазоне от size до size * (число источников)
+    получателей; pk ищутся по индексу со смещением, без чтения
+    аудитории. Последний диапазон открыт сверху (last_pk = None).
+    """
+    sources = audience_sources(mailing)
+    bounds = []
+    start_after = 0
+    while ends := [
+        last[0] for source in sources
+        if (last := list(source.filter(recipient_id__gt=start_after)
+                         [size - 1:size]))
+    ]:
+        bounds.append([start_after, min(ends)])
+        start_after = min(ends)
+    if not bounds or any(source.filter(recipient_id__gt=start_after).exists()
+                         for source in sources):
+        bounds.append([start_after, None])
+    bounds[-1][1] = None
+    return bounds
+
+
+def audience_filter(mailing_id):
+    """Условие на Recipient: получатель входит в аудиторию рассылки."""
+    return (
+        Q(pk__in=Mailing.recipients.through.objects.filter(
+            mailing_id=mailing_id,
+        ).values('recipient_id'))
+        | Q(pk__in=RecipientList.recipients.through.objects.filter(
+            recipientlist__mailings=mailing_id,
+        ).values('recipient_id'))
+    )
+
+
+def add_to_list(recipient_list, recipient_ids, batch_size=1000):
+    """Добавляет получателей в список пачками; повторное добавление
+    игнорируется уникальным индексом."""
+    through = RecipientList.recipients.through
+    recipient_ids = list(recipient_ids)
+    for start in range(0, len(recipient_ids), batch_size):
+        through.objects.bulk_create(
+            [through(recipientlist_id=recipient_list.pk, recipient_id=pk)
+             for pk in recipient_ids[start:start + batch_size]],
+            ignore_conflicts=True,
+        )
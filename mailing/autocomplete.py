@@ -0,0 +1,150 @@
+"""Подбор получателей для формы рассылки без вывода всего списка.
+
+Форма рассылки не выводит всех получателей владельца в <select>:
+виджет показывает только уже выбранных, остальные подгружаются
+по мере ввода из recipient_autocomplete (поиск по началу email или
+Ф.И.О.). Поиск по префиксу выполняется диапазоном field >= q AND
+field < q + '\\U0010ffff' — в отличие от LIKE 'q%' такое условие идет
+по индексам (owner, email) и (owner, full_name) на любой СУБД.
+Сравнение в индексе чувствительно к регистру, поэтому ищутся
+несколько вариантов написания запроса.
+
+Выбранные получатели проверяются пачками по CHECK_BATCH_SIZE pk,
+чтобы не упираться в лимит параметров запроса SQLite.
+"""
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.urls import reverse_lazy
+
+from .models import Recipient
+
+
+SEARCH_FIELDS = ('email', 'full_name')
+# Верхняя граница диапазона: больше любого символа строки
+PREFIX_END = '\U0010ffff'
+CHECK_BATCH_SIZE = 500
+
+
+def prefix_variants(term):
+    """Варианты написания запроса: как введен, строчными и с заглавной
+    буквы (email обычно хранятся строчными, Ф.И.О. — с заглавной)."""
+    term = term.strip()
+    if not term:
+        return []
+    return list(dict.fromkeys([
+        term, term.lower(), term[:1].upper() + term[1:].lower(),
+    ]))
+
+
+def prefix_range(field, prefix):
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + PREFIX_END})
+
+
+def prefix_filter(term):
+    """Условие поиска по началу email или Ф.И.О. (для queryset, которые
+    дальше фильтруются и разбиваются на страницы, например в админке)."""
+    condition = Q()
+    for prefix in prefix_variants(term):
+        for field in SEARCH_FIELDS:
+            condition |= prefix_range(field, prefix)
+    return condition
+
+
+def search_recipients(queryset, term, limit=None):
+    """Первые limit получателей из queryset, у которых email или Ф.И.О.
+    начинается с term, по алфавиту email.
+
+    Каждый вариант запроса ищется отдельным запросом с LIMIT по своему
+    индексу, поэтому работа ограничена limit строками на вариант
+    независимо от числа получателей владельца.
+    """
+    limit = limit or settings.MAILING_AUTOCOMPLETE_LIMIT
+    found = {}
+    for prefix in prefix_variants(term):
+        for field in SEARCH_FIELDS:
+            matches = queryset.filter(
+                prefix_range(field, prefix)
+            ).order_by(field).only('pk', 'email', 'full_name')[:limit]
+            for recipient in matches:
+                found[recipient.pk] = recipient
+    return sorted(found.values(), key=lambda r: (r.email, r.pk))[:limit]
+
+
+def in_batches(queryset, pks):
+    """Выбирает из queryset объекты с данными pk пачками."""
+    pks = sorted(pks)
+    for start in range(0, len(pks), CHECK_BATCH_SIZE):
+        yield from queryset.filter(pk__in=pks[start:start + CHECK_BATCH_SIZE])
+
+
+class RecipientAutocompleteWidget(forms.SelectMultiple):
+    """<select multiple> только с выбранными получателями и поле поиска,
+    подгружающее остальных из recipient_autocomplete."""
+
+    template_name = 'mailing/widgets/recipient_autocomplete.html'
+
+    class Media:
+        js = ('mailing/recipient_autocomplete.js',)
+
+    def __init__(self, attrs=None,
+                 url=reverse_lazy('mailing:recipient_autocomplete')):
+        super().__init__(attrs)
+        self.url = url
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['autocomplete_url'] = str(self.url)
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        pks = {int(pk) for pk in value if str(pk).isdigit()}
+        queryset = self.choices.queryset.only('pk', 'email', 'full_name')
+        options = [
+            self.create_option(name, recipient.pk, str(recipient), True,
+                               index, attrs=attrs)
+            for index, recipient in enumerate(in_batches(queryset, pks))
+        ]
+        return [(None, options, 0)]
+
+
+class RecipientMultipleChoiceField(forms.ModelMultipleChoiceField):
+    """Проверяет выбранных получателей пачками запросов по pk и
+    возвращает список pk (его принимает recipients.set())."""
+
+    widget = RecipientAutocompleteWidget
+
+    def clean(self, value):
+        value = self.prepare_value(value)
+        if self.required and not value:
+            raise ValidationError(self.error_messages['required'],
+                                  code='required')
+        if not value:
+            return []
+        if not isinstance(value, (list, tuple)):
+            raise ValidationError(self.error_messages['invalid_list'],
+                                  code='invalid_list')
+        pks = set()
+        for pk in value:
+            self.validate_no_null_characters(pk)
+            try:
+                pks.add(int(pk))
+            except (ValueError, TypeError):
+                raise ValidationError(
+                    self.error_messages['invalid_pk_value'],
+                    code='invalid_pk_value', params={'pk': pk},
+                )
+        found = set(in_batches(self.queryset.values_list('pk', flat=True),
+                               pks))
+        if missing := pks - found:
+            raise ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice', params={'value': min(missing)},
+            )
+        self.run_validators(value)
+        return sorted(found)
+
+    def has_changed(self, initial, data):
+        initial = {str(pk) for pk in self.prepare_value(initial or [])}
+        return initial != {str(pk) for pk in data or []}
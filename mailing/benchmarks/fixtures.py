@@ -0,0 +1,96 @@
+"""Временная база и синтетические данные для команд замеров.
+
+Замеры создают пользователей, сотни тысяч получателей, рассылки, попытки
+и записи стоп-листа. Чтобы рабочие данные не менялись (и, например,
+доставка не увидела адреса замера в стоп-листе), команды работают
+во временной базе: benchmark_database() создает ее миграциями, как
+тестовую, и удаляет по выходу, даже если замер прерван. На это же время
+кеш заменяется локальным, чтобы роли и версии страниц пользователей
+временной базы не попали в общий Redis, а метрики пишутся во временный
+каталог.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import override_settings
+
+from mailing.models import Mailing, MailingAttempt, Message, Recipient
+
+
+BENCH_OWNER_EMAIL = 'bench@example.com'
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+@contextmanager
+def benchmark_database(alias=DEFAULT_DB_ALIAS):
+    connection = connections[alias]
+    test_settings = connection.settings_dict['TEST']
+    old_test_name = test_settings['NAME']
+    old_name = connection.settings_dict['NAME']
+    with tempfile.TemporaryDirectory(prefix='mailing-bench-') as directory:
+        if connection.vendor == 'sqlite':
+            # Файл, а не база в памяти: замеры запускают дочерние
+            # процессы, и они должны видеть ту же базу
+            test_settings['NAME'] = os.path.join(directory, 'bench.sqlite3')
+        try:
+            with override_settings(
+                CACHES=LOCMEM_CACHES,
+                MAILING_METRICS_DIR=os.path.join(directory, 'metrics'),
+            ):
+                connection.creation.create_test_db(
+                    verbosity=0, autoclobber=True, serialize=False,
+                )
+                try:
+                    yield
+                finally:
+                    connection.creation.destroy_test_db(old_name, verbosity=0)
+        finally:
+            test_settings['NAME'] = old_test_name
+
+
+def create_mailing(size, domains=('example.com',), batch_size=1000):
+    """Рассылка владельца BENCH_OWNER_EMAIL на size получателей,
+    распределенных по domains по кругу."""
+    owner = get_user_model().objects.create_user(
+        email=BENCH_OWNER_EMAIL, username='bench',
+    )
+    message = Message.objects.create(
+        subject='Benchmark {{ full_name }}',
+        body='Здравствуйте, {{ full_name }}!\nОтписка: {{ unsubscribe_url }}',
+        owner=owner,
+    )
+    mailing = Mailing.objects.create(message=message, owner=owner)
+    through = Mailing.recipients.through
+    for start in range(0, size, batch_size):
+        recipients = Recipient.objects.bulk_create(
+            Recipient(email=f'bench{i}@{domains[i % len(domains)]}',
+                      full_name=f'Получатель {i}', owner=owner)
+            for i in range(start, min(start + batch_size, size))
+        )
+        through.objects.bulk_create(
+            through(mailing_id=mailing.pk, recipient_id=recipient.pk)
+            for recipient in recipients
+        )
+    return mailing
+
+
+def delete_bench_data(batch_size=500):
+    """Удаляет данные замера пачками: каскад на сотни тысяч строк одним
+    запросом упирается в лимит параметров SQLite."""
+    owner = get_user_model().objects.filter(email=BENCH_OWNER_EMAIL).first()
+    if owner is None:
+        return
+    MailingAttempt.objects.filter(mailing__owner=owner).delete()
+    Mailing.objects.filter(owner=owner).delete()
+    recipients = Recipient.objects.filter(owner=owner)
+    while ids := list(recipients.values_list('pk', flat=True)[:batch_size]):
+        Recipient.objects.filter(pk__in=ids).delete()
+    owner.delete()
@@ -0,0 +1,144 @@
+"""Локальный SMTP-приемник для замеров скорости доставки.
+
+Принимает письма по минимальному подмножеству SMTP и ничего никуда
+не пересылает. Запускается в отдельном потоке текущего процесса.
+Умеет замедлять ответы, отклонять заданную долю писем и, как настоящий
+релей, отвечать троттлингом при превышении допустимой скорости.
+"""
+import random
+import socketserver
+import threading
+import time
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode('ascii'))
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply('220 localhost ESMTP sink')
+        started = time.perf_counter()
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            verb = line.decode('ascii', 'replace').strip().split(' ', 1)[0].upper()
+            if verb == 'EHLO':
+                self.reply('250-localhost')
+                self.reply('250 8BITMIME')
+            elif verb == 'HELO':
+                self.reply('250 localhost')
+            elif verb == 'MAIL':
+                started = time.perf_counter()
+                self.reply('250 OK')
+            elif verb in ('RCPT', 'RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                if server.latency:
+                    time.sleep(server.latency)
+                with server.lock:
+                    throttled = not server.take_token()
+                    rejected = (not throttled and
+                                server.random.random() < server.error_rate)
+                    if throttled:
+                        server.throttled += 1
+                    elif rejected:
+                        server.rejected += 1
+                    else:
+                        server.messages += 1
+                if throttled:
+                    self.reply(f'{server.throttle_code} Rate limit exceeded, '
+                               f'try again later')
+                elif rejected:
+                    self.reply(f'{server.error_code} Injected failure')
+                else:
+                    self.reply('250 OK queued')
+                server.record(time.perf_counter() - started)
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                break
+            else:
+                self.reply('502 Command not implemented')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """SMTP-сервер на 127.0.0.1, считающий принятые письма и соединения.
+
+    latency — искусственная задержка ответа на DATA в секундах;
+    error_rate — доля писем, отклоняемых кодом error_code (выбор
+    воспроизводим при одинаковом seed); max_rate — сколько писем в секунду
+    приемник принимает, сверх этого отвечает кодом throttle_code
+    (в среднем за секунду). В transaction_times копится
+    длительность каждой SMTP-транзакции (от MAIL до ответа на DATA).
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+    def __init__(self, port=0, latency=0.0, error_rate=0.0, error_code=554,
+                 seed=0, max_rate=None, throttle_code=451):
+        super().__init__(('127.0.0.1', port), SMTPSinkHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.seed = seed
+        self.max_rate = max_rate
+        self.throttle_code = throttle_code
+        self.lock = threading.Lock()
+        self.thread = None
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.random = random.Random(self.seed)
+            self.messages = 0
+            self.rejected = 0
+            self.throttled = 0
+            self.tokens = self.max_rate or 0
+            self.refilled_at = time.monotonic()
+            self.connections = 0
+            self.transaction_times = []
+
+    def take_token(self):
+        """Вызывается под self.lock; True, если письмо укладывается
+        в max_rate."""
+        if not self.max_rate:
+            return True
+        now = time.monotonic()
+        self.tokens = min(self.max_rate, self.tokens
+                          + (now - self.refilled_at) * self.max_rate)
+        self.refilled_at = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def handle_error(self, request, client_address):
+        # Клиент, убитый посреди сессии, — обычная ситуация для замеров
+        # возобновления после сбоя
+        pass
+
+    def record(self, duration):
+        with self.lock:
+            self.transaction_times.append(duration)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,288 @@
+"""Сценарии замера скорости доставки для команды bench_suite.
+
+Команда bench_suite работает во временной базе (fixtures.py), в ней
+каждый сценарий выполняется в отдельном дочернем процессе (fork), чтобы
+пик памяти одного прогона не влиял на другой, а SMTP-приемник работает
+в родительском процессе и не делит с отправителем GIL. Задержки писем
+и время записи в БД собираются через сигналы message_sent
+и attempts_written.
+"""
+import io
+import multiprocessing
+import queue
+import re
+import resource
+import statistics
+import tempfile
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+import aiosmtplib
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.db import connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from mailing.async_delivery import deliver_mailing_async
+from mailing.benchmarks.fixtures import create_mailing, delete_bench_data
+from mailing.delivery import deliver_mailing
+from mailing.jobs import claim_job, enqueue_mailing, run_worker
+from mailing.models import Mailing, MailingAttempt
+from mailing.signals import attempts_written, message_sent
+
+
+class Recorder:
+    """Копит длительности писем и записей попыток из всех потоков."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.db_write_time = 0.0
+        self.db_batches = 0
+
+    def on_message_sent(self, sender, status, duration, **kwargs):
+        with self.lock:
+            self.latencies.append(duration)
+
+    def on_attempts_written(self, sender, count, duration, **kwargs):
+        with self.lock:
+            self.db_write_time += duration
+            self.db_batches += 1
+
+    def __enter__(self):
+        message_sent.connect(self.on_message_sent)
+        attempts_written.connect(self.on_attempts_written)
+        return self
+
+    def __exit__(self, *exc_info):
+        message_sent.disconnect(self.on_message_sent)
+        attempts_written.disconnect(self.on_attempts_written)
+
+
+def reset_peak_rss():
+    """Сбрасывает пик RSS процесса (Linux); иначе пик считается
+    с начала процесса."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_mib():
+    try:
+        with open('/proc/self/status') as status:
+            match = re.search(r'VmHWM:\s+(\d+) kB', status.read())
+        return int(match.group(1)) / 1024
+    except (OSError, AttributeError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values, fraction):
+    if len(values) < 2:
+        return values[0] if values else None
+    return statistics.quantiles(values, n=100)[round(fraction * 100) - 1]
+
+
+def route_domains(routes):
+    """Домены получателей сценария routes: домен маршрута по умолчанию
+    и по одному на каждый маршрут."""
+    return ['example.com',
+            *(f'route{index}.example.com' for index in range(routes))]
+
+
+def smtp_settings(port):
+    return override_settings(
+        EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+        EMAIL_HOST='127.0.0.1',
+        EMAIL_PORT=port,
+        EMAIL_HOST_USER='',
+        EMAIL_HOST_PASSWORD='',
+        EMAIL_USE_TLS=False,
+        DEFAULT_FROM_EMAIL='bench@example.com',
+        ALLOWED_HOSTS=['testserver'],
+    )
+
+
+def run_batched(mailing, params):
+    deliver_mailing(mailing, batch_size=params['batch_size'], workers=1,
+                    engine='sync')
+
+
+def run_threaded(mailing, params):
+    deliver_mailing(mailing, batch_size=params['batch_size'],
+                    workers=params['workers'], engine='sync')
+
+
+def run_asyncio(mailing, params):
+    port = params['port']
+    async_to_sync(deliver_mailing_async)(
+        mailing,
+        params['batch_size'],
+        concurrency=params['concurrency'],
+        smtp_factory=lambda: aiosmtplib.SMTP(
+            hostname='127.0.0.1', port=port, start_tls=False,
+        ),
+    )
+
+
+def run_send_mailing(mailing, params):
+    """Кнопка «Отправить»: POST в send_mailing и воркер очереди."""
+    client = Client()
+    client.force_login(mailing.owner)
+    client.post(reverse('mailing:send_mailing', args=[mailing.pk]))
+    run_worker('bench-suite', threading.Event(), once=True,
+               connections=params['workers'])
+
+
+def run_scheduled(mailing, params):
+    """Плановый запуск: команда send_mailings --once и воркер очереди."""
+    Mailing.objects.filter(pk=mailing.pk).update(
+        start_time=timezone.now() - timedelta(seconds=1),
+    )
+    call_command('send_mailings', once=True, stdout=io.StringIO())
+    run_worker('bench-suite', threading.Event(), once=True,
+               connections=params['workers'])
+
+
+def run_routes(mailing, params):
+    """Маршруты по доменам: получатели поровну распределены между доменом
+    по умолчанию и доменами маршрутов, у каждого маршрута свой приемник."""
+    routes = {
+        f'route{index}': {
+            'domains': [f'route{index}.example.com'],
+            'host': '127.0.0.1',
+            'port': port,
+        }
+        for index, port in enumerate(params['route_ports'])
+    }
+    with override_settings(MAILING_ROUTES=routes):
+        deliver_mailing(mailing, batch_size=params['batch_size'],
+                        workers=params['workers'], engine=params['engine'])
+
+
+def node_main(index, params):
+    try:
+        run_worker(f'bench-suite:node{index}', threading.Event(), once=True,
+                   connections=params['workers'])
+    finally:
+        connections.close_all()
+
+
+def run_nodes(mailing, params):
+    """Несколько узлов: задание делится на диапазоны, каждый процесс
+    забирает их в аренду. Задержки и запись в БД считаются в процессах
+    узлов и в результат не попадают."""
+    enqueue_mailing(mailing)
+    claim_job('bench-suite:split')
+    connections.close_all()
+    context = multiprocessing.get_context('fork')
+    nodes = [context.Process(target=node_main, args=(index, params))
+             for index in range(params['nodes'])]
+    for node in nodes:
+        node.start()
+    for node in nodes:
+        node.join()
+
+
+# Новый движок доставки добавляется сюда одной функцией
+SCENARIOS = {
+    'batched': run_batched,
+    'threaded': run_threaded,
+    'asyncio': run_asyncio,
+    'send_mailing': run_send_mailing,
+    'scheduled': run_scheduled,
+    'nodes': run_nodes,
+    'routes': run_routes,
+}
+
+
+def measure(scenario, size, params):
+    """Выполняется в дочернем процессе: готовит данные, замеряет
+    сценарий и возвращает словарь с результатами."""
+    delete_bench_data()
+    domains = ('example.com',)
+    if scenario == 'routes':
+        domains = route_domains(len(params['route_ports']))
+    mailing = create_mailing(size, domains)
+    try:
+        # Ограничитель каждого прогона начинает со стартовой скорости,
+        # а не с выученной предыдущим прогоном
+        with smtp_settings(params['port']), \
+                tempfile.TemporaryDirectory() as rate_limit_dir, \
+                override_settings(
+                    MAILING_DELIVERY_ENGINE=params['engine'],
+                    MAILING_RATE_LIMIT=params['rate_limit'],
+                    MAILING_RATE_LIMIT_DIR=rate_limit_dir,
+                    MAILING_CHUNK_SIZE=params['chunk_size'],
+                ), \
+                Recorder() as recorder:
+            reset_peak_rss()
+            started = time.perf_counter()
+            SCENARIOS[scenario](mailing, params)
+            elapsed = time.perf_counter() - started
+            rss = peak_rss_mib()
+        attempts = MailingAttempt.objects.filter(mailing=mailing)
+        sent = attempts.filter(status=MailingAttempt.STATUS_SUCCESS).count()
+        failed = attempts.filter(status=MailingAttempt.STATUS_FAILED).count()
+        deferred = attempts.filter(
+            status=MailingAttempt.STATUS_DEFERRED,
+        ).count()
+    finally:
+        delete_bench_data()
+
+    latencies = recorder.latencies
+    return {
+        'scenario': scenario,
+        'recipients': size,
+        'sent': sent,
+        'failed': failed,
+        'deferred': deferred,
+        'elapsed_s': round(elapsed, 3),
+        'messages_per_s': round((sent + failed + deferred) / elapsed, 1),
+        'latency_p50_ms': round(percentile(latencies, 0.5) * 1000, 3)
+        if latencies else None,
+        'latency_p99_ms': round(percentile(latencies, 0.99) * 1000, 3)
+        if latencies else None,
+        'db_write_s': round(recorder.db_write_time, 3),
+        'db_write_batches': recorder.db_batches,
+        'peak_rss_mib': round(rss, 1),
+    }
+
+
+def child_main(results, scenario, size, params):
+    try:
+        results.put(measure(scenario, size, params))
+    except Exception:
+        results.put({'scenario': scenario, 'recipients': size,
+                     'error': traceback.format_exc()})
+    finally:
+        connections.close_all()
+
+
+def run_isolated(scenario, size, params):
+    """Запускает сценарий в дочернем процессе и ждет результата."""
+    # Соединения с БД не должны наследоваться дочерним процессом
+    connections.close_all()
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    process = context.Process(target=child_main,
+                              args=(results, scenario, size, params))
+    process.start()
+    while True:
+        try:
+            result = results.get(timeout=1)
+            break
+        except queue.Empty:
+            if not process.is_alive():
+                result = {'scenario': scenario, 'recipients': size,
+                          'error': f'Процесс замера завершился с кодом '
+                                   f'{process.exitcode}'}
+                break
+    process.join()
+    return result
@@ -0,0 +1,135 @@
+"""Кеш страниц списков и карточек в разрезе владельца.
+
+У каждого владельца есть версия данных — время последнего изменения его
+рассылок, сообщений, получателей или статистики, у менеджеров — общая
+версия всех данных. Версия входит в ключи кеша и в ETag, поэтому при
+изменении достаточно записать новую версию: старые ключи перестают
+читаться и истекают сами, массовых удалений нет. Версии обновляются
+сигналами из mailing.signals и явно там, где данные меняются
+через queryset.update() и bulk_create.
+"""
+import hashlib
+import logging
+import time
+from functools import partial
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import transaction
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from .roles import get_role
+
+
+logger = logging.getLogger(__name__)
+
+SCOPE_ALL = 'all'
+
+
+def version_key(scope):
+    return f'mailing:data-version:{scope}'
+
+
+def bump_versions(owner_ids):
+    now = time.time()
+    versions = {version_key(owner_id): now for owner_id in owner_ids}
+    versions[version_key(SCOPE_ALL)] = now
+    try:
+        cache.set_many(versions, timeout=None)
+    except Exception as e:
+        logger.warning(f"Не удалось обновить версию кеша страниц: {e}")
+
+
+def invalidate_owners(owner_ids):
+    """Отмечает изменение данных владельцев после фиксации транзакции,
+    чтобы параллельный запрос не закешировал старые данные под новой
+    версией."""
+    transaction.on_commit(partial(bump_versions, set(owner_ids)))
+
+
+def get_version(scope):
+    """Версия данных области видимости; None, если кеш недоступен."""
+    key = version_key(scope)
+    version = time.time()
+    try:
+        # Версия еще не создана или вытеснена: начинаем новую
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key)
+    except Exception as e:
+        logger.warning(f"Кеш страниц недоступен: {e}")
+        return None
+    return version
+
+
+class CachedPageMixin:
+    """Условные ответы (ETag, 304) и кеш данных страницы по версии данных
+    пользователя. Ставится после LoginRequiredMixin.
+
+    Last-Modified не отдается: у него точность в секунду, и после двух
+    изменений за одну секунду клиент с одним If-Modified-Since получил бы
+    304 на устаревшую страницу."""
+
+    def get_data_version(self):
+        if not hasattr(self, '_data_version'):
+            role = get_role(self.request.user)
+            self._data_version = get_version(
+                SCOPE_ALL if role.is_manager else role.user_id
+            )
+        return self._data_version
+
+    def get_etag(self):
+        # В разметке есть данные самого пользователя и CSRF-токен формы,
+        # поэтому ETag различается у менеджеров с общей версией и меняется
+        # при смене CSRF-секрета (например, после входа). get_token создает
+        # секрет при первом заходе, иначе ETag первого ответа не совпал бы
+        # со следующим
+        version = self.get_data_version()
+        get_token(self.request)
+        csrf_secret = self.request.META['CSRF_COOKIE']
+        digest = hashlib.md5(
+            f'{self.request.user.pk}:{csrf_secret}:{version!r}'.encode()
+        ).hexdigest()
+        return f'"{digest}"'
+
+    def cached(self, name, compute):
+        """Возвращает значение из кеша по ключу версии и адреса страницы
+        или вычисляет и сохраняет его."""
+        version = self.get_data_version()
+        if version is None:
+            return compute()
+        role = get_role(self.request.user)
+        scope = SCOPE_ALL if role.is_manager else role.user_id
+        path = hashlib.md5(self.request.get_full_path().encode()).hexdigest()
+        key = f'mailing:page:{scope}:{version!r}:{name}:{path}'
+        try:
+            value = cache.get(key)
+        except Exception:
+            return compute()
+        if value is None:
+            value = compute()
+            try:
+                cache.set(key, value, settings.MAILING_PAGE_CACHE_TIMEOUT)
+            except Exception:
+                pass
+        return value
+
+    def dispatch(self, request, *args, **kwargs):
+        # Непрочитанные сообщения показываются только в свежем ответе
+        if (request.method not in ('GET', 'HEAD')
+                or self.get_data_version() is None
+                or len(get_messages(request))):
+            return super().dispatch(request, *args, **kwargs)
+
+        etag = self.get_etag()
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            return response
+
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == 200:
+            response.headers.setdefault('ETag', etag)
+            # Ответ личный: браузер хранит его, но каждый раз сверяет ETag
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
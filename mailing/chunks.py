@@ -0,0 +1,157 @@
+"""Диапазоны получателей заданий и их аренда воркерами разных узлов.
+
+Задание делится на диапазоны примерно по MAILING_CHUNK_SIZE получателей
+(границы берутся по индексам связующих таблиц, mailing/audience.py).
+Воркер забирает диапазон в аренду на MAILING_CHUNK_LEASE секунд: через
+SELECT ... FOR UPDATE SKIP LOCKED там, где СУБД это умеет, и через
+условный UPDATE на SQLite. Пока диапазон отправляется, поток Heartbeat
+продлевает аренду; если воркер умер, аренда истекает, и диапазон
+забирает другой воркер — с сохраненного курсора (mailing/progress.py).
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .audience import split_bounds
+from .models import Mailing, MailingChunk
+
+
+logger = logging.getLogger(__name__)
+
+# Сколько кандидатов просматривать при захвате диапазона без SKIP LOCKED
+CLAIM_CANDIDATES = 10
+
+
+def lease_until():
+    return timezone.now() + timedelta(seconds=settings.MAILING_CHUNK_LEASE)
+
+
+def split_job(job, chunk_size=None):
+    """Создает диапазоны задания. Вызывается в транзакции захвата
+    задания. Возвращает количество диапазонов."""
+    chunk_size = chunk_size or settings.MAILING_CHUNK_SIZE
+    mailing = Mailing.objects.only('recipient_list').get(pk=job.mailing_id)
+    # Последний диапазон открыт сверху: в него попадут и получатели,
+    # добавленные в рассылку или ее список после деления
+    bounds = split_bounds(mailing, chunk_size)
+    MailingChunk.objects.bulk_create(
+        MailingChunk(job=job, mailing_id=job.mailing_id,
+                     start_after=after, last_pk=last_pk,
+                     cursor=after, high_water=after)
+        for after, last_pk in bounds
+    )
+    return len(bounds)
+
+
+def claimable():
+    return MailingChunk.objects.filter(
+        Q(status=MailingChunk.STATUS_PENDING)
+        | Q(status=MailingChunk.STATUS_RUNNING,
+            lease_until__lt=timezone.now())
+    )
+
+
+def claim_chunk(worker_id):
+    """Забирает в аренду диапазон из очереди (или с истекшей арендой)."""
+    candidates = claimable().order_by('job_id', 'start_after')
+    changes = {
+        'status': MailingChunk.STATUS_RUNNING,
+        'claimed_by': worker_id,
+        'lease_until': lease_until(),
+        'heartbeat_at': timezone.now(),
+    }
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            chunk = candidates.select_for_update(skip_locked=True).first()
+            if chunk is None:
+                return None
+            previous = chunk.claimed_by
+            for field, value in changes.items():
+                setattr(chunk, field, value)
+            chunk.save(update_fields=list(changes))
+    else:
+        ids = candidates.values_list('pk', flat=True)[:CLAIM_CANDIDATES]
+        for chunk_id in ids:
+            previous = (MailingChunk.objects.filter(pk=chunk_id)
+                        .values_list('claimed_by', flat=True).first())
+            # Условие аренды проверяется заново в самом UPDATE
+            if claimable().filter(pk=chunk_id).update(**changes):
+                chunk = MailingChunk.objects.get(pk=chunk_id)
+                break
+        else:
+            return None
+
+    if previous and previous != worker_id:
+        logger.warning(f"Диапазон #{chunk.pk} задания {chunk.job_id}: аренда "
+                       f"воркера {previous} истекла, продолжает {worker_id}")
+    return chunk
+
+
+def release_chunk(chunk, worker_id):
+    """Возвращает диапазон в очередь (остановка воркера)."""
+    MailingChunk.objects.filter(pk=chunk.pk, claimed_by=worker_id).update(
+        status=MailingChunk.STATUS_PENDING, claimed_by='', lease_until=None,
+    )
+
+
+def finish_chunk(chunk, worker_id, error=None):
+    return MailingChunk.objects.filter(
+        pk=chunk.pk, claimed_by=worker_id,
+    ).update(
+        status=(MailingChunk.STATUS_FAILED if error is not None
+                else MailingChunk.STATUS_DONE),
+        error='' if error is None else str(error),
+        finished_at=timezone.now(),
+        lease_until=None,
+    )
+
+
+class Heartbeat:
+    """Фоновый поток, продлевающий аренду диапазона. Если аренду
+    перехватил другой воркер, выставляет lost."""
+
+    def __init__(self, chunk, worker_id, interval=None):
+        self.chunk = chunk
+        self.worker_id = worker_id
+        self.interval = interval or settings.MAILING_CHUNK_LEASE / 3
+        self.lost = threading.Event()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def beat(self):
+        return MailingChunk.objects.filter(
+            pk=self.chunk.pk, claimed_by=self.worker_id,
+            status=MailingChunk.STATUS_RUNNING,
+        ).update(lease_until=lease_until(), heartbeat_at=timezone.now())
+
+    def run(self):
+        try:
+            while not self.done.wait(self.interval):
+                try:
+                    renewed = self.beat()
+                except Exception as e:
+                    # Аренда еще действует, попробуем на следующем такте
+                    logger.warning(f"Не удалось продлить аренду диапазона "
+                                   f"#{self.chunk.pk}: {e}")
+                    continue
+                if not renewed:
+                    logger.error(f"Аренда диапазона #{self.chunk.pk} "
+                                 f"перехвачена другим воркером")
+                    self.lost.set()
+                    return
+        finally:
+            connection.close()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.done.set()
+        self.thread.join()
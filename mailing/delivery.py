@@ -0,0 +1,454 @@
+"""Пакетная доставка рассылок.
+
+Письма уходят через заранее открытые SMTP-соединения (`send_messages`
+бэкенда), а попытки записываются пачками через bulk_create.
+
+Последовательный режим использует одно соединение. Многопоточный режим
+открывает N независимых соединений: каждое обслуживает свой шард пачек
+получателей, а все попытки сохраняет единственный поток записи.
+
+Если заданы маршруты по доменам (MAILING_ROUTES, mailing/routing.py),
+у каждого маршрута свой набор соединений к своему релею, и каждая пачка
+делится между ними по домену получателя. Соединение маршрута
+открывается, только когда ему достается первая группа получателей.
+"""
+import logging
+import queue
+import smtplib
+import threading
+import time
+from dataclasses import dataclass
+from itertools import chain, islice
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection as db_connection
+
+from .audience import iter_audience_ids
+from .models import MailingAttempt, MailingRetry, Recipient, Suppression
+from .personalization import get_compiled
+from .profiling import (
+    PHASE_BUILD, PHASE_CONNECT, PHASE_DATA, PHASE_FETCH, PHASE_THROTTLE,
+    PHASE_WRITE,
+)
+from .rate_limit import closes_session, get_limiter, is_throttled
+from .retries import classify, next_attempt_at, schedule_retries
+from .routing import get_router
+from .signals import delivery_phase, message_sent
+from .stats import write_attempts
+from .suppression import exclude_suppressed, normalize, suppress
+
+
+logger = logging.getLogger(__name__)
+
+ENGINE_SYNC = 'sync'
+ENGINE_ASYNCIO = 'asyncio'
+
+
+@dataclass
+class DeliveryResult:
+    success: int = 0
+    failed: int = 0
+    deferred: int = 0
+
+
+def chunked(iterable, size):
+    """Разбивает итерируемый объект на списки длиной не более size."""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def iter_recipient_batches(mailing, batch_size, after=0, until=None):
+    """Выдает получателей рассылки с pk в (after, until] пачками
+    по первичному ключу.
+
+    Каждая пачка — отдельный завершенный запрос (keyset по pk), поэтому
+    курсор чтения не держится открытым на время всей рассылки и не мешает
+    параллельной записи попыток в SQLite.
+
+    Ключи берутся из связующих таблиц рассылки и ее списка по их
+    индексам (mailing/audience.py): сортировка по pk получателя через JOIN
+    заставляла СУБД читать и сортировать весь остаток рассылки ради
+    каждой пачки. Адреса из стоп-листа отсеиваются в памяти
+    (mailing/suppression.py).
+    """
+    recipients = (
+        Recipient.objects.filter(unsubscribed_at__isnull=True)
+        .only('id', 'email', 'full_name').order_by('pk')
+    )
+    for ids in iter_audience_ids(mailing, batch_size, after, until):
+        if batch := exclude_suppressed(list(recipients.filter(pk__in=ids)),
+                                       mailing.owner_id):
+            yield batch
+
+
+def iter_retry_batches(retries, batch_size):
+    """Выдает пачками получателей из очереди повторов
+    (retries — {recipient_id: выполнено повторов})."""
+    recipients = (
+        Recipient.objects.filter(unsubscribed_at__isnull=True)
+        .only('id', 'email', 'full_name').order_by('pk')
+    )
+    for ids in chunked(sorted(retries), batch_size):
+        if batch := list(recipients.filter(pk__in=ids)):
+            yield batch
+
+
+def timed_batches(batches):
+    """Передает пачки дальше, отмечая время чтения каждой (фаза fetch)."""
+    iterator = iter(batches)
+    while True:
+        started = time.perf_counter()
+        batch = next(iterator, None)
+        delivery_phase.send(sender=PHASE_FETCH,
+                            duration=time.perf_counter() - started)
+        if batch is None:
+            return
+        yield batch
+
+
+def recipient_batches(mailing, batch_size, retries=None, progress=None):
+    if retries is not None:
+        batches = iter_retry_batches(retries, batch_size)
+    elif progress is not None:
+        batches = progress.batches(mailing, batch_size,
+                                   iter_recipient_batches)
+    else:
+        batches = iter_recipient_batches(mailing, batch_size)
+    return timed_batches(batches)
+
+
+class AttemptWriter:
+    """Копит попытки рассылки в памяти и сохраняет их одним INSERT
+    вместе с обновлением счетчиков статистики.
+
+    Временные ошибки SMTP записываются как deferred, а получатель
+    попадает в очередь повторов, пока не исчерпан MAILING_RETRY_ATTEMPTS.
+    Адрес с жестким отказом (MAILING_SUPPRESS_CODES) заносится
+    в стоп-лист.
+    retries — {recipient_id: выполнено повторов} при разборе очереди;
+    progress — DeliveryProgress задания, сохраняется вместе с попытками.
+    """
+
+    def __init__(self, mailing, retries=None, progress=None):
+        self.mailing = mailing
+        self.retries = retries or {}
+        self.progress = progress
+        self.pending = []
+        self.deferred = []
+        self.resolved = []
+        self.bounced = []
+        self.result = DeliveryResult()
+
+    def add(self, recipient, status, server_response, error=None):
+        smtp_code = None
+        if error is not None:
+            smtp_code, transient = classify(error)
+            retries = self.retries.get(recipient.pk, 0)
+            if transient and retries < settings.MAILING_RETRY_ATTEMPTS:
+                status = MailingAttempt.STATUS_DEFERRED
+                self.deferred.append(MailingRetry(
+                    mailing=self.mailing,
+                    recipient_id=recipient.pk,
+                    retries=retries + 1,
+                    next_attempt_at=next_attempt_at(retries),
+                    smtp_code=smtp_code,
+                    last_error=server_response,
+                ))
+            elif smtp_code in settings.MAILING_SUPPRESS_CODES:
+                self.bounced.append(Suppression(
+                    email=normalize(recipient.email),
+                    reason=Suppression.REASON_BOUNCE,
+                ))
+        if (status != MailingAttempt.STATUS_DEFERRED
+                and recipient.pk in self.retries):
+            self.resolved.append(recipient.pk)
+        self.pending.append(MailingAttempt(
+            mailing=self.mailing,
+            recipient_id=recipient.pk,
+            status=status,
+            server_response=server_response,
+            smtp_code=smtp_code,
+        ))
+        if status == MailingAttempt.STATUS_SUCCESS:
+            self.result.success += 1
+        elif status == MailingAttempt.STATUS_DEFERRED:
+            self.result.deferred += 1
+        else:
+            self.result.failed += 1
+
+    def flush(self):
+        if not self.pending:
+            return
+        # Попытки, очередь повторов и прогресс меняются вместе: после
+        # сбоя получатель не окажется ни потерян, ни отправлен дважды
+        also = None
+        if (self.deferred or self.resolved or self.bounced
+                or self.progress is not None):
+            also = self.save_state
+        started = time.perf_counter()
+        write_attempts(self.mailing, self.pending, also)
+        delivery_phase.send(sender=PHASE_WRITE,
+                            duration=time.perf_counter() - started)
+        self.pending = []
+        self.deferred = []
+        self.resolved = []
+        self.bounced = []
+
+    def save_state(self):
+        if self.deferred or self.resolved:
+            schedule_retries(self.mailing, self.deferred, self.resolved)
+        if self.bounced:
+            suppress(self.bounced)
+        if self.progress is not None:
+            self.progress.save(self.pending)
+
+
+class QueueWriter:
+    """Передает результаты из потока-отправителя в поток записи."""
+
+    def __init__(self, results):
+        self.results = results
+
+    def add(self, recipient, status, server_response, error=None):
+        self.results.put((recipient, status, server_response, error))
+
+    def flush(self):
+        pass
+
+
+def build_email(message, recipient, connection):
+    """Собирает письмо получателю; message — CompiledMessage."""
+    context = message.context(recipient)
+    subject, body = message.render(context)
+    return EmailMessage(
+        subject=subject,
+        body=body,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[recipient.email],
+        connection=connection,
+        headers={
+            # Отписка в один клик из почтового клиента (RFC 8058)
+            'List-Unsubscribe': f'<{context["unsubscribe_url"]}>',
+            'List-Unsubscribe-Post': 'List-Unsubscribe=One-Click',
+        },
+    )
+
+
+def open_connection(connection):
+    started = time.perf_counter()
+    try:
+        connection.open()
+    finally:
+        delivery_phase.send(sender=PHASE_CONNECT,
+                            duration=time.perf_counter() - started)
+
+
+def reopen(connection):
+    connection.close()
+    try:
+        open_connection(connection)
+    except Exception as e:
+        logger.warning(f"Не удалось переподключиться к SMTP-серверу: {e}")
+
+
+def connection_limiter(connection):
+    """Ограничитель скорости релея, к которому подключен бэкенд."""
+    return get_limiter(getattr(connection, 'host', None),
+                       getattr(connection, 'port', None),
+                       getattr(connection, 'username', None))
+
+
+def send_chunk(connection, message, recipients, writer, limiter=None):
+    """Отправляет пачку писем через уже открытое соединение."""
+    for recipient in recipients:
+        started = time.perf_counter()
+        email = build_email(message, recipient, connection)
+        delivery_phase.send(sender=PHASE_BUILD,
+                            duration=time.perf_counter() - started)
+        if limiter is not None:
+            started = time.perf_counter()
+            limiter.acquire()
+            delivery_phase.send(sender=PHASE_THROTTLE,
+                                duration=time.perf_counter() - started)
+        started = time.perf_counter()
+        try:
+            if not connection.send_messages([email]):
+                raise smtplib.SMTPException('Письмо не было принято сервером')
+        except Exception as e:
+            duration = time.perf_counter() - started
+            delivery_phase.send(sender=PHASE_DATA, duration=duration)
+            message_sent.send(
+                sender=ENGINE_SYNC,
+                status=MailingAttempt.STATUS_FAILED,
+                duration=duration,
+            )
+            writer.add(recipient, MailingAttempt.STATUS_FAILED, str(e), e)
+            logger.error(
+                f"Ошибка отправки письма "
+                f"получателю {recipient.email}: {e}",
+                exc_info=True,
+            )
+            if limiter is not None and is_throttled(e):
+                limiter.on_throttle()
+            if closes_session(e):
+                # Сервер закрыл сессию — переоткрываем, иначе бэкенд
+                # начнет создавать новое соединение на каждое письмо
+                reopen(connection)
+        else:
+            duration = time.perf_counter() - started
+            delivery_phase.send(sender=PHASE_DATA, duration=duration)
+            if limiter is not None:
+                limiter.on_success()
+            message_sent.send(
+                sender=ENGINE_SYNC,
+                status=MailingAttempt.STATUS_SUCCESS,
+                duration=duration,
+            )
+            writer.add(recipient, MailingAttempt.STATUS_SUCCESS,
+                       'Отправлено успешно')
+
+
+def fail_chunks(chunks, writer, error):
+    for chunk in chunks:
+        for recipient in chunk:
+            writer.add(recipient, MailingAttempt.STATUS_FAILED, str(error),
+                       error)
+        writer.flush()
+
+
+def send_chunks(connection, message, chunks, writer):
+    """Открывает соединение один раз и отправляет через него все пачки."""
+    try:
+        open_connection(connection)
+    except Exception as e:
+        logger.error(f"Не удалось подключиться к SMTP-серверу: {e}",
+                     exc_info=True)
+        fail_chunks(chunks, writer, e)
+        return
+
+    limiter = connection_limiter(connection)
+    try:
+        for chunk in chunks:
+            send_chunk(connection, message, chunk, writer, limiter)
+            writer.flush()
+    finally:
+        connection.close()
+
+
+def default_connection_factory():
+    return get_connection(fail_silently=False)
+
+
+def deliver_mailing(mailing, batch_size=None, connection_factory=None,
+                    workers=None, engine=None, retries=None, progress=None):
+    """Отправляет рассылку всем получателям и возвращает DeliveryResult.
+
+    engine — 'sync' или 'asyncio' (по умолчанию MAILING_DELIVERY_ENGINE).
+    workers — число параллельных SMTP-соединений синхронного движка
+    (по умолчанию MAILING_DELIVERY_CONNECTIONS) на маршрут, у которого
+    не задано свое число соединений.
+    connection_factory — соединения маршрута по умолчанию.
+    retries — {recipient_id: выполнено повторов}: повторная отправка
+    только этим получателям вместо всей рассылки.
+    progress — DeliveryProgress диапазона задания: обход идет по его
+    получателям с его курсора, курсор сохраняется вместе с каждой
+    пачкой попыток.
+    """
+    batch_size = batch_size or settings.MAILING_BATCH_SIZE
+    engine = engine or settings.MAILING_DELIVERY_ENGINE
+    if engine == ENGINE_ASYNCIO:
+        from .async_delivery import deliver_mailing_async
+
+        # Сообщение загружается заранее: в корутине ленивый запрос запрещен
+        mailing.message
+        return async_to_sync(deliver_mailing_async)(
+            mailing, batch_size, retries=retries, progress=progress,
+        )
+
+    workers = workers or settings.MAILING_DELIVERY_CONNECTIONS
+    router = get_router(connection_factory or default_connection_factory)
+    batches = recipient_batches(mailing, batch_size, retries, progress)
+    writer = AttemptWriter(mailing, retries, progress)
+
+    if workers <= 1 and len(router.routes) == 1:
+        send_chunks(router.default.connection(),
+                    get_compiled(mailing.message), batches, writer)
+        return writer.result
+
+    return deliver_threaded(mailing, batches, batch_size, router, workers,
+                            writer)
+
+
+def deliver_threaded(mailing, batches, batch_size, router, workers, writer):
+    message = get_compiled(mailing.message)
+    pools = {
+        route: [queue.Queue(maxsize=2)
+                for _ in range(route.connections or workers)]
+        for route in router.routes
+    }
+    shards = [(route, shard)
+              for route, pool in pools.items() for shard in pool]
+    results = queue.Queue(maxsize=batch_size * len(shards))
+    writer_errors = []
+    done = object()
+
+    def send(route, shard):
+        # Маршрут без получателей не подключается к релею
+        if (first := shard.get()) is None:
+            return
+        chunks = chain([first], iter(shard.get, None))
+        try:
+            send_chunks(route.connection(), message, chunks,
+                        QueueWriter(results))
+        except Exception as e:
+            logger.error(f"Поток отправки маршрута {route.name} завершился "
+                         f"ошибкой: {e}", exc_info=True)
+            # Дочитываем шард, чтобы раздающий поток не заблокировался
+            fail_chunks(chunks, QueueWriter(results), e)
+
+    def write():
+        try:
+            while (item := results.get()) is not done:
+                writer.add(*item)
+                if len(writer.pending) >= batch_size:
+                    writer.flush()
+            writer.flush()
+        except Exception as e:
+            writer_errors.append(e)
+            # Продолжаем разбирать очередь, чтобы не блокировать отправителей
+            while results.get() is not done:
+                pass
+        finally:
+            db_connection.close()
+
+    senders = [
+        threading.Thread(target=send, args=(route, shard), daemon=True)
+        for route, shard in shards
+    ]
+    writer_thread = threading.Thread(target=write, daemon=True)
+    for thread in [*senders, writer_thread]:
+        thread.start()
+
+    try:
+        for batch in batches:
+            # Группа маршрута делится поровну между его соединениями
+            for route, group in router.split(batch).items():
+                pool = pools[route]
+                step = -(-len(group) // len(pool))
+                for index, shard in enumerate(pool):
+                    if part := group[index * step:(index + 1) * step]:
+                        shard.put(part)
+    finally:
+        for route, shard in shards:
+            shard.put(None)
+        for thread in senders:
+            thread.join()
+        results.put(done)
+        writer_thread.join()
+
+    if writer_errors:
+        raise writer_errors[0]
+    return writer.result
@@ -0,0 +1,138 @@
+"""Потоковая выгрузка журнала попыток и получателей в CSV и NDJSON.
+
+Строки читаются из базы пачками по первичному ключу (keyset, без OFFSET
+и без удержания курсора между пачками) и сразу кодируются в текст:
+в памяти одновременно находится только одна пачка, а первые байты
+(заголовок CSV) уходят клиенту до первого запроса к базе.
+"""
+import csv
+import io
+import json
+from datetime import datetime, time, timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .audience import audience_filter
+from .models import MailingAttempt, Recipient
+
+
+FORMAT_CSV = 'csv'
+FORMAT_NDJSON = 'ndjson'
+
+CONTENT_TYPES = {
+    FORMAT_CSV: 'text/csv; charset=utf-8',
+    FORMAT_NDJSON: 'application/x-ndjson; charset=utf-8',
+}
+
+ATTEMPT_COLUMNS = ('id', 'mailing_id', 'recipient_id', 'recipient__email',
+                   'attempt_time', 'status', 'server_response')
+RECIPIENT_COLUMNS = ('id', 'email', 'full_name', 'comment', 'owner_id')
+
+
+def parse_bound(value, end=False):
+    """Разбирает границу периода: дату (YYYY-MM-DD) или дату-время в ISO.
+
+    Дата в конце периода включает весь день, поэтому возвращается
+    полночь следующего дня (граница не включается).
+    """
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Некорректная дата: {value}")
+        if end:
+            day += timedelta(days=1)
+        moment = datetime.combine(day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def parse_attempt_filters(params):
+    """Достает фильтры выгрузки попыток из GET-параметров или опций
+    команды. Некорректные значения отклоняются с ValueError."""
+    filters = {}
+    mailing_id = params.get('mailing')
+    if mailing_id:
+        if not str(mailing_id).isdigit():
+            raise ValueError(f"Некорректный номер рассылки: {mailing_id}")
+        filters['mailing_id'] = int(mailing_id)
+    status = params.get('status')
+    if status:
+        if status not in dict(MailingAttempt.STATUS_CHOICES):
+            raise ValueError(f"Неизвестный статус: {status}")
+        filters['status'] = status
+    if params.get('date_from'):
+        filters['attempt_time__gte'] = parse_bound(params['date_from'])
+    if params.get('date_to'):
+        filters['attempt_time__lt'] = parse_bound(params['date_to'], end=True)
+    return filters
+
+
+def parse_recipient_filters(params):
+    filters = {}
+    mailing_id = params.get('mailing')
+    if mailing_id:
+        if not str(mailing_id).isdigit():
+            raise ValueError(f"Некорректный номер рассылки: {mailing_id}")
+        filters['pk__in'] = Recipient.objects.filter(
+            audience_filter(int(mailing_id)),
+        ).values('pk')
+    return filters
+
+
+def iter_chunks(queryset, columns, chunk_size=2000):
+    """Отдает списки кортежей columns по chunk_size строк в порядке pk.
+
+    Первой колонкой должен быть id: по нему строится условие следующей
+    пачки, поэтому каждая пачка — один индексный поиск.
+    """
+    rows = queryset.order_by('pk').values_list(*columns)
+    last_pk = None
+    while True:
+        page = rows if last_pk is None else rows.filter(pk__gt=last_pk)
+        chunk = list(page[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1][0]
+
+
+def render_csv(chunks, columns):
+    """Кодирует пачки строк в CSV: один фрагмент текста на пачку."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    for chunk in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+
+
+def render_ndjson(chunks, columns):
+    """Кодирует пачки строк в NDJSON: по JSON-объекту на строку."""
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for chunk in chunks:
+        yield ''.join(
+            encoder.encode(dict(zip(columns, row))) + '\n' for row in chunk
+        )
+
+
+RENDERERS = {
+    FORMAT_CSV: render_csv,
+    FORMAT_NDJSON: render_ndjson,
+}
+
+
+def export_rows(queryset, columns, export_format=FORMAT_CSV,
+                chunk_size=2000):
+    """Возвращает генератор текстовых фрагментов выгрузки."""
+    try:
+        renderer = RENDERERS[export_format]
+    except KeyError:
+        raise ValueError(f"Неизвестный формат выгрузки: {export_format}")
+    return renderer(iter_chunks(queryset, columns, chunk_size), columns)
@@ -1,6 +1,8 @@
 
 from django import forms
-from .models import Mailing, Message, Recipient
+from .autocomplete import RecipientMultipleChoiceField
+from .models import Mailing, Message, Recipient, RecipientList
+from .personalization import PLACEHOLDERS, unknown_placeholders
 
 
 class RecipientForm(forms.ModelForm):
@@ -33,10 +35,34 @@ class RecipientForm(forms.ModelForm):
         return email
 
 
+class RecipientImportForm(forms.Form):
+    file = forms.FileField(
+        label='CSV-файл',
+        help_text='Колонки: email, full_name, comment (заголовок необязателен)',
+        widget=forms.ClearableFileInput(attrs={
+            'class': 'form-control',
+            'accept': '.csv,text/csv',
+        }),
+    )
+    list_name = forms.CharField(
+        label='Добавить в список',
+        required=False,
+        max_length=255,
+        help_text='Название списка получателей; создается, если его нет',
+        widget=forms.TextInput(attrs={'class': 'form-control'}),
+    )
+
+
 class MessageForm(forms.ModelForm):
     class Meta:
         model = Message
         fields = ['subject', 'body']
+        help_texts = {
+            'body': 'Подстановки: ' + ', '.join(
+                f'{{{{ {name} }}}} — {title}'
+                for name, title in PLACEHOLDERS.items()
+            ),
+        }
         widgets = {
             'subject': forms.TextInput(attrs={
                 'class': 'form-control',
@@ -55,10 +81,28 @@ class MessageForm(forms.ModelForm):
             raise forms.ValidationError(
                 "Длина темы не должна превышать 255 символов."
             )
-        return subject
+        return self.check_placeholders(subject)
+
+    def clean_body(self):
+        return self.check_placeholders(self.cleaned_data.get('body'))
+
+    def check_placeholders(self, text):
+        if text and (unknown := unknown_placeholders(text)):
+            raise forms.ValidationError(
+                "Неизвестные подстановки: " + ', '.join(unknown)
+            )
+        return text
 
 
 class MailingForm(forms.ModelForm):
+    # Получатели не выводятся списком: виджет подгружает их поиском,
+    # а сохраняются они в _save_m2m по списку pk
+    recipients = RecipientMultipleChoiceField(
+        queryset=Recipient.objects.all(),
+        required=False,
+        label='Получатели',
+    )
+
     class Meta:
         model = Mailing
         fields = [
@@ -66,7 +110,7 @@ class MailingForm(forms.ModelForm):
             'end_time',
             'status',
             'message',
-            'recipients',
+            'recipient_list',
         ]
         widgets = {
             'start_time': forms.DateTimeInput(attrs={
@@ -79,18 +123,34 @@ class MailingForm(forms.ModelForm):
             }),
             'status': forms.Select(attrs={'class': 'form-select'}),
             'message': forms.Select(attrs={'class': 'form-select'}),
-            'recipients': forms.SelectMultiple(attrs={
-                'class': 'form-select',
-                'size': 10
-            }),
+            'recipient_list': forms.Select(attrs={'class': 'form-select'}),
         }
 
     def __init__(self, *args, current_user=None, **kwargs):
         super().__init__(*args, **kwargs)
+        self.fields['recipients'].widget.attrs.update({
+            'class': 'form-select',
+            'size': 10,
+        })
         if current_user:
             self.fields['recipients'].queryset = Recipient.objects.filter(
                 owner=current_user
             )
+            self.fields['recipient_list'].queryset = (
+                RecipientList.objects.filter(owner=current_user)
+            )
+        if self.instance.pk and 'recipients' not in self.initial:
+            # Только pk по связующей таблице, без загрузки получателей
+            self.initial['recipients'] = list(
+                Mailing.recipients.through.objects.filter(
+                    mailing_id=self.instance.pk,
+                ).values_list('recipient_id', flat=True)
+            )
+
+    def _save_m2m(self):
+        super()._save_m2m()
+        if 'recipients' in self.cleaned_data:
+            self.instance.recipients.set(self.cleaned_data['recipients'])
 
     def clean(self):
         cleaned_data = super().clean()
@@ -0,0 +1,158 @@
+"""Потоковый импорт получателей из CSV.
+
+Файл читается построчно и обрабатывается пачками: в памяти одновременно
+находится только текущая пачка, поэтому потребление памяти не зависит
+от размера файла. Дубликаты отсекаются внутри пачки и одним запросом
+к уникальному индексу email на пачку; вставка — через bulk_create.
+Адреса, которые между проверкой и вставкой успел добавить параллельный
+импорт, не считаются добавленными, а попадают в отчет как пропущенные.
+Если задан список получателей, в него пачкой добавляются все
+получатели владельца из пачки, и новые, и уже существовавшие.
+"""
+import csv
+from dataclasses import dataclass, field
+from itertools import islice
+
+from django.contrib.auth.base_user import BaseUserManager
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+from .audience import add_to_list
+from .caching import invalidate_owners
+from .models import Recipient
+
+
+EMAIL_MAX_LENGTH = Recipient._meta.get_field('email').max_length
+FULL_NAME_MAX_LENGTH = Recipient._meta.get_field('full_name').max_length
+HEADER_COLUMNS = ('email', 'full_name', 'comment')
+
+
+@dataclass
+class ImportReport:
+    total: int = 0
+    created: int = 0
+    duplicates: int = 0
+    # Не вставлены из-за конфликта с параллельно добавленными адресами
+    skipped: int = 0
+    rejected: int = 0
+    # Первые max_rejects отклоненных строк: (номер строки, email, причина)
+    rejects: list = field(default_factory=list)
+
+
+class RecipientImporter:
+
+    def __init__(self, owner, batch_size=1000, max_rejects=100,
+                 reject_writer=None, recipient_list=None):
+        self.owner = owner
+        self.recipient_list = recipient_list
+        self.batch_size = batch_size
+        self.max_rejects = max_rejects
+        self.reject_writer = reject_writer
+        self.report = ImportReport()
+
+    def reject(self, line_number, email, reason):
+        self.report.rejected += 1
+        if len(self.report.rejects) < self.max_rejects:
+            self.report.rejects.append((line_number, email, reason))
+        if self.reject_writer is not None:
+            self.reject_writer.writerow([line_number, email, reason])
+
+    def parse_row(self, line_number, row, columns):
+        """Возвращает (email, full_name, comment) или None, если строка
+        отклонена."""
+        values = dict(zip(columns, (value.strip() for value in row)))
+        email = values.get('email', '')
+        if not email:
+            self.reject(line_number, email, 'Пустой email')
+            return None
+        email = BaseUserManager.normalize_email(email)
+        if len(email) > EMAIL_MAX_LENGTH:
+            self.reject(line_number, email, 'Слишком длинный email')
+            return None
+        try:
+            validate_email(email)
+        except ValidationError:
+            self.reject(line_number, email, 'Некорректный email')
+            return None
+        full_name = values.get('full_name', '')[:FULL_NAME_MAX_LENGTH]
+        return email, full_name, values.get('comment', '')
+
+    def existing_emails(self, emails):
+        return set(Recipient.objects.filter(email__in=emails)
+                   .values_list('email', flat=True))
+
+    def import_batch(self, batch):
+        unique = {}
+        for line_number, email, full_name, comment in batch:
+            if email in unique:
+                self.report.duplicates += 1
+                continue
+            unique[email] = Recipient(
+                email=email,
+                full_name=full_name,
+                comment=comment,
+                owner=self.owner,
+            )
+
+        batch_recipients = Recipient.objects.filter(email__in=list(unique))
+        skipped = 0
+        # Одна транзакция на пачку
+        with transaction.atomic():
+            existing = self.existing_emails(list(unique))
+            new = [r for email, r in unique.items() if email not in existing]
+            while new:
+                try:
+                    with transaction.atomic():
+                        Recipient.objects.bulk_create(new)
+                    break
+                except IntegrityError:
+                    # Часть адресов успел добавить параллельный импорт:
+                    # они пропускаются, остальные вставляются повторно
+                    added = self.existing_emails([r.email for r in new])
+                    if not added:
+                        raise
+                    skipped += len(added)
+                    new = [r for r in new if r.email not in added]
+            if self.recipient_list is not None:
+                add_to_list(self.recipient_list, batch_recipients.filter(
+                    owner=self.owner,
+                ).values_list('pk', flat=True))
+            invalidate_owners([self.owner.pk])
+        self.report.duplicates += len(existing)
+        self.report.created += len(new)
+        self.report.skipped += skipped
+
+    def rows(self, stream):
+        reader = csv.reader(stream)
+        first = next(reader, None)
+        if first is None:
+            return
+        header = [value.strip().lower() for value in first]
+        if 'email' in header:
+            columns = header
+        else:
+            columns = HEADER_COLUMNS
+            yield 1, first, columns
+        for row in reader:
+            yield reader.line_num, row, columns
+
+    def parse(self, stream):
+        for line_number, row, columns in self.rows(stream):
+            if not any(value.strip() for value in row):
+                continue
+            self.report.total += 1
+            values = self.parse_row(line_number, row, columns)
+            if values is not None:
+                yield (line_number, *values)
+
+    def run(self, stream):
+        """Импортирует строки из текстового потока и возвращает отчет."""
+        parsed = self.parse(stream)
+        while batch := list(islice(parsed, self.batch_size)):
+            self.import_batch(batch)
+        return self.report
+
+
+def import_recipients(stream, owner, **kwargs):
+    return RecipientImporter(owner, **kwargs).run(stream)
@@ -0,0 +1,228 @@
+"""Очередь заданий на отправку рассылок.
+
+Представление только ставит задание в очередь, а доставку выполняют
+процессы `run_mail_workers`, в том числе на разных узлах. Задание
+забирает ровно один воркер: через SELECT ... FOR UPDATE SKIP LOCKED там,
+где СУБД это умеет, и через условный UPDATE (compare-and-swap
+по статусу) на SQLite. В той же транзакции задание делится на диапазоны
+получателей, которые воркеры всех узлов отправляют параллельно,
+забирая их в аренду (mailing/chunks.py).
+
+Между диапазонами воркер разбирает порцию очереди повторов
+(MailingRetry), так что отложенные письма не задерживают первую
+отправку рассылок.
+"""
+import logging
+from itertools import groupby
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .chunks import (
+    Heartbeat, claim_chunk, finish_chunk, release_chunk, split_job,
+)
+from .delivery import deliver_mailing
+from .models import Mailing, MailingChunk, MailingJob
+from .progress import DeliveryProgress
+from .retries import claim_due_retries, drop_finished
+
+
+logger = logging.getLogger(__name__)
+
+# Сколько кандидатов просматривать при захвате задания без SKIP LOCKED
+CLAIM_CANDIDATES = 10
+
+
+def enqueue_mailing(mailing):
+    """Ставит рассылку в очередь; повторный вызов не создает дубликат.
+
+    Незавершенное задание у рассылки одно (ограничение
+    mailingjob_one_active), поэтому из одновременных вызовов задание
+    создаст только один, остальные получат уже созданное.
+    """
+    active = MailingJob.objects.filter(
+        mailing=mailing,
+        status__in=[MailingJob.STATUS_PENDING, MailingJob.STATUS_RUNNING],
+    )
+    job = active.first()
+    if job is not None:
+        return job
+    try:
+        with transaction.atomic():
+            return MailingJob.objects.create(mailing=mailing)
+    except IntegrityError:
+        # Задание успел создать другой запрос
+        job = active.first()
+        if job is None:
+            raise
+        return job
+
+
+def claim_job(worker_id):
+    """Забирает самое старое задание из очереди и делит его
+    на диапазоны. Возвращает задание или None."""
+    pending = MailingJob.objects.filter(
+        status=MailingJob.STATUS_PENDING
+    ).order_by('created_at', 'pk')
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = pending.select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            job.status = MailingJob.STATUS_RUNNING
+            job.claimed_by = worker_id
+            job.claimed_at = timezone.now()
+            job.save(update_fields=['status', 'claimed_by', 'claimed_at'])
+            split_job(job)
+            return job
+
+    for job_id in pending.values_list('pk', flat=True)[:CLAIM_CANDIDATES]:
+        # Задание без диапазонов не может оказаться в статусе running
+        with transaction.atomic():
+            claimed = MailingJob.objects.filter(
+                pk=job_id, status=MailingJob.STATUS_PENDING,
+            ).update(
+                status=MailingJob.STATUS_RUNNING,
+                claimed_by=worker_id,
+                claimed_at=timezone.now(),
+            )
+            if claimed:
+                job = MailingJob.objects.get(pk=job_id)
+                split_job(job)
+                return job
+    return None
+
+
+def mark_mailing_sent(mailing):
+    """Отмечает рассылку запущенной. Заданное окно end_time сохраняется,
+    его закрывает планировщик send_mailings."""
+    now = timezone.now()
+    mailing.refresh_from_db(fields=['status', 'start_time', 'end_time'])
+    if mailing.status == Mailing.STATUS_CREATED:
+        mailing.status = Mailing.STATUS_STARTED
+    if not mailing.start_time:
+        mailing.start_time = now
+    if not mailing.end_time:
+        mailing.end_time = now
+    mailing.save(update_fields=['status', 'start_time', 'end_time'])
+
+
+def finish_job(job_id):
+    """Закрывает задание, если все его диапазоны завершены. Вызывается
+    после завершения каждого диапазона; из воркеров, закончивших
+    последние диапазоны одновременно, задание закроет ровно один."""
+    chunks = MailingChunk.objects.filter(job_id=job_id)
+    if chunks.filter(status__in=[MailingChunk.STATUS_PENDING,
+                                 MailingChunk.STATUS_RUNNING]).exists():
+        return False
+    failed = chunks.filter(status=MailingChunk.STATUS_FAILED).count()
+    finished = MailingJob.objects.filter(
+        pk=job_id, status=MailingJob.STATUS_RUNNING,
+    ).update(
+        status=MailingJob.STATUS_FAILED if failed else MailingJob.STATUS_DONE,
+        error=f'Диапазонов с ошибкой: {failed}' if failed else '',
+        finished_at=timezone.now(),
+    )
+    if not finished:
+        return False
+    job = MailingJob.objects.select_related('mailing').get(pk=job_id)
+    mark_mailing_sent(job.mailing)
+    logger.info(f"Задание #{job_id}: рассылка {job.mailing_id} отправлена"
+                + (f", диапазонов с ошибкой - {failed}" if failed else ''))
+    return True
+
+
+def process_chunk(chunk, worker_id, connections=None, stop_event=None):
+    """Отправляет арендованный диапазон. Если во время отправки выставлен
+    stop_event, диапазон с сохраненным прогрессом возвращается в очередь;
+    если аренду перехватили, он остается новому владельцу."""
+    mailing = Mailing.objects.select_related('message').get(
+        pk=chunk.mailing_id,
+    )
+    error = None
+    with Heartbeat(chunk, worker_id) as heartbeat:
+        progress = DeliveryProgress(
+            chunk, worker_id,
+            lambda: heartbeat.lost.is_set() or (
+                stop_event is not None and stop_event.is_set()
+            ),
+        )
+        try:
+            result = deliver_mailing(mailing, workers=connections,
+                                     progress=progress)
+        except Exception as e:
+            logger.error(f"Диапазон #{chunk.pk} задания {chunk.job_id} "
+                         f"завершился ошибкой: {e}", exc_info=True)
+            error = e
+    if progress.lost or heartbeat.lost.is_set():
+        logger.warning(f"Диапазон #{chunk.pk} остановлен: аренду "
+                       f"перехватил другой воркер")
+        return
+    if error is None and progress.interrupted:
+        release_chunk(chunk, worker_id)
+        logger.info(f"Диапазон #{chunk.pk} остановлен и возвращен "
+                    f"в очередь на получателе {progress.cursor}")
+        return
+    if not finish_chunk(chunk, worker_id, error):
+        return
+    if error is None:
+        logger.info(
+            f"Диапазон #{chunk.pk} задания {chunk.job_id}: "
+            f"успешно - {result.success}, неуспешно - {result.failed}, "
+            f"отложено - {result.deferred}"
+        )
+    finish_job(chunk.job_id)
+
+
+def process_due_retries(limit=None, connections=None):
+    """Отправляет повторно порцию писем, время которых пришло.
+    Возвращает размер захваченной порции."""
+    claimed = claim_due_retries(limit or settings.MAILING_BATCH_SIZE)
+    claimed.sort(key=lambda retry: retry.mailing_id)
+    for mailing_id, retries in groupby(claimed,
+                                       key=lambda retry: retry.mailing_id):
+        pending = drop_finished(mailing_id, list(retries))
+        if not pending:
+            continue
+        mailing = Mailing.objects.select_related('message').get(pk=mailing_id)
+        try:
+            result = deliver_mailing(mailing, workers=connections,
+                                     retries=pending)
+        except Exception as e:
+            # Записи вернутся в очередь по окончании аренды
+            logger.error(f"Повтор рассылки {mailing_id} завершился "
+                         f"ошибкой: {e}", exc_info=True)
+            continue
+        logger.info(
+            f"Повтор рассылки {mailing_id}: успешно - {result.success}, "
+            f"неуспешно - {result.failed}, отложено - {result.deferred}"
+        )
+    return len(claimed)
+
+
+def run_worker(worker_id, stop_event, poll_interval=1.0, once=False,
+               connections=None):
+    """Цикл воркера: забирает и отправляет диапазоны до stop_event.
+
+    Сначала доделываются начатые задания, затем берется новое.
+    При once=True воркер завершается, как только забирать стало нечего.
+    connections — число SMTP-соединений на один диапазон; worker_id
+    должен быть уникальным среди воркеров всех узлов.
+    """
+    logger.info(f"Воркер {worker_id} запущен")
+    while not stop_event.is_set():
+        chunk = claim_chunk(worker_id)
+        if chunk is None and claim_job(worker_id) is not None:
+            chunk = claim_chunk(worker_id)
+        if chunk is not None:
+            process_chunk(chunk, worker_id, connections, stop_event)
+        # Повторы идут небольшими порциями: следующий диапазон ждет
+        # не дольше одной порции
+        retried = process_due_retries(connections=connections)
+        if chunk is None and not retried:
+            if once:
+                break
+            stop_event.wait(poll_interval)
+    logger.info(f"Воркер {worker_id} остановлен")
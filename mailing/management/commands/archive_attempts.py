@@ -0,0 +1,47 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from mailing.retention import archive_attempts
+
+
+class Command(BaseCommand):
+    help = ('Сворачивает попытки старше заданного числа дней в итоги '
+            'рассылок по дням, переносит строки в сжатые NDJSON-файлы '
+            'архива и удаляет их из журнала пачками')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int,
+            default=settings.MAILING_ATTEMPT_RETENTION_DAYS,
+            help='Сколько последних дней попыток оставить в журнале',
+        )
+        parser.add_argument(
+            '--archive-dir', default=settings.MAILING_ARCHIVE_DIR,
+            help='Каталог архива',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--pause', type=float, default=0.05,
+            help='Пауза между пачками, секунд: дает отправке записать '
+                 'свои попытки',
+        )
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError('--days должно быть не меньше 1')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должно быть не меньше 1')
+        before = timezone.now() - timedelta(days=options['days'])
+        try:
+            result = archive_attempts(before, options['archive_dir'],
+                                      options['batch_size'], options['pause'])
+        except OSError as e:
+            raise CommandError(f'Не удалось записать архив: {e}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено в архив попыток: {result.attempts} '
+            f'(пачек {result.batches}, файлов {result.files}) '
+            f'до {timezone.localtime(before):%Y-%m-%d %H:%M}.'
+        ))
@@ -0,0 +1,147 @@
+import time
+import tracemalloc
+
+import aiosmtplib
+from asgiref.sync import async_to_sync
+
+from django.core.mail import get_connection, send_mail
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from mailing.benchmarks.fixtures import (
+    benchmark_database, create_mailing, delete_bench_data,
+)
+from mailing.benchmarks.smtp_sink import SMTPSink
+from mailing.async_delivery import deliver_mailing_async
+from mailing.delivery import deliver_mailing
+from mailing.models import MailingAttempt
+
+
+def legacy_send(mailing, connection_kwargs):
+    """Прежний цикл: новое SMTP-соединение и INSERT на каждого получателя."""
+    for recipient in mailing.recipients.all():
+        try:
+            send_mail(
+                subject=mailing.message.subject,
+                message=mailing.message.body,
+                from_email='bench@example.com',
+                recipient_list=[recipient.email],
+                fail_silently=False,
+                connection=get_connection(**connection_kwargs),
+            )
+            MailingAttempt.objects.create(
+                mailing=mailing,
+                recipient=recipient,
+                status=MailingAttempt.STATUS_SUCCESS,
+                server_response='Отправлено успешно',
+            )
+        except Exception as e:
+            MailingAttempt.objects.create(
+                mailing=mailing,
+                recipient=recipient,
+                status=MailingAttempt.STATUS_FAILED,
+                server_response=str(e),
+            )
+
+
+class Command(BaseCommand):
+    help = ('Замеряет скорость отправки рассылки (писем в секунду) '
+            'на локальном SMTP-приемнике. Работает во временной базе, '
+            'рабочая база не меняется')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipients', type=int, default=1000)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--latency', type=float, default=0.0,
+            help='Искусственная задержка ответа SMTP на DATA, секунд',
+        )
+        parser.add_argument(
+            '--workers', type=int, nargs='+', default=[4],
+            help='Числа SMTP-соединений для режима threaded',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, nargs='+', default=[100],
+            help='Лимиты одновременных отправок для режима asyncio',
+        )
+        parser.add_argument(
+            '--modes', nargs='+',
+            default=['legacy', 'batched', 'threaded', 'asyncio'],
+            choices=['legacy', 'batched', 'threaded', 'asyncio'],
+        )
+        parser.add_argument(
+            '--trace-memory', action='store_true',
+            help='Измерять пик памяти Python-объектов (tracemalloc)',
+        )
+
+    @override_settings(DEFAULT_FROM_EMAIL='bench@example.com')
+    def handle(self, *args, **options):
+        with benchmark_database(), \
+                SMTPSink(latency=options['latency']) as sink:
+            connection_kwargs = {
+                'backend': 'django.core.mail.backends.smtp.EmailBackend',
+                'host': '127.0.0.1',
+                'port': sink.port,
+                'username': '',
+                'password': '',
+                'use_tls': False,
+                'fail_silently': False,
+            }
+            runs = []
+            for mode in options['modes']:
+                if mode == 'threaded':
+                    runs.extend((mode, n) for n in options['workers'])
+                elif mode == 'asyncio':
+                    runs.extend((mode, n) for n in options['concurrency'])
+                else:
+                    runs.append((mode, 1))
+
+            for mode, parallelism in runs:
+                # Поток записи попыток работает со своим соединением к БД,
+                # поэтому данные замера коммитятся и удаляются после него
+                mailing = create_mailing(options['recipients'])
+                sink.reset()
+                if options['trace_memory']:
+                    tracemalloc.start()
+                try:
+                    started = time.perf_counter()
+                    self.run_mode(mode, parallelism, mailing, sink,
+                                  connection_kwargs, options['batch_size'])
+                    elapsed = time.perf_counter() - started
+                finally:
+                    delete_bench_data()
+
+                label = mode if mode in ('legacy', 'batched') \
+                    else f'{mode}x{parallelism}'
+                line = (
+                    f'{label:>13}: {sink.messages} писем за {elapsed:.2f} с, '
+                    f'{sink.messages / elapsed:.0f} писем/с, '
+                    f'SMTP-соединений: {sink.connections}'
+                )
+                if options['trace_memory']:
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                    line += f', пик памяти: {peak / 1024:.0f} КиБ'
+                self.stdout.write(line)
+
+    def run_mode(self, mode, parallelism, mailing, sink, connection_kwargs,
+                 batch_size):
+        if mode == 'legacy':
+            legacy_send(mailing, connection_kwargs)
+        elif mode == 'asyncio':
+            async_to_sync(deliver_mailing_async)(
+                mailing,
+                batch_size,
+                concurrency=parallelism,
+                smtp_factory=lambda: aiosmtplib.SMTP(
+                    hostname='127.0.0.1', port=sink.port, start_tls=False,
+                ),
+            )
+        else:
+            deliver_mailing(
+                mailing,
+                batch_size=batch_size,
+                connection_factory=lambda: get_connection(**connection_kwargs),
+                workers=parallelism,
+                engine='sync',
+            )
@@ -0,0 +1,71 @@
+import csv
+import resource
+import tempfile
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from mailing.benchmarks.fixtures import BENCH_OWNER_EMAIL, benchmark_database
+from mailing.importers import import_recipients
+
+
+def write_rows(stream, count):
+    """Пишет синтетический CSV: каждая 50-я строка некорректна,
+    каждая 20-я повторяет предыдущий адрес."""
+    writer = csv.writer(stream)
+    writer.writerow(['email', 'full_name', 'comment'])
+    for i in range(count):
+        if i % 50 == 49:
+            writer.writerow([f'broken-{i}', f'Broken {i}', ''])
+        elif i % 20 == 19:
+            writer.writerow([f'bench-import{i - 1}@example.com', '', ''])
+        else:
+            writer.writerow([f'bench-import{i}@example.com',
+                             f'Recipient {i}', 'bench'])
+
+
+class Command(BaseCommand):
+    help = ('Замеряет скорость потокового импорта получателей из CSV. '
+            'Работает во временной базе, рабочая база не меняется')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--trace-memory', action='store_true',
+            help='Измерять пик памяти Python-объектов (tracemalloc)',
+        )
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            owner = get_user_model().objects.create_user(
+                email=BENCH_OWNER_EMAIL, username='bench',
+            )
+            with tempfile.TemporaryFile('w+', newline='',
+                                        encoding='utf-8') as stream:
+                write_rows(stream, options['rows'])
+                stream.seek(0)
+                if options['trace_memory']:
+                    tracemalloc.start()
+                started = time.perf_counter()
+                report = import_recipients(
+                    stream, owner, batch_size=options['batch_size'],
+                )
+                elapsed = time.perf_counter() - started
+
+        line = (
+            f'{report.total} строк за {elapsed:.2f} с, '
+            f'{report.total / elapsed:.0f} строк/с; добавлено: '
+            f'{report.created}, дубликатов: {report.duplicates}, '
+            f'пропущено: {report.skipped}, отклонено: {report.rejected}'
+        )
+        if options['trace_memory']:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            line += f', пик памяти: {peak / 1024:.0f} КиБ'
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        line += f', пиковый RSS процесса: {rss / 1024:.0f} МиБ'
+        self.stdout.write(line)
+
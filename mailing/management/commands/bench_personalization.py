@@ -0,0 +1,118 @@
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.template import Context, Engine
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from mailing.benchmarks.smtp_sink import SMTPSink
+from mailing.delivery import build_email
+from mailing.models import Message, Recipient
+from mailing.personalization import get_compiled
+
+
+SUBJECT = 'Здравствуйте, {{ full_name }}!'
+BODY = (
+    'Уважаемый(ая) {{ full_name }},\n\n'
+    + 'Текст рассылки. ' * 40
+    + '\n\nПисьмо отправлено на {{ email }}.\n'
+    'Отписаться: {{ unsubscribe_url }}\n'
+)
+
+
+def per_message(elapsed, count):
+    return f'{elapsed / count * 1e6:.1f} мкс/письмо'
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает время персонализации писем со временем отправки '
+            'через SMTP (локальный приемник)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipients', type=int, default=100_000)
+        parser.add_argument(
+            '--smtp-sample', type=int, default=2000,
+            help='Сколько писем реально отправить для замера SMTP',
+        )
+        parser.add_argument(
+            '--latency', type=float, default=0.0,
+            help='Искусственная задержка ответа SMTP на DATA, секунд',
+        )
+
+    @override_settings(DEFAULT_FROM_EMAIL='bench@example.com')
+    def handle(self, *args, **options):
+        count = options['recipients']
+        message = Message(pk=1, subject=SUBJECT, body=BODY,
+                          updated_at=timezone.now())
+        recipients = [
+            Recipient(pk=i, email=f'bench{i}@example.com',
+                      full_name=f'Получатель {i}')
+            for i in range(1, count + 1)
+        ]
+
+        # Загрузка URLconf при первом reverse() к компиляции не относится
+        reverse('mailing:unsubscribe', args=['-'])
+        started = time.perf_counter()
+        compiled = get_compiled(message)
+        self.stdout.write(
+            f'Компиляция шаблона: '
+            f'{(time.perf_counter() - started) * 1e6:.0f} мкс (один раз)'
+        )
+
+        started = time.perf_counter()
+        for recipient in recipients:
+            compiled.render(compiled.context(recipient))
+        render_time = time.perf_counter() - started
+        self.stdout.write(
+            f'Подстановка ({count} получателей): {render_time:.2f} с, '
+            f'{per_message(render_time, count)}'
+        )
+
+        # Для сравнения: разбор шаблона Django заново на каждого получателя
+        sample = recipients[:min(count, 10_000)]
+        engine = Engine()
+        started = time.perf_counter()
+        for recipient in sample:
+            context = Context(compiled.context(recipient), autoescape=False)
+            engine.from_string(BODY).render(context)
+        reparse_time = time.perf_counter() - started
+        self.stdout.write(
+            f'Разбор шаблона на каждое письмо: '
+            f'{per_message(reparse_time, len(sample))}'
+        )
+
+        started = time.perf_counter()
+        for recipient in sample:
+            build_email(compiled, recipient, None).message().as_bytes()
+        build_time = time.perf_counter() - started
+        self.stdout.write(
+            f'Сборка MIME-письма целиком: '
+            f'{per_message(build_time, len(sample))}'
+        )
+
+        smtp_sample = recipients[:options['smtp_sample']]
+        with SMTPSink(latency=options['latency']) as sink:
+            connection = get_connection(
+                backend='django.core.mail.backends.smtp.EmailBackend',
+                host='127.0.0.1', port=sink.port, username='', password='',
+                use_tls=False, fail_silently=False,
+            )
+            emails = [build_email(compiled, recipient, connection)
+                      for recipient in smtp_sample]
+            with connection:
+                started = time.perf_counter()
+                for email in emails:
+                    connection.send_messages([email])
+                smtp_time = time.perf_counter() - started
+        self.stdout.write(
+            f'Отправка SMTP (локальный приемник): '
+            f'{per_message(smtp_time, len(smtp_sample))}'
+        )
+
+        render_share = (render_time / count) / (smtp_time / len(smtp_sample))
+        self.stdout.write(self.style.SUCCESS(
+            f'Подстановка занимает {render_share:.1%} от времени отправки '
+            f'одного письма'
+        ))
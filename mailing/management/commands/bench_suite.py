@@ -0,0 +1,206 @@
+import json
+import platform
+import subprocess
+from contextlib import ExitStack
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from mailing.benchmarks.fixtures import benchmark_database
+from mailing.benchmarks.smtp_sink import SMTPSink
+from mailing.benchmarks.suite import SCENARIOS, run_isolated
+
+
+def git_revision():
+    try:
+        revision = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return revision, dirty
+
+
+def change(new, old):
+    if not new or not old:
+        return '-'
+    return f'{(new - old) / old:+.1%}'
+
+
+class Command(BaseCommand):
+    help = ('Набор замеров доставки на локальном SMTP-приемнике: '
+            'писем в секунду, задержки p50/p99, время записи в БД, '
+            'пик памяти. Результаты сохраняются в JSON для сравнения '
+            'между коммитами. Работает во временной базе, рабочая база '
+            'не меняется')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[1000, 10000],
+            help='Размеры синтетических рассылок (например, 1000 10000 100000)',
+        )
+        parser.add_argument(
+            '--scenarios', nargs='+', default=list(SCENARIOS),
+            choices=list(SCENARIOS),
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='SMTP-соединений для threaded и заданий очереди',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=100,
+            help='Одновременных отправок для asyncio',
+        )
+        parser.add_argument(
+            '--nodes', type=int, default=4,
+            help='Процессов-узлов для сценария nodes',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Размер диапазона задания для сценариев через очередь',
+        )
+        parser.add_argument(
+            '--engine', default='sync', choices=['sync', 'asyncio'],
+            help='Движок для сценариев send_mailing, scheduled и routes',
+        )
+        parser.add_argument(
+            '--route-latency', type=float, nargs='+', default=[0.0, 0.0],
+            help='Задержки ответа приемников маршрутов в сценарии routes, '
+                 'секунд: по приемнику и домену на каждое значение',
+        )
+        parser.add_argument(
+            '--latency', type=float, default=0.0,
+            help='Задержка ответа SMTP на DATA, секунд',
+        )
+        parser.add_argument(
+            '--error-rate', type=float, default=0.0,
+            help='Доля писем, которые приемник отклоняет',
+        )
+        parser.add_argument('--error-code', type=int, default=554)
+        parser.add_argument(
+            '--relay-rate', type=float,
+            help='Сколько писем в секунду принимает приемник, сверх этого '
+                 'он отвечает 451',
+        )
+        parser.add_argument(
+            '--rate-limit', type=float, default=0.0,
+            help='Стартовая скорость адаптивного ограничителя, писем в '
+                 'секунду (0 — без ограничения)',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Сохранить результаты в JSON')
+        parser.add_argument(
+            '--compare', help='JSON прошлого прогона для сравнения',
+        )
+
+    def handle(self, *args, **options):
+        previous = {}
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as file:
+                    previous = {
+                        (item['scenario'], item['recipients']): item
+                        for item in json.load(file)['results']
+                    }
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f'Не удалось прочитать {options["compare"]}: {e}')
+
+        results = []
+        with ExitStack() as stack:
+            stack.enter_context(benchmark_database())
+            sink = stack.enter_context(SMTPSink(
+                latency=options['latency'],
+                error_rate=options['error_rate'],
+                error_code=options['error_code'],
+                seed=options['seed'],
+                max_rate=options['relay_rate'],
+            ))
+            route_sinks = [
+                stack.enter_context(SMTPSink(latency=latency,
+                                             seed=options['seed']))
+                for latency in options['route_latency']
+            ] if 'routes' in options['scenarios'] else []
+            params = {
+                'port': sink.port,
+                'route_ports': [route.port for route in route_sinks],
+                'batch_size': options['batch_size'],
+                'workers': options['workers'],
+                'concurrency': options['concurrency'],
+                'engine': options['engine'],
+                'rate_limit': options['rate_limit'],
+                'nodes': options['nodes'],
+                'chunk_size': options['chunk_size'],
+            }
+            for size in options['sizes']:
+                for scenario in options['scenarios']:
+                    for server in [sink, *route_sinks]:
+                        server.reset()
+                    result = run_isolated(scenario, size, params)
+                    result['smtp_connections'] = sink.connections
+                    if scenario == 'routes':
+                        result['route_connections'] = [
+                            route.connections for route in route_sinks
+                        ]
+                        result['route_messages'] = [
+                            route.messages for route in route_sinks
+                        ]
+                    result['smtp_throttled'] = sink.throttled
+                    results.append(result)
+                    self.report(result, previous.get((scenario, size)))
+
+        if options['output']:
+            revision, dirty = git_revision()
+            document = {
+                'revision': revision,
+                'dirty': dirty,
+                'created_at': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'params': {
+                    key: options[key] for key in (
+                        'batch_size', 'workers', 'concurrency', 'engine',
+                        'nodes', 'chunk_size',
+                        'latency', 'error_rate', 'error_code', 'seed',
+                        'relay_rate', 'rate_limit', 'route_latency',
+                    )
+                },
+                'results': results,
+            }
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(document, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Результаты сохранены в {options["output"]}')
+
+    def report(self, result, previous):
+        label = f'{result["scenario"]:>12} x{result["recipients"]:<7}'
+        if 'error' in result:
+            self.stderr.write(f'{label}: ошибка\n{result["error"]}')
+            return
+        line = (
+            f'{label}: {result["messages_per_s"]:>8.0f} писем/с, '
+            f'p50 {result["latency_p50_ms"] or "-"} мс, '
+            f'p99 {result["latency_p99_ms"] or "-"} мс, '
+            f'запись в БД {result["db_write_s"]} с, '
+            f'RSS {result["peak_rss_mib"]} МиБ, '
+            f'ошибок {result["failed"]}, '
+            f'отложено {result.get("deferred", 0)}'
+        )
+        if result.get('smtp_throttled'):
+            line += f' (троттлинг {result["smtp_throttled"]})'
+        if previous and 'error' not in previous:
+            line += (
+                f' | к прошлому: скорость '
+                f'{change(result["messages_per_s"], previous["messages_per_s"])}'
+                f', p99 '
+                f'{change(result["latency_p99_ms"], previous["latency_p99_ms"])}'
+            )
+        self.stdout.write(line)
@@ -0,0 +1,107 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from mailing.benchmarks.fixtures import benchmark_database
+from mailing.models import Recipient, Suppression
+from mailing.suppression import SuppressionList, suppressed_emails
+
+
+BENCH_DOMAIN = 'bench-suppression.example.com'
+
+
+def bench_email(i):
+    return f's{i}@{BENCH_DOMAIN}'
+
+
+class Command(BaseCommand):
+    help = ('Замеряет проверку получателей по стоп-листу: загрузку фильтра '
+            'Блума и отсев пачек. Работает во временной базе: рабочий '
+            'стоп-лист, который читает доставка, не меняется')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=5_000_000,
+                            help='Размер стоп-листа')
+        parser.add_argument('--recipients', type=int, default=1_000_000,
+                            help='Сколько получателей проверить')
+        parser.add_argument(
+            '--suppressed-every', type=int, default=100,
+            help='Каждый N-й получатель находится в стоп-листе',
+        )
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.MAILING_BATCH_SIZE)
+        parser.add_argument(
+            '--query-sample', type=int, default=2000,
+            help='Сколько получателей проверить запросом на каждого '
+                 '(для сравнения)',
+        )
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            started = time.perf_counter()
+            self.fill(options['entries'])
+            self.stdout.write(
+                f'Стоп-лист: {options["entries"]} адресов записано за '
+                f'{time.perf_counter() - started:.1f} с'
+            )
+            self.measure(options)
+
+    def measure(self, options):
+        entries, every = options['entries'], options['suppressed_every']
+        batch_size = options['batch_size']
+        suppressions = SuppressionList()
+        started = time.perf_counter()
+        suppressions.refresh()
+        bloom = suppressions.bloom
+        self.stdout.write(
+            f'Загрузка фильтра: {time.perf_counter() - started:.1f} с, '
+            f'{len(bloom.bits) / 2 ** 20:.1f} МиБ, '
+            f'хешей: {bloom.hashes}'
+        )
+
+        # Каждый every-й получатель в стоп-листе, остальные — нет
+        recipients = [
+            Recipient(pk=i, email=(bench_email(i * every % entries)
+                                   if i % every == 0
+                                   else f'r{i}@{BENCH_DOMAIN}'))
+            for i in range(options['recipients'])
+        ]
+        kept = 0
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            for start in range(0, len(recipients), batch_size):
+                kept += len(suppressions.exclude(
+                    recipients[start:start + batch_size], None,
+                ))
+        elapsed = time.perf_counter() - started
+        batches = -(-len(recipients) // batch_size)
+        self.stdout.write(
+            f'Проверка {len(recipients)} получателей: {elapsed:.2f} с, '
+            f'{elapsed / len(recipients) * 1e6:.2f} мкс/получатель, '
+            f'{elapsed / batches * 1e3:.2f} мс/пачка из {batch_size}; '
+            f'отсеяно: {len(recipients) - kept}, '
+            f'запросов к БД: {len(queries)}'
+        )
+
+        sample = recipients[:options['query_sample']]
+        started = time.perf_counter()
+        for recipient in sample:
+            suppressed_emails([recipient.email], None)
+        per_query = (time.perf_counter() - started) / len(sample)
+        self.stdout.write(self.style.SUCCESS(
+            f'Для сравнения, запрос на каждого получателя: '
+            f'{per_query * 1e6:.1f} мкс/получатель, '
+            f'~{per_query * len(recipients):.0f} с на всех'
+        ))
+
+    def fill(self, count, batch_size=10000):
+        for start in range(0, count, batch_size):
+            Suppression.objects.bulk_create(
+                Suppression(email=bench_email(i),
+                            reason=Suppression.REASON_MANUAL)
+                for i in range(start, min(start + batch_size, count))
+            )
+
@@ -0,0 +1,65 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mailing.exporters import (
+    ATTEMPT_COLUMNS, FORMAT_CSV, RECIPIENT_COLUMNS, RENDERERS,
+    export_rows, parse_attempt_filters, parse_recipient_filters,
+)
+from mailing.models import MailingAttempt, Recipient
+
+
+class Command(BaseCommand):
+    help = ('Потоково выгружает журнал попыток или получателей '
+            'в CSV или NDJSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['attempts', 'recipients'])
+        parser.add_argument(
+            '--format', dest='export_format', default=FORMAT_CSV,
+            choices=list(RENDERERS),
+        )
+        parser.add_argument('--mailing', help='Номер рассылки')
+        parser.add_argument(
+            '--status', choices=dict(MailingAttempt.STATUS_CHOICES),
+            help='Статус попытки (только для attempts)',
+        )
+        parser.add_argument(
+            '--date-from', help='Начало периода: YYYY-MM-DD или ISO 8601',
+        )
+        parser.add_argument(
+            '--date-to', help='Конец периода (день включается целиком)',
+        )
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument(
+            '--output', '-o', default='-',
+            help='Файл для выгрузки, по умолчанию stdout',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            if options['kind'] == 'attempts':
+                queryset = MailingAttempt.objects.filter(
+                    **parse_attempt_filters(options)
+                )
+                columns = ATTEMPT_COLUMNS
+            else:
+                queryset = Recipient.objects.filter(
+                    **parse_recipient_filters(options)
+                )
+                columns = RECIPIENT_COLUMNS
+        except ValueError as e:
+            raise CommandError(e)
+
+        chunks = export_rows(queryset, columns, options['export_format'],
+                             options['chunk_size'])
+        if options['output'] == '-':
+            self.write(sys.stdout, chunks)
+        else:
+            with open(options['output'], 'w', newline='',
+                      encoding='utf-8') as output:
+                self.write(output, chunks)
+
+    def write(self, output, chunks):
+        for chunk in chunks:
+            output.write(chunk)
@@ -0,0 +1,72 @@
+import csv
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from mailing.importers import import_recipients
+from mailing.models import RecipientList
+
+
+class Command(BaseCommand):
+    help = ('Потоково импортирует получателей из CSV-файла '
+            '(колонки email, full_name, comment)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к CSV-файлу')
+        parser.add_argument(
+            '--owner', required=True,
+            help='Email пользователя-владельца получателей',
+        )
+        parser.add_argument(
+            '--list', dest='list_name',
+            help='Добавить получателей в список с этим названием '
+                 '(создается, если его нет)',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--rejects',
+            help='Куда записать отклоненные строки (CSV)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            owner = get_user_model().objects.get(email=options['owner'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'Пользователь {options["owner"]} не найден')
+
+        recipient_list = None
+        if options['list_name']:
+            recipient_list, _ = RecipientList.objects.get_or_create(
+                owner=owner, name=options['list_name'],
+            )
+
+        reject_file = None
+        reject_writer = None
+        if options['rejects']:
+            reject_file = open(options['rejects'], 'w', newline='',
+                               encoding='utf-8')
+            reject_writer = csv.writer(reject_file)
+            reject_writer.writerow(['line', 'email', 'reason'])
+
+        try:
+            with open(options['path'], newline='',
+                      encoding='utf-8-sig') as stream:
+                report = import_recipients(
+                    stream,
+                    owner,
+                    batch_size=options['batch_size'],
+                    max_rejects=0 if reject_writer else 20,
+                    reject_writer=reject_writer,
+                    recipient_list=recipient_list,
+                )
+        finally:
+            if reject_file is not None:
+                reject_file.close()
+
+        for line_number, email, reason in report.rejects:
+            self.stdout.write(f'  строка {line_number}: {email} - {reason}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Строк: {report.total}, добавлено: {report.created}, '
+            f'дубликатов: {report.duplicates}, пропущено: {report.skipped}, '
+            f'отклонено: {report.rejected}'
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from mailing.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счетчики статистики рассылок и владельцев '
+            'по журналу попыток. Запускайте, пока рассылки не отправляются')
+
+    def handle(self, *args, **options):
+        count = rebuild_stats()
+        self.stdout.write(
+            self.style.SUCCESS(f'Статистика пересчитана для {count} рассылок.')
+        )
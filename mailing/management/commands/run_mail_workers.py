@@ -0,0 +1,121 @@
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from mailing.jobs import run_worker
+from mailing.metrics import flush_metrics
+from mailing.profiling import PhaseProfiler
+
+
+def worker_main(index, poll_interval, once, smtp_connections, profile=False,
+                profile_output=None):
+    """Точка входа дочернего процесса: SIGTERM останавливает воркер,
+    текущий диапазон дописывает начатые пачки и возвращается в очередь.
+    При profile по остановке печатает время фаз доставки."""
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *args: stop_event.set())
+    worker_id = f'{socket.gethostname()}:{os.getpid()}:{index}'
+    profiler = PhaseProfiler(profile_output) if profile else nullcontext()
+    try:
+        with profiler:
+            run_worker(worker_id, stop_event, poll_interval, once,
+                       smtp_connections)
+    finally:
+        # Дочерний процесс завершается без atexit
+        flush_metrics()
+        connections.close_all()
+    if profile:
+        report = '\n'.join(profiler.report())
+        sys.stdout.write(f'Воркер {worker_id}. {report}\n')
+        sys.stdout.flush()
+
+
+class Command(BaseCommand):
+    help = ('Запускает процессы-воркеры, которые забирают задания '
+            'на отправку рассылок из очереди и доставляют их')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Количество процессов-воркеров',
+        )
+        parser.add_argument(
+            '--connections', type=int, default=None,
+            help='Параллельных SMTP-соединений на одну рассылку '
+                 '(по умолчанию MAILING_DELIVERY_CONNECTIONS)',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Пауза между опросами пустой очереди, секунд',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выйти, когда очередь опустеет',
+        )
+        parser.add_argument(
+            '--profile', action='store_true',
+            help='По остановке напечатать время каждой фазы доставки',
+        )
+        parser.add_argument(
+            '--profile-output',
+            help='Сохранить профиль cProfile в файл pstats (включает '
+                 '--profile; при нескольких воркерах к имени добавляется '
+                 'номер воркера)',
+        )
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        poll_interval = options['poll_interval']
+        once = options['once']
+        smtp_connections = options['connections']
+        output = options['profile_output']
+        profile = options['profile'] or bool(output)
+
+        def profile_path(index):
+            if output and workers > 1:
+                return f'{output}.{index}'
+            return output
+
+        if workers <= 1:
+            worker_main(0, poll_interval, once, smtp_connections, profile,
+                        profile_path(0))
+            return
+
+        # Соединения с БД не должны наследоваться дочерними процессами
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(
+                target=worker_main,
+                args=(index, poll_interval, once, smtp_connections, profile,
+                      profile_path(index)),
+                daemon=False,
+            )
+            for index in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f'Запущено воркеров: {workers}')
+
+        def stop(*args):
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            stop()
+            for process in processes:
+                process.join()
+        self.stdout.write(self.style.SUCCESS('Воркеры остановлены.'))
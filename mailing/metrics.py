@@ -0,0 +1,403 @@
+"""Метрики доставки и веб-запросов в текстовом формате Prometheus.
+
+Запись метрики — прибавление к числу в словаре текущего потока: без
+блокировок, обращений к диску и к БД. Поток регистрирует свой словарь
+один раз; при сборе словари потоков суммируются, а словари завершившихся
+потоков сворачиваются в общий.
+
+Процессов на узле обычно несколько (воркеры gunicorn, run_mail_workers),
+поэтому каждый процесс раз в MAILING_METRICS_FLUSH секунд сохраняет свои
+суммы в файл MAILING_METRICS_DIR/<pid>-<метка>.json (запись во временный
+файл и атомарная замена), а /metrics складывает файлы всех процессов.
+Файлы завершившихся процессов сворачиваются в один, чтобы счетчики
+не уменьшались после перезапуска воркеров. Каталог — свой у каждого узла,
+и каждый узел опрашивается отдельно. После fork дочерний процесс
+начинает с нуля.
+
+Очереди (задания, диапазоны, повторы) считаются запросами к БД в момент
+сбора: для них не нужно ничего записывать по ходу работы.
+"""
+import atexit
+import bisect
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db.models import Count
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import MailingChunk, MailingJob, MailingRetry
+from .signals import attempts_written, message_sent
+
+try:
+    import fcntl
+except ImportError:  # Windows: файлы завершившихся процессов не сворачиваются
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Границы корзин гистограмм, секунд
+SMTP_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                1, 2.5, 5, 10, 30)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5,
+                    10, 30)
+
+# Метод запроса вне списка попадает в метку как 'other'
+HTTP_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+DEAD_FILE = 'dead.json'
+
+# Все объявленные метрики в порядке вывода
+METRICS = []
+
+
+class Shard:
+    """Значения метрик одного потока (или сумма нескольких)."""
+
+    def __init__(self, thread=None):
+        self.thread = thread
+        # {(имя, значения меток): число}
+        self.counters = {}
+        # {(имя, значения меток): [число в каждой корзине..., сумма]}
+        self.histograms = {}
+
+    def merge(self, other):
+        # Копии словаря и списков делаются атомарно под GIL, поэтому
+        # словарь работающего потока можно читать без блокировки
+        for key, value in other.counters.copy().items():
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, values in other.histograms.copy().items():
+            self.add_histogram(key, list(values))
+
+    def add_histogram(self, key, values):
+        total = self.histograms.get(key)
+        if total is None:
+            self.histograms[key] = values
+        else:
+            for index, value in enumerate(values):
+                total[index] += value
+
+    def dump(self):
+        return {
+            'counters': [[name, list(labels), value]
+                         for (name, labels), value in self.counters.items()],
+            'histograms': [[name, list(labels), values]
+                           for (name, labels), values
+                           in self.histograms.items()],
+        }
+
+    def load(self, data):
+        for name, labels, value in data.get('counters', []):
+            key = (name, tuple(labels))
+            self.counters[key] = self.counters.get(key, 0) + value
+        for name, labels, values in data.get('histograms', []):
+            self.add_histogram((name, tuple(labels)), list(values))
+
+
+def metrics_dir():
+    return (settings.MAILING_METRICS_DIR
+            or os.path.join(tempfile.gettempdir(), 'mailing-metrics'))
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Collector:
+    """Словари потоков процесса и их периодическое сохранение в файл."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.shards = []
+        self.retired = Shard()
+        self.token = uuid.uuid4().hex[:8]
+        self.flusher = None
+
+    def shard(self):
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard = self.local.shard = Shard(threading.current_thread())
+            with self.lock:
+                self.shards.append(shard)
+                if self.flusher is None:
+                    self.flusher = threading.Thread(target=self.run,
+                                                    daemon=True)
+                    self.flusher.start()
+            return shard
+
+    def snapshot(self):
+        """Сумма по всем потокам процесса."""
+        total = Shard()
+        with self.lock:
+            alive = []
+            for shard in self.shards:
+                if shard.thread.is_alive():
+                    alive.append(shard)
+                    total.merge(shard)
+                else:
+                    self.retired.merge(shard)
+            self.shards = alive
+            total.merge(self.retired)
+        return total
+
+    def path(self):
+        return os.path.join(metrics_dir(), f'{os.getpid()}-{self.token}.json')
+
+    def flush(self):
+        # Процесс, который ничего не записывал, не заводит файл
+        if self.flusher is None:
+            return
+        path = self.path()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(f'{path}.tmp', 'w', encoding='utf-8') as file:
+                json.dump(self.snapshot().dump(), file)
+            os.replace(f'{path}.tmp', path)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить метрики в {path}: {e}")
+
+    def run(self):
+        while True:
+            time.sleep(settings.MAILING_METRICS_FLUSH)
+            self.flush()
+
+
+collector = Collector()
+os.register_at_fork(after_in_child=collector.reset)
+atexit.register(collector.flush)
+
+
+def flush_metrics():
+    collector.flush()
+
+
+def collect():
+    """Сумма метрик всех процессов узла. Файлы завершившихся процессов
+    сворачиваются в DEAD_FILE под блокировкой каталога."""
+    collector.flush()
+    directory = metrics_dir()
+    own = os.path.basename(collector.path())
+    dead_path = os.path.join(directory, DEAD_FILE)
+    total = Shard()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, '.lock'), 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            # DEAD_FILE читается один раз до обхода: свернутые в него
+            # файлы уже учтены в total, и повторное чтение после записи
+            # удвоило бы их на этом сборе
+            dead = Shard()
+            if os.path.exists(dead_path):
+                with open(dead_path, encoding='utf-8') as file:
+                    data = json.load(file)
+                total.load(data)
+                dead.load(data)
+            folded = []
+            for name in sorted(os.listdir(directory)):
+                if not name.endswith('.json') or name == DEAD_FILE:
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    with open(path, encoding='utf-8') as file:
+                        data = json.load(file)
+                except (OSError, ValueError):
+                    continue
+                total.load(data)
+                if (fcntl is None or name == own
+                        or pid_alive(int(name.split('-', 1)[0]))):
+                    continue
+                dead.load(data)
+                folded.append(path)
+            if folded:
+                with open(f'{dead_path}.tmp', 'w', encoding='utf-8') as file:
+                    json.dump(dead.dump(), file)
+                os.replace(f'{dead_path}.tmp', dead_path)
+                for path in folded:
+                    os.remove(path)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Не удалось прочитать метрики из {directory}: {e}")
+        total = collector.snapshot()
+    return total
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        METRICS.append(self)
+
+    def inc(self, *labels, amount=1):
+        counters = collector.shard().counters
+        key = (self.name, labels)
+        counters[key] = counters.get(key, 0) + amount
+
+    def samples(self, total):
+        for (name, labels), value in sorted(total.counters.items()):
+            if name == self.name:
+                yield self.name, dict(zip(self.labels, labels)), value
+
+
+class Histogram(Counter):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=()):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        histograms = collector.shard().histograms
+        key = (self.name, labels)
+        values = histograms.get(key)
+        if values is None:
+            values = histograms[key] = [0] * (len(self.buckets) + 2)
+        values[bisect.bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+    def samples(self, total):
+        for (name, labels), values in sorted(total.histograms.items()):
+            if name != self.name:
+                continue
+            labels = dict(zip(self.labels, labels))
+            count = 0
+            for bound, value in zip((*self.buckets, '+Inf'), values):
+                count += value
+                yield (f'{self.name}_bucket', {**labels, 'le': str(bound)},
+                       count)
+            yield f'{self.name}_sum', labels, values[-1]
+            yield f'{self.name}_count', labels, count
+
+
+MESSAGES = Counter(
+    'mailing_messages_total',
+    'Письма, отправленные движками доставки, по результату SMTP',
+    ('engine', 'status'),
+)
+SMTP_SECONDS = Histogram(
+    'mailing_smtp_seconds',
+    'Длительность SMTP-транзакции одного письма',
+    ('engine',), SMTP_BUCKETS,
+)
+ATTEMPTS_WRITTEN = Counter(
+    'mailing_attempts_written_total',
+    'Попытки, записанные в журнал',
+)
+ATTEMPT_WRITE_SECONDS = Histogram(
+    'mailing_attempt_write_seconds',
+    'Запись пачки попыток вместе со счетчиками, включая фиксацию',
+    (), DURATION_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    'mailing_http_request_seconds',
+    'Время обработки веб-запроса по имени представления',
+    ('view', 'method', 'status'), DURATION_BUCKETS,
+)
+
+
+@receiver(message_sent)
+def record_message(sender, status, duration, **kwargs):
+    MESSAGES.inc(sender, status)
+    SMTP_SECONDS.observe(duration, sender)
+
+
+@receiver(attempts_written)
+def record_attempts(sender, count, duration, **kwargs):
+    ATTEMPTS_WRITTEN.inc(amount=count)
+    ATTEMPT_WRITE_SECONDS.observe(duration)
+
+
+class MetricsMiddleware:
+    """Время обработки запроса (до отдачи ответа; у потоковых выгрузок —
+    до первого байта) по имени представления."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        match = request.resolver_match
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            match.view_name if match else 'unresolved',
+            request.method if request.method in HTTP_METHODS else 'other',
+            str(response.status_code),
+        )
+        return response
+
+
+def queue_gauges():
+    """Показатели очередей по данным БД: [(имя, описание, образцы)]."""
+    jobs = dict(MailingJob.objects.order_by().values_list('status')
+                .annotate(count=Count('pk')))
+    chunks = dict(MailingChunk.objects.order_by().values_list('status')
+                  .annotate(count=Count('pk')))
+    retries = MailingRetry.objects.order_by()
+    return [
+        ('mailing_jobs', 'Задания на отправку по статусу', [
+            ({'status': status}, jobs.get(status, 0))
+            for status, _ in MailingJob.STATUS_CHOICES
+        ]),
+        ('mailing_chunks', 'Диапазоны заданий по статусу', [
+            ({'status': status}, chunks.get(status, 0))
+            for status, _ in MailingChunk.STATUS_CHOICES
+        ]),
+        ('mailing_retry_backlog', 'Получатели в очереди повторов', [
+            ({}, retries.count()),
+        ]),
+        ('mailing_retry_due', 'Повторы, время которых уже наступило', [
+            ({}, retries.filter(next_attempt_at__lte=timezone.now()).count()),
+        ]),
+    ]
+
+
+def escape(value):
+    return (str(value).replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n'))
+
+
+def sample_line(name, labels, value):
+    if labels:
+        pairs = ','.join(f'{key}="{escape(label)}"'
+                         for key, label in labels.items())
+        name = f'{name}{{{pairs}}}'
+    return f'{name} {value!r}'
+
+
+def render_metrics():
+    """Текст для /metrics: метрики процессов узла и очередей."""
+    total = collect()
+    lines = []
+    for metric in METRICS:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(sample_line(*sample) for sample in metric.samples(total))
+    for name, documentation, samples in queue_gauges():
+        lines.append(f'# HELP {name} {documentation}')
+        lines.append(f'# TYPE {name} gauge')
+        lines.extend(sample_line(name, labels, value)
+                     for labels, value in samples)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Выполнено'), ('failed', 'Ошибка')], default='pending', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('claimed_by', models.CharField(blank=True, max_length=255)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('mailing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='mailing.mailing')),
+            ],
+            options={
+                'verbose_name': 'Задание на отправку',
+                'verbose_name_plural': 'Задания на отправку',
+                'indexes': [models.Index(fields=['status', 'created_at'], name='mailingjob_status_created')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0002_mailingjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mailing',
+            index=models.Index(fields=['status', 'start_time'], name='mailing_status_start'),
+        ),
+        migrations.AddIndex(
+            model_name='mailing',
+            index=models.Index(fields=['status', 'end_time'], name='mailing_status_end'),
+        ),
+    ]
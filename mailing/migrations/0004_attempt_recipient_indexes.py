@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from mailing.migration_operations import AddIndexConcurrentlyIfSupported
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('mailing', '0003_mailing_schedule_indexes'),
+    ]
+
+    operations = [
+        # Nullable-колонка без значения по умолчанию добавляется
+        # без перезаписи существующих строк
+        migrations.AddField(
+            model_name='mailingattempt',
+            name='recipient',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='attempts', to='mailing.recipient'),
+        ),
+        AddIndexConcurrentlyIfSupported(
+            model_name='mailingattempt',
+            index=models.Index(fields=['mailing', 'attempt_time'], name='attempt_mailing_time'),
+        ),
+        AddIndexConcurrentlyIfSupported(
+            model_name='mailingattempt',
+            index=models.Index(fields=['mailing', 'status'], name='attempt_mailing_status'),
+        ),
+        AddIndexConcurrentlyIfSupported(
+            model_name='mailingattempt',
+            index=models.Index(fields=['recipient'], name='attempt_recipient'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+from mailing.migration_operations import AddIndexConcurrentlyIfSupported
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('mailing', '0004_attempt_recipient_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyIfSupported(
+            model_name='mailingattempt',
+            index=models.Index(fields=['attempt_time', 'id'], name='attempt_time_id'),
+        ),
+    ]
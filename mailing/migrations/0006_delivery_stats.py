@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0005_attempt_time_id_index'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailingStats',
+            fields=[
+                ('mailing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='mailing.mailing')),
+                ('sent', models.PositiveBigIntegerField(default=0)),
+                ('failed', models.PositiveBigIntegerField(default=0)),
+                ('last_attempt_time', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Статистика рассылки',
+                'verbose_name_plural': 'Статистика рассылок',
+            },
+        ),
+        migrations.CreateModel(
+            name='OwnerStats',
+            fields=[
+                ('owner', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='mailing_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('sent', models.PositiveBigIntegerField(default=0)),
+                ('failed', models.PositiveBigIntegerField(default=0)),
+                ('last_attempt_time', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Статистика владельца',
+                'verbose_name_plural': 'Статистика владельцев',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0006_delivery_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='recipient',
+            name='unsubscribed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
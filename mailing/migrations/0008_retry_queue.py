@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0007_personalization'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailingattempt',
+            name='smtp_code',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='mailingattempt',
+            name='status',
+            field=models.CharField(choices=[('success', 'Успешно'), ('failed', 'Не успешно'), ('deferred', 'Отложено')], max_length=10),
+        ),
+        migrations.CreateModel(
+            name='MailingRetry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('retries', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField()),
+                ('claimed_by', models.CharField(blank=True, max_length=64)),
+                ('smtp_code', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('mailing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='retries', to='mailing.mailing')),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='retries', to='mailing.recipient')),
+            ],
+            options={
+                'verbose_name': 'Повторная отправка',
+                'verbose_name_plural': 'Повторные отправки',
+                'indexes': [models.Index(fields=['next_attempt_at'], name='mailingretry_due')],
+                'constraints': [models.UniqueConstraint(fields=('mailing', 'recipient'), name='mailingretry_unique')],
+            },
+        ),
+    ]
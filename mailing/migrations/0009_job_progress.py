@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0008_retry_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailingjob',
+            name='cursor',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='mailingjob',
+            name='high_water',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0009_job_progress'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='mailingjob',
+            name='cursor',
+        ),
+        migrations.RemoveField(
+            model_name='mailingjob',
+            name='high_water',
+        ),
+        migrations.CreateModel(
+            name='MailingChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_after', models.BigIntegerField()),
+                ('last_pk', models.BigIntegerField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Выполнено'), ('failed', 'Ошибка')], default='pending', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('claimed_by', models.CharField(blank=True, max_length=255)),
+                ('lease_until', models.DateTimeField(blank=True, null=True)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('cursor', models.BigIntegerField(default=0)),
+                ('high_water', models.BigIntegerField(default=0)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='mailing.mailingjob')),
+                ('mailing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='mailing.mailing')),
+            ],
+            options={
+                'verbose_name': 'Диапазон задания',
+                'verbose_name_plural': 'Диапазоны заданий',
+                'indexes': [models.Index(fields=['status', 'lease_until'], name='mailingchunk_claim')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0010_job_chunks'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipient',
+            index=models.Index(fields=['owner', 'email'], name='recipient_owner_email'),
+        ),
+        migrations.AddIndex(
+            model_name='recipient',
+            index=models.Index(fields=['owner', 'full_name'], name='recipient_owner_name'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0011_recipient_search_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipientList',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipient_lists', to=settings.AUTH_USER_MODEL)),
+                ('recipients', models.ManyToManyField(blank=True, related_name='lists', to='mailing.recipient')),
+            ],
+            options={
+                'verbose_name': 'Список получателей',
+                'verbose_name_plural': 'Списки получателей',
+            },
+        ),
+        migrations.AddField(
+            model_name='mailing',
+            name='recipient_list',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='mailings', to='mailing.recipientlist'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipientlist',
+            constraint=models.UniqueConstraint(fields=('owner', 'name'), name='recipientlist_owner_name'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0012_recipient_lists'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Suppression',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254)),
+                ('reason', models.CharField(choices=[('bounce', 'Жесткий отказ'), ('unsubscribe', 'Отписка'), ('complaint', 'Жалоба на спам'), ('manual', 'Вручную')], default='manual', max_length=12)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='suppressions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Адрес в стоп-листе',
+                'verbose_name_plural': 'Стоп-лист',
+                'indexes': [models.Index(fields=['email'], name='suppression_email')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('owner__isnull', True)), fields=('email',), name='suppression_global_email'), models.UniqueConstraint(fields=('owner', 'email'), name='suppression_owner_email')],
+            },
+        ),
+    ]
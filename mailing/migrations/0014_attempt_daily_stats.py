@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0013_suppression_list'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailingDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('sent', models.PositiveBigIntegerField(default=0)),
+                ('failed', models.PositiveBigIntegerField(default=0)),
+                ('deferred', models.PositiveBigIntegerField(default=0)),
+                ('last_attempt_time', models.DateTimeField(blank=True, null=True)),
+                ('mailing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='mailing.mailing')),
+            ],
+            options={
+                'verbose_name': 'Итоги рассылки за день',
+                'verbose_name_plural': 'Итоги рассылок по дням',
+                'constraints': [models.UniqueConstraint(fields=('mailing', 'day'), name='mailingdailystats_mailing_day')],
+            },
+        ),
+    ]
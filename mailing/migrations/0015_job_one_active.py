@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:02
+
+from django.db import migrations, models
+
+
+def fail_duplicate_jobs(apps, schema_editor):
+    """Оставляет у рассылки одно незавершенное задание (выполняемое,
+    иначе самое старое), остальные закрывает с ошибкой, иначе
+    ограничение не создать."""
+    MailingJob = apps.get_model('mailing', 'MailingJob')
+    active = MailingJob.objects.filter(
+        status__in=['pending', 'running'],
+    ).order_by('mailing_id', '-status', 'created_at', 'pk')
+    seen = set()
+    duplicates = []
+    for job_id, mailing_id in active.values_list('pk', 'mailing_id'):
+        if mailing_id in seen:
+            duplicates.append(job_id)
+        seen.add(mailing_id)
+    MailingJob.objects.filter(pk__in=duplicates).update(
+        status='failed', error='Дубликат незавершенного задания рассылки',
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0014_attempt_daily_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicate_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='mailingjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'running'])), fields=('mailing',), name='mailingjob_one_active'),
+        ),
+    ]
@@ -11,6 +11,9 @@ class Recipient(models.Model):
         on_delete=models.CASCADE,
         related_name='recipients'
     )
+    # Заполняется по ссылке отписки из письма; таким получателям
+    # рассылки больше не отправляются
+    unsubscribed_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.full_name} <{self.email}>"
@@ -18,12 +21,52 @@ class Recipient(models.Model):
     class Meta:
         verbose_name = "Получатель рассылки"
         verbose_name_plural = "Получатели рассылок"
+        # Поиск по началу email и Ф.И.О. в подборе получателей
+        indexes = [
+            models.Index(fields=['owner', 'email'],
+                         name='recipient_owner_email'),
+            models.Index(fields=['owner', 'full_name'],
+                         name='recipient_owner_name'),
+        ]
         permissions = [
             ('view_all_recipients', 'Can view all recipients (managers)'),
             # Можно добавить другие права по необходимости
         ]
 
 
+class RecipientList(models.Model):
+    """Именованный список получателей, на который ссылаются рассылки.
+
+    Членство хранится один раз в связующей таблице списка (пара pk
+    с уникальным индексом), а не копируется в каждую рассылку: рассылка
+    на весь список — одна запись, получатели разворачиваются при
+    отправке (mailing/audience.py).
+    """
+    name = models.CharField(max_length=255)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='recipient_lists'
+    )
+    recipients = models.ManyToManyField(
+        Recipient,
+        related_name='lists',
+        blank=True
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = "Список получателей"
+        verbose_name_plural = "Списки получателей"
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'name'],
+                                    name='recipientlist_owner_name'),
+        ]
+
+
 class Message(models.Model):
     subject = models.CharField(max_length=255)
     body = models.TextField()
@@ -32,6 +75,8 @@ class Message(models.Model):
         on_delete=models.CASCADE,
         related_name='messages'
     )
+    # Версия текста для кеша скомпилированных шаблонов
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.subject
@@ -72,6 +117,15 @@ class Mailing(models.Model):
         related_name='mailings',
         blank=True
     )
+    # Получатели списка отправляются вместе с recipients; список
+    # нельзя удалить, пока на него ссылаются рассылки
+    recipient_list = models.ForeignKey(
+        RecipientList,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='mailings'
+    )
     owner = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -84,6 +138,12 @@ class Mailing(models.Model):
     class Meta:
         verbose_name = "Рассылка"
         verbose_name_plural = "Рассылки"
+        indexes = [
+            models.Index(fields=['status', 'start_time'],
+                         name='mailing_status_start'),
+            models.Index(fields=['status', 'end_time'],
+                         name='mailing_status_end'),
+        ]
         permissions = [
             ('view_all_mailings', 'Can view all mailings (managers)'),
             ('manage_mailings', 'Can manage mailings'),
@@ -93,10 +153,13 @@ class Mailing(models.Model):
 class MailingAttempt(models.Model):
     STATUS_SUCCESS = 'success'
     STATUS_FAILED = 'failed'
+    # Временная ошибка SMTP, получатель поставлен в очередь повторов
+    STATUS_DEFERRED = 'deferred'
 
     STATUS_CHOICES = [
         (STATUS_SUCCESS, 'Успешно'),
         (STATUS_FAILED, 'Не успешно'),
+        (STATUS_DEFERRED, 'Отложено'),
     ]
 
     mailing = models.ForeignKey(
@@ -104,12 +167,21 @@ class MailingAttempt(models.Model):
         on_delete=models.CASCADE,
         related_name='attempts'
     )
+    recipient = models.ForeignKey(
+        Recipient,
+        on_delete=models.SET_NULL,
+        related_name='attempts',
+        null=True,
+        blank=True,
+        db_index=False,
+    )
     attempt_time = models.DateTimeField(auto_now_add=True)
     status = models.CharField(
-        max_length=7,
+        max_length=10,
         choices=STATUS_CHOICES
     )
     server_response = models.TextField(blank=True)
+    smtp_code = models.PositiveSmallIntegerField(null=True, blank=True)
 
     def __str__(self):
         return (f"Попытка рассылки {self.mailing_id} "
@@ -118,3 +190,286 @@ class MailingAttempt(models.Model):
     class Meta:
         verbose_name = "Попытка рассылки"
         verbose_name_plural = "Попытки рассылок"
+        indexes = [
+            models.Index(fields=['mailing', 'attempt_time'],
+                         name='attempt_mailing_time'),
+            models.Index(fields=['mailing', 'status'],
+                         name='attempt_mailing_status'),
+            models.Index(fields=['recipient'],
+                         name='attempt_recipient'),
+            models.Index(fields=['attempt_time', 'id'],
+                         name='attempt_time_id'),
+        ]
+
+
+class MailingJob(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Выполнено'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    mailing = models.ForeignKey(
+        Mailing,
+        on_delete=models.CASCADE,
+        related_name='jobs'
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    claimed_by = models.CharField(max_length=255, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"Задание #{self.pk} рассылки {self.mailing_id} - {self.status}"
+
+    class Meta:
+        verbose_name = "Задание на отправку"
+        verbose_name_plural = "Задания на отправку"
+        constraints = [
+            # У рассылки не больше одного незавершенного задания
+            models.UniqueConstraint(
+                fields=['mailing'],
+                condition=models.Q(status__in=['pending', 'running']),
+                name='mailingjob_one_active',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'created_at'],
+                         name='mailingjob_status_created'),
+        ]
+
+
+class MailingChunk(models.Model):
+    """Диапазон получателей задания (pk в (start_after, last_pk]),
+    который воркеры разных узлов забирают в аренду."""
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Выполнено'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    job = models.ForeignKey(
+        MailingJob,
+        on_delete=models.CASCADE,
+        related_name='chunks'
+    )
+    mailing = models.ForeignKey(
+        Mailing,
+        on_delete=models.CASCADE,
+        related_name='chunks'
+    )
+    start_after = models.BigIntegerField()
+    # Пусто у последнего диапазона: он забирает и добавленных позже
+    last_pk = models.BigIntegerField(null=True, blank=True)
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_by = models.CharField(max_length=255, blank=True)
+    lease_until = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    # Прогресс для возобновления после сбоя (см. mailing/progress.py)
+    cursor = models.BigIntegerField(default=0)
+    high_water = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return (f"Диапазон #{self.pk} задания {self.job_id} "
+                f"({self.start_after}, {self.last_pk or '…'}] - {self.status}")
+
+    class Meta:
+        verbose_name = "Диапазон задания"
+        verbose_name_plural = "Диапазоны заданий"
+        indexes = [
+            models.Index(fields=['status', 'lease_until'],
+                         name='mailingchunk_claim'),
+        ]
+
+
+class Suppression(models.Model):
+    """Адрес, на который рассылки не отправляются: всем владельцам
+    (owner пуст, например после жесткого отказа) или одному владельцу
+    (например после отписки)."""
+
+    REASON_BOUNCE = 'bounce'
+    REASON_UNSUBSCRIBE = 'unsubscribe'
+    REASON_COMPLAINT = 'complaint'
+    REASON_MANUAL = 'manual'
+
+    REASON_CHOICES = [
+        (REASON_BOUNCE, 'Жесткий отказ'),
+        (REASON_UNSUBSCRIBE, 'Отписка'),
+        (REASON_COMPLAINT, 'Жалоба на спам'),
+        (REASON_MANUAL, 'Вручную'),
+    ]
+
+    # Хранится в нижнем регистре (mailing.suppression.normalize)
+    email = models.EmailField()
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='suppressions'
+    )
+    reason = models.CharField(
+        max_length=12,
+        choices=REASON_CHOICES,
+        default=REASON_MANUAL
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.email
+
+    class Meta:
+        verbose_name = "Адрес в стоп-листе"
+        verbose_name_plural = "Стоп-лист"
+        constraints = [
+            models.UniqueConstraint(fields=['email'],
+                                    condition=models.Q(owner__isnull=True),
+                                    name='suppression_global_email'),
+            models.UniqueConstraint(fields=['owner', 'email'],
+                                    name='suppression_owner_email'),
+        ]
+        indexes = [
+            models.Index(fields=['email'], name='suppression_email'),
+        ]
+
+
+class MailingRetry(models.Model):
+    """Получатель, которому письмо будет отправлено повторно после
+    временной ошибки SMTP."""
+
+    mailing = models.ForeignKey(
+        Mailing,
+        on_delete=models.CASCADE,
+        related_name='retries'
+    )
+    recipient = models.ForeignKey(
+        Recipient,
+        on_delete=models.CASCADE,
+        related_name='retries'
+    )
+    retries = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField()
+    claimed_by = models.CharField(max_length=64, blank=True)
+    smtp_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return (f"Повтор рассылки {self.mailing_id} получателю "
+                f"{self.recipient_id} в {self.next_attempt_at}")
+
+    class Meta:
+        verbose_name = "Повторная отправка"
+        verbose_name_plural = "Повторные отправки"
+        constraints = [
+            models.UniqueConstraint(fields=['mailing', 'recipient'],
+                                    name='mailingretry_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['next_attempt_at'],
+                         name='mailingretry_due'),
+        ]
+
+
+class MailingStats(models.Model):
+    """Счетчики доставки рассылки, обновляются вместе с записью попыток."""
+
+    mailing = models.OneToOneField(
+        Mailing,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    sent = models.PositiveBigIntegerField(default=0)
+    failed = models.PositiveBigIntegerField(default=0)
+    last_attempt_time = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def success_rate(self):
+        total = self.sent + self.failed
+        return self.sent / total * 100 if total else None
+
+    def __str__(self):
+        return f"Статистика рассылки {self.mailing_id}"
+
+    class Meta:
+        verbose_name = "Статистика рассылки"
+        verbose_name_plural = "Статистика рассылок"
+
+
+class MailingDailyStats(models.Model):
+    """Итоги попыток рассылки за день, перенесенных из журнала в архив
+    (команда archive_attempts)."""
+
+    mailing = models.ForeignKey(
+        Mailing,
+        on_delete=models.CASCADE,
+        related_name='daily_stats'
+    )
+    day = models.DateField()
+    sent = models.PositiveBigIntegerField(default=0)
+    failed = models.PositiveBigIntegerField(default=0)
+    deferred = models.PositiveBigIntegerField(default=0)
+    last_attempt_time = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Итоги рассылки {self.mailing_id} за {self.day}"
+
+    class Meta:
+        verbose_name = "Итоги рассылки за день"
+        verbose_name_plural = "Итоги рассылок по дням"
+        constraints = [
+            models.UniqueConstraint(fields=['mailing', 'day'],
+                                    name='mailingdailystats_mailing_day'),
+        ]
+
+
+class OwnerStats(models.Model):
+    """Счетчики доставки по всем рассылкам владельца."""
+
+    owner = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='mailing_stats'
+    )
+    sent = models.PositiveBigIntegerField(default=0)
+    failed = models.PositiveBigIntegerField(default=0)
+    last_attempt_time = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def success_rate(self):
+        total = self.sent + self.failed
+        return self.sent / total * 100 if total else None
+
+    def __str__(self):
+        return f"Статистика владельца {self.owner_id}"
+
+    class Meta:
+        verbose_name = "Статистика владельца"
+        verbose_name_plural = "Статистика владельцев"
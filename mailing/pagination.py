@@ -0,0 +1,116 @@
+"""Keyset-пагинация (по курсору) без OFFSET.
+
+Страница выбирается условием «строго после последней записи предыдущей
+страницы» по упорядочивающим полям, поэтому стоимость любой страницы
+одинакова и равна одному индексному поиску плюс page_size строк.
+"""
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+DIRECTION_NEXT = 'n'
+DIRECTION_PREVIOUS = 'p'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+@dataclass
+class CursorPage:
+    object_list: list
+    next_cursor: str | None
+    previous_cursor: str | None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """Делит queryset на страницы по полям ordering (например,
+    ('-attempt_time', '-id')). Последнее поле должно быть уникальным."""
+
+    def __init__(self, queryset, ordering, page_size):
+        self.queryset = queryset
+        self.ordering = list(ordering)
+        self.page_size = page_size
+        self.fields = [
+            queryset.model._meta.get_field(name.lstrip('-'))
+            for name in self.ordering
+        ]
+
+    def encode(self, obj, direction):
+        values = [field.value_to_string(obj) for field in self.fields]
+        raw = json.dumps([direction, values], separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            direction, values = json.loads(base64.urlsafe_b64decode(padded))
+            if direction not in (DIRECTION_NEXT, DIRECTION_PREVIOUS) \
+                    or len(values) != len(self.fields):
+                raise InvalidCursor(cursor)
+            return direction, [
+                field.to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            raise InvalidCursor(cursor)
+
+    def seek(self, ordering, values):
+        """Условие «после values» для порядка ordering:
+        (a > x) OR (a = x AND b > y) OR ..."""
+        condition = Q()
+        for index, name in enumerate(ordering):
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            term = Q(**{f'{self.fields[index].name}__{lookup}': values[index]})
+            for field, value in zip(self.fields[:index], values[:index]):
+                term &= Q(**{field.name: value})
+            condition |= term
+        return condition
+
+    def page(self, cursor=None):
+        direction, values = DIRECTION_NEXT, None
+        if cursor:
+            direction, values = self.decode(cursor)
+
+        ordering = self.ordering
+        if direction == DIRECTION_PREVIOUS:
+            ordering = [
+                name[1:] if name.startswith('-') else f'-{name}'
+                for name in ordering
+            ]
+
+        queryset = self.queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self.seek(ordering, values))
+        items = list(queryset[:self.page_size + 1])
+        has_more = len(items) > self.page_size
+        items = items[:self.page_size]
+
+        if direction == DIRECTION_PREVIOUS:
+            items.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        return CursorPage(
+            object_list=items,
+            next_cursor=(
+                self.encode(items[-1], DIRECTION_NEXT)
+                if items and has_next else None
+            ),
+            previous_cursor=(
+                self.encode(items[0], DIRECTION_PREVIOUS)
+                if items and has_previous else None
+            ),
+        )
@@ -0,0 +1,144 @@
+"""Персонализация писем: подстановки вида {{ full_name }} в теме и тексте.
+
+Шаблон сообщения разбирается один раз и хранится в кеше процесса по
+ключу (id сообщения, updated_at): при отправке рассылки каждому
+получателю остается один вызов str.format_map на тему и текст. Значения
+подстановок вычисляются по запросу и один раз на получателя.
+"""
+import base64
+import re
+import threading
+
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+
+PLACEHOLDER_RE = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+PLACEHOLDERS = {
+    'full_name': 'Ф.И.О. получателя',
+    'email': 'email получателя',
+    'unsubscribe_url': 'ссылка для отписки',
+}
+
+UNSUBSCRIBE_SALT = 'mailing.unsubscribe'
+# Сколько скомпилированных сообщений держать в памяти процесса
+COMPILED_CACHE_SIZE = 256
+
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+
+def unknown_placeholders(text):
+    return sorted(set(PLACEHOLDER_RE.findall(text)) - PLACEHOLDERS.keys())
+
+
+def compile_text(text):
+    """Превращает текст в шаблон для str.format_map. Неизвестные
+    подстановки остаются в тексте как есть."""
+    parts = []
+    position = 0
+    for match in PLACEHOLDER_RE.finditer(text):
+        if match.group(1) not in PLACEHOLDERS:
+            continue
+        parts.append(text[position:match.start()]
+                     .replace('{', '{{').replace('}', '}}'))
+        parts.append(f'{{{match.group(1)}}}')
+        position = match.end()
+    if not parts:
+        return None
+    parts.append(text[position:].replace('{', '{{').replace('}', '}}'))
+    return ''.join(parts)
+
+
+class UnsubscribeSigner:
+    """Подпись ссылок отписки: HMAC-SHA256 от id получателя с ключом,
+    производным от SECRET_KEY. Ключ вычисляется один раз, на каждое
+    письмо остаются copy() и digest() готового HMAC."""
+
+    def __init__(self):
+        self.base = salted_hmac(UNSUBSCRIBE_SALT, b'', algorithm='sha256')
+
+    def signature(self, value):
+        mac = self.base.copy()
+        mac.update(value.encode())
+        return base64.urlsafe_b64encode(mac.digest()).rstrip(b'=').decode()
+
+    def sign(self, recipient_id):
+        value = str(recipient_id)
+        return f'{value}:{self.signature(value)}'
+
+    def unsign(self, token):
+        """Возвращает id получателя или бросает signing.BadSignature."""
+        value, _, signature = token.partition(':')
+        if not value.isdigit() or not constant_time_compare(
+            signature, self.signature(value)
+        ):
+            raise signing.BadSignature(f'Неверная подпись: {token}')
+        return int(value)
+
+
+class RecipientContext(dict):
+    """Значения подстановок одного получателя, вычисляемые по запросу."""
+
+    def __init__(self, recipient, message):
+        super().__init__()
+        self.recipient = recipient
+        self.message = message
+
+    def __missing__(self, key):
+        if key == 'unsubscribe_url':
+            value = (f'{self.message.unsubscribe_prefix}'
+                     f'{self.message.signer.sign(self.recipient.pk)}/')
+        else:
+            value = getattr(self.recipient, key)
+        self[key] = value
+        return value
+
+
+class CompiledMessage:
+    """Разобранные тема и текст сообщения."""
+
+    def __init__(self, subject, body):
+        self.subject = subject
+        self.body = body
+        self.subject_format = compile_text(subject)
+        self.body_format = compile_text(body)
+        # '/mailing/unsubscribe/-/' -> '/mailing/unsubscribe/'
+        self.unsubscribe_prefix = (
+            settings.MAILING_SITE_URL.rstrip('/')
+            + reverse('mailing:unsubscribe', args=['-'])[:-2]
+        )
+        self.signer = UnsubscribeSigner()
+
+    def context(self, recipient):
+        return RecipientContext(recipient, self)
+
+    def render(self, context):
+        """Возвращает (тема, текст) для получателя. Текст без подстановок
+        не копируется."""
+        subject = self.subject
+        if self.subject_format is not None:
+            # Перевод строки в теме сломал бы заголовок письма
+            subject = ' '.join(
+                self.subject_format.format_map(context).splitlines()
+            )
+        body = self.body
+        if self.body_format is not None:
+            body = self.body_format.format_map(context)
+        return subject, body
+
+
+def get_compiled(message):
+    """Возвращает CompiledMessage из кеша или разбирает сообщение."""
+    key = (message.pk, message.updated_at)
+    compiled = _compiled.get(key)
+    if compiled is None:
+        compiled = CompiledMessage(message.subject, message.body)
+        with _compiled_lock:
+            if len(_compiled) >= COMPILED_CACHE_SIZE:
+                # Вытесняем самую старую запись (порядок вставки)
+                _compiled.pop(next(iter(_compiled)), None)
+            _compiled[key] = compiled
+    return compiled
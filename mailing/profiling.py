@@ -0,0 +1,112 @@
+"""Профилирование доставки по фазам.
+
+Движки доставки отмечают время каждой фазы отправки сигналом
+delivery_phase (без подписчиков он почти ничего не стоит). PhaseProfiler
+подписывается на него на время работы (run_mail_workers --profile),
+а затем печатает, сколько времени ушло на каждую фазу. Если задан файл,
+профилировщик еще и включает cProfile (до Python 3.12 — отдельно в каждом
+потоке, созданном за это время; с 3.12 один профилировщик видит все
+потоки) и сохраняет общий профиль в формате pstats
+(python -m pstats <файл>).
+
+Время фаз суммируется по всем потокам и корутинам, поэтому при
+параллельной отправке сумма больше прошедшего времени; доля фазы
+считается от суммы всех фаз.
+"""
+import cProfile
+import pstats
+import sys
+import threading
+import time
+
+from .signals import delivery_phase
+
+
+# С Python 3.12 cProfile профилирует все потоки, а второй профилировщик
+# в новом потоке не включается (ValueError) — поток умирает, не начав работу
+PER_THREAD_PROFILES = sys.version_info < (3, 12)
+
+
+PHASE_FETCH = 'fetch'
+PHASE_BUILD = 'build'
+PHASE_THROTTLE = 'throttle'
+PHASE_CONNECT = 'connect'
+PHASE_DATA = 'data'
+PHASE_WRITE = 'write'
+
+PHASES = {
+    PHASE_FETCH: 'чтение пачки получателей и проверка стоп-листа',
+    PHASE_BUILD: 'сборка письма по шаблону',
+    PHASE_THROTTLE: 'ожидание ограничителя скорости',
+    PHASE_CONNECT: 'подключение к SMTP (EHLO, STARTTLS, AUTH)',
+    # smtplib сериализует письмо в MIME внутри send_messages
+    PHASE_DATA: 'передача письма (MAIL, RCPT, DATA)',
+    PHASE_WRITE: 'запись попыток и счетчиков в БД',
+}
+
+
+class PhaseProfiler:
+    """Контекстный менеджер: собирает время фаз доставки, а при заданном
+    output — профиль cProfile всех потоков."""
+
+    def __init__(self, output=None):
+        self.output = output
+        self.lock = threading.Lock()
+        # {фаза: [число замеров, секунд]}
+        self.phases = {}
+        self.profiles = []
+        self.started = None
+        self.elapsed = 0.0
+
+    def record(self, sender, duration, **kwargs):
+        with self.lock:
+            phase = self.phases.setdefault(sender, [0, 0.0])
+            phase[0] += 1
+            phase[1] += duration
+
+    def profile_thread(self, *args):
+        # threading.setprofile вызывает функцию первым событием нового
+        # потока; enable() заменяет ее профилировщиком этого потока
+        profile = cProfile.Profile()
+        with self.lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+    def __enter__(self):
+        delivery_phase.connect(self.record)
+        if self.output:
+            if PER_THREAD_PROFILES:
+                threading.setprofile(self.profile_thread)
+            self.profile_thread()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self.started
+        delivery_phase.disconnect(self.record)
+        if self.output:
+            if PER_THREAD_PROFILES:
+                threading.setprofile(None)
+            self.profiles[0].disable()
+            pstats.Stats(*self.profiles).dump_stats(self.output)
+
+    def report(self):
+        """Строки отчета: фазы в порядке прохождения письма."""
+        total = sum(seconds for _, seconds in self.phases.values())
+        lines = [
+            f'Фазы доставки за {self.elapsed:.2f} с '
+            f'(время фаз суммируется по потокам):',
+            f'{"фаза":<10}{"замеров":>10}{"всего, с":>11}'
+            f'{"среднее, мс":>13}{"доля":>8}',
+        ]
+        for phase in [*PHASES, *(set(self.phases) - set(PHASES))]:
+            count, seconds = self.phases.get(phase, (0, 0.0))
+            average = seconds / count * 1000 if count else 0.0
+            share = seconds / total if total else 0.0
+            lines.append(
+                f'{phase:<10}{count:>10}{seconds:>11.3f}{average:>13.3f}'
+                f'{share:>8.1%}  {PHASES.get(phase, "")}'
+            )
+        if self.output:
+            lines.append(f'Профиль cProfile сохранен в {self.output}')
+        return lines
@@ -0,0 +1,98 @@
+"""Прогресс диапазона задания: возобновление после сбоя.
+
+Получатели диапазона обходятся по возрастанию pk, и вместе с каждой
+пачкой попыток в той же транзакции сохраняются два числа:
+
+- cursor — все получатели с pk <= cursor уже обработаны;
+- high_water — наибольший pk получателя, по которому записана попытка.
+
+Многопоточный и asyncio движки завершают письма не строго по порядку,
+поэтому между cursor и high_water могут быть и обработанные,
+и необработанные получатели. Воркер, получивший диапазон после сбоя,
+продолжает обход с cursor, а получателей из этого окна сверяет
+с журналом попыток — окно не больше нескольких пачек, так что
+возобновление стоит пропорционально оставшейся части рассылки.
+"""
+import bisect
+import threading
+
+from .models import MailingAttempt, MailingChunk
+
+
+class DeliveryProgress:
+    """Курсор диапазона, арендованного воркером worker_id. Выдача новых
+    пачек прекращается, если should_stop() вернул True или аренду
+    перехватил другой воркер; тогда interrupted становится True."""
+
+    def __init__(self, chunk, worker_id, should_stop=None):
+        self.chunk = chunk
+        self.worker_id = worker_id
+        self.should_stop = should_stop
+        self.interrupted = False
+        self.lost = False
+        self.cursor = chunk.cursor
+        self.high_water = chunk.high_water
+        self.lock = threading.Lock()
+        # Выданные, но еще не записанные пачки: последний pk и остаток
+        self.last_pks = []
+        self.remaining = []
+
+    def stopped(self):
+        return self.lost or (self.should_stop is not None
+                             and self.should_stop())
+
+    def batches(self, mailing, batch_size, recipient_batches):
+        """Оборачивает recipient_batches(mailing, batch_size, after,
+        until): пропускает уже обработанных получателей и учитывает
+        выданные пачки."""
+        for batch in recipient_batches(mailing, batch_size, self.cursor,
+                                       self.chunk.last_pk):
+            if self.stopped():
+                self.interrupted = True
+                return
+            last_pk = batch[-1].pk
+            if batch[0].pk <= self.chunk.high_water:
+                batch = self.skip_processed(mailing, batch)
+            with self.lock:
+                self.last_pks.append(last_pk)
+                self.remaining.append(len(batch))
+            if batch:
+                yield batch
+
+    def skip_processed(self, mailing, batch):
+        processed = set(MailingAttempt.objects.filter(
+            mailing=mailing,
+            recipient_id__in=[recipient.pk for recipient in batch
+                              if recipient.pk <= self.chunk.high_water],
+            attempt_time__gte=self.chunk.created_at,
+        ).values_list('recipient_id', flat=True))
+        return [recipient for recipient in batch
+                if recipient.pk not in processed]
+
+    def written(self, attempts):
+        """Отмечает записанные попытки и сдвигает cursor по полностью
+        записанным пачкам."""
+        with self.lock:
+            for attempt in attempts:
+                pk = attempt.recipient_id
+                self.high_water = max(self.high_water, pk)
+                index = bisect.bisect_left(self.last_pks, pk)
+                if index < len(self.remaining):
+                    self.remaining[index] -= 1
+            done = 0
+            while done < len(self.remaining) and self.remaining[done] <= 0:
+                done += 1
+            if done:
+                self.cursor = self.last_pks[done - 1]
+                del self.last_pks[:done]
+                del self.remaining[:done]
+
+    def save(self, attempts):
+        """Вызывается в транзакции записи попыток. Если диапазон уже
+        арендован другим воркером, попытки сохраняются, но курсор
+        не трогается, а выдача пачек прекращается."""
+        self.written(attempts)
+        if not MailingChunk.objects.filter(
+            pk=self.chunk.pk, claimed_by=self.worker_id,
+        ).update(cursor=self.cursor, high_water=self.high_water):
+            self.lost = True
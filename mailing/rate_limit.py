@@ -0,0 +1,182 @@
+"""Адаптивное ограничение скорости отправки на SMTP-релей.
+
+На каждый релей (хост, порт, учетная запись) заводится ведро токенов:
+одно письмо — один токен. Состояние ведра лежит в маленьком файле
+в MAILING_RATE_LIMIT_DIR и меняется под блокировкой flock, поэтому
+скорость делят все потоки и процессы-воркеры узла.
+
+Скорость подстраивается под релей: ответ-троттлинг (421/451) вдвое
+снижает ее (не чаще раза в DECREASE_INTERVAL), каждое принятое письмо
+понемногу поднимает — на RECOVERY от текущей скорости за секунду
+успешной отправки. Так отправка держится у предела, который релей
+готов принять, а не на заранее выбранной осторожной скорости.
+"""
+import hashlib
+import os
+import smtplib
+import struct
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: ведро общее только для потоков процесса
+    fcntl = None
+
+
+# Во сколько раз снижается скорость при троттлинге
+DECREASE_FACTOR = 0.5
+# Повторное снижение не раньше чем через столько секунд: пачка отказов
+# на одновременно отправленные письма — это один сигнал, а не десять
+DECREASE_INTERVAL = 1.0
+# Доля текущей скорости, на которую она растет за секунду без отказов
+RECOVERY = 0.1
+
+# rate, tokens, updated_at, decreased_at
+STATE = struct.Struct('<4d')
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def smtp_codes(error):
+    """Коды ответа SMTP из исключения smtplib или aiosmtplib."""
+    codes = set()
+    code = getattr(error, 'smtp_code', None) or getattr(error, 'code', None)
+    if isinstance(code, int):
+        codes.add(code)
+    recipients = getattr(error, 'recipients', None)
+    if isinstance(recipients, dict):
+        # smtplib: {адрес: (код, ответ)}
+        codes.update(code for code, _ in recipients.values())
+    elif isinstance(recipients, list):
+        # aiosmtplib: список SMTPRecipientRefused
+        codes.update(getattr(item, 'code', None) for item in recipients)
+    codes.discard(None)
+    return codes
+
+
+def is_throttled(error):
+    return bool(smtp_codes(error) & set(settings.MAILING_THROTTLE_CODES))
+
+
+def closes_session(error):
+    """421 — релей закрывает сессию, соединение нужно открыть заново."""
+    return (isinstance(error, smtplib.SMTPServerDisconnected)
+            or 421 in smtp_codes(error))
+
+
+class TokenBucket:
+    """Ведро токенов одного релея, общее для процессов узла."""
+
+    def __init__(self, key, rate, min_rate, max_rate, burst, directory=None):
+        self.key = key
+        self.initial_rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.path = None
+        if directory is not None and fcntl is not None:
+            os.makedirs(directory, exist_ok=True)
+            name = hashlib.md5(key.encode()).hexdigest()[:16]
+            self.path = os.path.join(directory, f'{name}.bucket')
+        self.lock = threading.Lock()
+        self.fd = None
+        self.pid = None
+        self.state = None
+
+    def _open(self):
+        # Дескриптор, унаследованный через fork, делит flock с родителем
+        if self.fd is None or self.pid != os.getpid():
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self.pid = os.getpid()
+        return self.fd
+
+    def _update(self, change):
+        """Применяет change(state, now) к состоянию под блокировкой."""
+        with self.lock:
+            now = time.time()
+            if self.path is None:
+                self.state = change(self.state or self._initial(now), now)
+                return self.state
+            fd = self._open()
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                data = os.pread(fd, STATE.size, 0)
+                state = (STATE.unpack(data) if len(data) == STATE.size
+                         else self._initial(now))
+                state = change(state, now)
+                os.pwrite(fd, STATE.pack(*state), 0)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            return state
+
+    def _initial(self, now):
+        return self.initial_rate, self.burst, now, 0.0
+
+    def _refill(self, state, now):
+        rate, tokens, updated_at, decreased_at = state
+        rate = min(max(rate, self.min_rate), self.max_rate)
+        elapsed = max(now - updated_at, 0.0)
+        return rate, min(self.burst, tokens + elapsed * rate), decreased_at
+
+    def reserve(self):
+        """Забирает токен и возвращает, сколько секунд подождать перед
+        отправкой. Токен берется в долг, поэтому ожидающие отправители
+        выстраиваются в очередь, а не спорят за каждый новый токен."""
+        def take(state, now):
+            rate, tokens, decreased_at = self._refill(state, now)
+            return rate, tokens - 1, now, decreased_at
+
+        rate, tokens, _, _ = self._update(take)
+        return -tokens / rate if tokens < 0 else 0.0
+
+    def acquire(self):
+        if wait := self.reserve():
+            time.sleep(wait)
+
+    def on_success(self):
+        def increase(state, now):
+            rate, tokens, decreased_at = self._refill(state, now)
+            rate = min(rate + RECOVERY, self.max_rate)
+            return rate, tokens, now, decreased_at
+
+        self._update(increase)
+
+    def on_throttle(self):
+        def decrease(state, now):
+            rate, tokens, decreased_at = self._refill(state, now)
+            if now - decreased_at < DECREASE_INTERVAL:
+                return rate, tokens, now, decreased_at
+            # Ведро опустошается: релей уже сказал, что мы спешим
+            return (max(rate * DECREASE_FACTOR, self.min_rate),
+                    min(tokens, 0.0), now, now)
+
+        return self._update(decrease)[0]
+
+    @property
+    def rate(self):
+        return self._update(lambda state, now: state)[0]
+
+
+def get_limiter(host, port, username=None):
+    """Возвращает ведро релея или None, если ограничение выключено."""
+    if not settings.MAILING_RATE_LIMIT or not host:
+        return None
+    key = f'{host}:{port}:{username or ""}'
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = TokenBucket(
+                key,
+                rate=settings.MAILING_RATE_LIMIT,
+                min_rate=settings.MAILING_RATE_LIMIT_MIN,
+                max_rate=settings.MAILING_RATE_LIMIT_MAX,
+                burst=settings.MAILING_RATE_LIMIT_BURST,
+                directory=settings.MAILING_RATE_LIMIT_DIR
+                or os.path.join(tempfile.gettempdir(), 'mailing-rate-limit'),
+            )
+    return limiter
@@ -0,0 +1,155 @@
+"""Срок хранения журнала попыток: итоги по дням и архив старых строк.
+
+Попытки старше MAILING_ATTEMPT_RETENTION_DAYS дней сворачиваются
+в MailingDailyStats (итоги рассылки за день), сами строки дописываются
+в сжатые NDJSON-файлы архива по дню попытки
+(MAILING_ARCHIVE_DIR/attempts-YYYY-MM-DD.ndjson.gz) и удаляются
+из журнала. Счетчики MailingStats и OwnerStats при этом не меняются.
+
+Журнал обходится пачками по индексу (attempt_time, id). Пачка сначала
+записывается в архив и сбрасывается на диск, затем в одной короткой
+транзакции прибавляются итоги и удаляются строки. Между пачками делается
+пауза, поэтому запись попыток отправкой на SQLite ждет блокировку
+не дольше одной пачки. Если процесс упадет между архивом и транзакцией,
+при следующем запуске пачка попадет в архив повторно (повторы
+отбрасываются по id), но итоги не удвоятся и строки не потеряются.
+
+Попытки рассылок с незавершенными заданиями или очередью повторов
+не трогаются: по журналу отправка пропускает уже обработанных
+получателей.
+"""
+import gzip
+import os
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .exporters import ATTEMPT_COLUMNS, render_ndjson
+from .models import MailingAttempt, MailingDailyStats, MailingJob, MailingRetry
+
+
+ARCHIVE_COLUMNS = (*ATTEMPT_COLUMNS, 'smtp_code')
+
+STATUS_FIELDS = {
+    MailingAttempt.STATUS_SUCCESS: 'sent',
+    MailingAttempt.STATUS_FAILED: 'failed',
+    MailingAttempt.STATUS_DEFERRED: 'deferred',
+}
+
+
+@dataclass
+class ArchiveResult:
+    attempts: int = 0
+    batches: int = 0
+    files: int = 0
+
+
+def day_getter():
+    """Функция «дата попытки в текущем часовом поясе». Пояс берется один
+    раз: timezone.localdate() на каждой строке заметно дороже."""
+    if not settings.USE_TZ:
+        return lambda moment: moment.date()
+    zone = timezone.get_current_timezone()
+    return lambda moment: moment.astimezone(zone).date()
+
+
+def archive_path(directory, day):
+    return os.path.join(directory, f'attempts-{day.isoformat()}.ndjson.gz')
+
+
+def active_mailing_ids():
+    """Рассылки, чей журнал еще нужен отправке."""
+    jobs = MailingJob.objects.filter(
+        status__in=[MailingJob.STATUS_PENDING, MailingJob.STATUS_RUNNING],
+    ).values_list('mailing_id', flat=True)
+    retries = MailingRetry.objects.order_by().values_list(
+        'mailing_id', flat=True,
+    ).distinct()
+    return set(jobs) | set(retries)
+
+
+def write_archive(directory, rows):
+    """Дописывает строки в файлы архива по дню попытки. Каждый вызов
+    добавляет к файлу отдельный gzip-член: такой файл читается целиком
+    обычным gzip/zcat. Возвращает множество затронутых файлов."""
+    attempt_day = day_getter()
+    by_day = {}
+    for row in rows:
+        by_day.setdefault(attempt_day(row.attempt_time), []).append(row)
+    paths = set()
+    for day, day_rows in by_day.items():
+        path = archive_path(directory, day)
+        with open(path, 'ab') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as archive:
+                for chunk in render_ndjson([day_rows], ARCHIVE_COLUMNS):
+                    archive.write(chunk.encode('utf-8'))
+            raw.flush()
+            os.fsync(raw.fileno())
+        paths.add(path)
+    return paths
+
+
+def add_daily_totals(rows):
+    """Прибавляет попытки пачки к итогам рассылок по дням."""
+    attempt_day = day_getter()
+    totals = {}
+    for row in rows:
+        stats = totals.setdefault(
+            (row.mailing_id, attempt_day(row.attempt_time)),
+            {'sent': 0, 'failed': 0, 'deferred': 0},
+        )
+        stats[STATUS_FIELDS[row.status]] += 1
+        # Пачка упорядочена по времени попытки
+        stats['last_attempt_time'] = row.attempt_time
+    for (mailing_id, day), stats in totals.items():
+        last_attempt_time = Value(stats.pop('last_attempt_time'))
+        changes = {field: F(field) + count for field, count in stats.items()}
+        changes['last_attempt_time'] = Greatest(
+            Coalesce('last_attempt_time', last_attempt_time),
+            last_attempt_time,
+        )
+        lookup = {'mailing_id': mailing_id, 'day': day}
+        counters = MailingDailyStats.objects.filter(**lookup)
+        if not counters.update(**changes):
+            MailingDailyStats.objects.get_or_create(**lookup)
+            counters.update(**changes)
+
+
+def archive_attempts(before, directory, batch_size=1000, pause=0.0):
+    """Переносит попытки с attempt_time < before в итоги и архив
+    и возвращает ArchiveResult."""
+    os.makedirs(directory, exist_ok=True)
+    rows = (
+        MailingAttempt.objects.filter(attempt_time__lt=before)
+        .exclude(mailing_id__in=list(active_mailing_ids()))
+        .order_by('attempt_time', 'id')
+        .values_list(*ARCHIVE_COLUMNS, named=True)
+    )
+    result = ArchiveResult()
+    paths = set()
+    # Строки пропущенных рассылок остаются в журнале, поэтому следующая
+    # пачка ищется после последней обработанной, а не с начала индекса.
+    # Условие записано через >= и NOT: с OR SQLite сортирует весь остаток
+    # вместо чтения индекса по порядку
+    after = Q()
+    while batch := list(rows.filter(after)[:batch_size]):
+        paths |= write_archive(directory, batch)
+        with transaction.atomic():
+            add_daily_totals(batch)
+            MailingAttempt.objects.filter(
+                pk__in=[row.id for row in batch],
+            ).delete()
+        result.attempts += len(batch)
+        result.batches += 1
+        last = batch[-1]
+        after = (Q(attempt_time__gte=last.attempt_time)
+                 & ~Q(attempt_time=last.attempt_time, id__lte=last.id))
+        if pause:
+            time.sleep(pause)
+    result.files = len(paths)
+    return result
@@ -0,0 +1,119 @@
+"""Классификация ошибок SMTP и очередь повторных отправок.
+
+Ответ 4xx и обрыв соединения считаются временными ошибками: попытка
+записывается со статусом deferred, а получатель попадает в MailingRetry
+со временем следующей попытки (экспоненциальная задержка со случайной
+добавкой). Ответ 5xx и прочие ошибки — окончательный отказ.
+
+Очередь разбирают воркеры между заданиями (jobs.process_due_retries):
+порция повторов захватывается условным UPDATE с арендой на RETRY_LEASE,
+поэтому одну запись не возьмут два воркера, а записи упавшего воркера
+снова станут доступны после окончания аренды.
+"""
+import random
+import smtplib
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Mailing, MailingAttempt, MailingRetry, Recipient
+from .rate_limit import smtp_codes
+from .suppression import normalize, suppressed_emails
+
+
+# На сколько захваченная порция повторов скрыта от других воркеров
+RETRY_LEASE = timedelta(minutes=10)
+
+
+def classify(error):
+    """Возвращает (код ответа SMTP или None, временная ли ошибка)."""
+    codes = smtp_codes(error)
+    if codes:
+        # Один окончательный отказ важнее временных
+        code = max(codes)
+        return code, 400 <= code < 500
+    if isinstance(error, (ConnectionError, TimeoutError,
+                          smtplib.SMTPServerDisconnected)):
+        return None, True
+    # Сетевые ошибки (DNS, сброс соединения); SMTPException тоже OSError
+    return None, (isinstance(error, OSError)
+                  and not isinstance(error, smtplib.SMTPException))
+
+
+def next_attempt_at(retries, now=None):
+    """Время повтора после retries уже выполненных повторов: задержка
+    удваивается, половина ее случайна, чтобы отложенные одновременно
+    письма не вернулись к релею одной волной."""
+    delay = min(settings.MAILING_RETRY_MAX_DELAY,
+                settings.MAILING_RETRY_BASE_DELAY * 2 ** retries)
+    delay = delay / 2 + random.uniform(0, delay / 2)
+    return (now or timezone.now()) + timedelta(seconds=delay)
+
+
+def schedule_retries(mailing, deferred, resolved):
+    """Сохраняет отложенных получателей и убирает из очереди тех,
+    чей повтор завершился (успехом или окончательной ошибкой)."""
+    if deferred:
+        MailingRetry.objects.bulk_create(
+            deferred,
+            update_conflicts=True,
+            unique_fields=['mailing', 'recipient'],
+            update_fields=['retries', 'next_attempt_at', 'claimed_by',
+                           'smtp_code', 'last_error'],
+        )
+    if resolved:
+        MailingRetry.objects.filter(
+            mailing=mailing, recipient_id__in=resolved,
+        ).delete()
+
+
+def claim_due_retries(limit):
+    """Захватывает до limit повторов, время которых пришло."""
+    now = timezone.now()
+    due = MailingRetry.objects.filter(next_attempt_at__lte=now)
+    ids = list(
+        due.order_by('next_attempt_at').values_list('pk', flat=True)[:limit]
+    )
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    due.filter(pk__in=ids).update(
+        claimed_by=token, next_attempt_at=now + RETRY_LEASE,
+    )
+    return list(MailingRetry.objects.filter(claimed_by=token))
+
+
+def drop_finished(mailing_id, retries):
+    """Убирает из порции получателей, которым письмо уже доставлено,
+    которые отписались или попали в стоп-лист, и возвращает
+    {recipient_id: выполнено повторов} для остальных."""
+    recipient_ids = [retry.recipient_id for retry in retries]
+    delivered = set(MailingAttempt.objects.filter(
+        mailing_id=mailing_id,
+        recipient_id__in=recipient_ids,
+        status=MailingAttempt.STATUS_SUCCESS,
+    ).values_list('recipient_id', flat=True))
+    delivered.update(Recipient.objects.filter(
+        Q(unsubscribed_at__isnull=False), pk__in=recipient_ids,
+    ).values_list('pk', flat=True))
+    emails = {
+        pk: normalize(email) for pk, email in Recipient.objects.filter(
+            pk__in=recipient_ids,
+        ).values_list('pk', 'email')
+    }
+    suppressed = suppressed_emails(
+        emails.values(),
+        Mailing.objects.values_list('owner_id', flat=True).get(pk=mailing_id),
+    )
+    delivered.update(pk for pk, email in emails.items() if email in suppressed)
+    if delivered:
+        MailingRetry.objects.filter(
+            mailing_id=mailing_id, recipient_id__in=delivered,
+        ).delete()
+    return {
+        retry.recipient_id: retry.retries
+        for retry in retries if retry.recipient_id not in delivered
+    }
@@ -0,0 +1,75 @@
+"""Роль пользователя и область видимости его данных.
+
+Роль вычисляется один раз за запрос (запоминается на объекте пользователя)
+и кешируется между запросами; кеш сбрасывается сигналами из
+mailing.signals при изменении членства в группах.
+"""
+import logging
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+MANAGER_GROUP_NAME = 'Managers'
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class UserRole:
+    user_id: int | None
+    is_manager: bool
+
+    def scope(self, queryset, owner_field='owner'):
+        """Ограничивает queryset объектами, доступными пользователю."""
+        if self.is_manager:
+            return queryset
+        return queryset.filter(**{owner_field: self.user_id})
+
+    def can_access(self, obj):
+        return self.is_manager or obj.owner_id == self.user_id
+
+
+def role_cache_key(user_id):
+    return f'mailing:role:{user_id}'
+
+
+def invalidate_roles(user_ids):
+    try:
+        cache.delete_many([role_cache_key(user_id) for user_id in user_ids])
+    except Exception as e:
+        logger.warning(f"Не удалось сбросить кеш ролей: {e}")
+
+
+def resolve_is_manager(user):
+    key = role_cache_key(user.pk)
+    try:
+        is_manager = cache.get(key)
+    except Exception as e:
+        logger.warning(f"Кеш ролей недоступен: {e}")
+        is_manager = None
+    if is_manager is None:
+        is_manager = user.groups.filter(name=MANAGER_GROUP_NAME).exists()
+        try:
+            cache.set(key, is_manager, settings.MAILING_ROLE_CACHE_TIMEOUT)
+        except Exception:
+            pass
+    return is_manager
+
+
+def get_role(user):
+    """Возвращает UserRole пользователя; в пределах запроса — без запросов
+    к БД и кешу после первого вызова."""
+    role = getattr(user, '_mailing_role', None)
+    if role is None:
+        if not user.is_authenticated:
+            role = UserRole(user_id=None, is_manager=False)
+        else:
+            role = UserRole(user_id=user.pk, is_manager=resolve_is_manager(user))
+        user._mailing_role = role
+    return role
+
+
+def scope_queryset(user, queryset, owner_field='owner'):
+    return get_role(user).scope(queryset, owner_field)
@@ -0,0 +1,165 @@
+"""Маршрутизация писем по домену получателя.
+
+Письма на разные почтовые домены можно отправлять через разные релеи:
+MAILING_ROUTES описывает маршруты в JSON вида
+
+    {"имя": {"domains": ["gmail.com", "googlemail.com"],
+             "host": "relay1.example.com", "port": 587,
+             "username": "", "password": "", "use_tls": true,
+             "connections": 4}}
+
+Домен получателя сопоставляется сначала целиком, затем по родительским
+доменам (mail.example.com → example.com); получатели без маршрута идут
+через маршрут по умолчанию — релей из EMAIL_*. Движки доставки делят
+каждую пачку получателей на группы по маршрутам, и группа отправляется
+через соединения своего маршрута: медленный или троттлящий релей
+не занимает соединения других. connections ограничивает число
+одновременных соединений маршрута (у синхронного движка — потоков
+с открытым соединением, у asyncio — сессий в пуле); если не задано,
+действует общая настройка движка.
+"""
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail import get_connection
+
+from .rate_limit import get_limiter
+
+
+DEFAULT_ROUTE = 'default'
+
+
+def recipient_domain(email):
+    return email.rpartition('@')[2].strip().lower()
+
+
+@dataclass(eq=False)
+class Route:
+    """Релей для группы доменов. connection_factory заменяет
+    подключение по host/port (так маршрут по умолчанию использует
+    фабрику соединений, переданную движку)."""
+
+    name: str
+    host: str
+    port: int = 25
+    username: str = ''
+    password: str = ''
+    use_tls: bool = False
+    use_ssl: bool = False
+    connections: Optional[int] = None
+    domains: tuple = ()
+    connection_factory: Optional[Callable] = None
+
+    def connection(self):
+        """Соединение синхронного движка (бэкенд EMAIL_BACKEND)."""
+        if self.connection_factory is not None:
+            return self.connection_factory()
+        return get_connection(
+            fail_silently=False,
+            host=self.host,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            use_tls=self.use_tls,
+            use_ssl=self.use_ssl,
+        )
+
+    def limiter(self):
+        return get_limiter(self.host, self.port, self.username)
+
+
+def default_route(connection_factory=None):
+    return Route(
+        name=DEFAULT_ROUTE,
+        host=settings.EMAIL_HOST,
+        port=settings.EMAIL_PORT,
+        username=settings.EMAIL_HOST_USER or '',
+        password=settings.EMAIL_HOST_PASSWORD or '',
+        use_tls=settings.EMAIL_USE_TLS,
+        use_ssl=getattr(settings, 'EMAIL_USE_SSL', False),
+        connection_factory=connection_factory,
+    )
+
+
+def load_routes(config):
+    """Маршруты из MAILING_ROUTES; ошибка настройки — ImproperlyConfigured."""
+    routes = []
+    seen = {}
+    for name, options in config.items():
+        options = dict(options)
+        domains = tuple(recipient_domain(domain)
+                        for domain in options.pop('domains', ()))
+        if not domains or not options.get('host'):
+            raise ImproperlyConfigured(
+                f'MAILING_ROUTES: у маршрута {name} должны быть заданы '
+                f'domains и host'
+            )
+        for domain in domains:
+            if domain in seen:
+                raise ImproperlyConfigured(
+                    f'MAILING_ROUTES: домен {domain} указан в маршрутах '
+                    f'{seen[domain]} и {name}'
+                )
+            seen[domain] = name
+        try:
+            route = Route(name=name, domains=domains, **options)
+        except TypeError as e:
+            raise ImproperlyConfigured(f'MAILING_ROUTES: маршрут {name}: {e}')
+        if route.connections is not None and route.connections < 1:
+            raise ImproperlyConfigured(
+                f'MAILING_ROUTES: у маршрута {name} connections меньше 1'
+            )
+        routes.append(route)
+    return routes
+
+
+class Router:
+    """Выбирает маршрут по домену получателя. Результат сопоставления
+    запоминается по домену: в рассылке доменов намного меньше, чем
+    получателей."""
+
+    def __init__(self, routes, default):
+        self.default = default
+        self.routes = [default, *routes]
+        self.domains = {domain: route
+                        for route in routes for domain in route.domains}
+        self.cache = {}
+
+    def route_for_domain(self, domain):
+        route = self.cache.get(domain)
+        if route is None:
+            route = self.default
+            parts = domain.split('.')
+            for index in range(len(parts)):
+                found = self.domains.get('.'.join(parts[index:]))
+                if found is not None:
+                    route = found
+                    break
+            self.cache[domain] = route
+        return route
+
+    def route(self, email):
+        return self.route_for_domain(recipient_domain(email))
+
+    def split(self, recipients):
+        """Делит пачку на {маршрут: получатели}. Внутри группы получатели
+        упорядочены по домену, чтобы письма одного домена шли подряд
+        по одному соединению."""
+        groups = {}
+        for recipient in recipients:
+            domain = recipient_domain(recipient.email)
+            groups.setdefault(self.route_for_domain(domain), []).append(
+                (domain, recipient)
+            )
+        return {
+            route: [recipient for _, recipient
+                    in sorted(items, key=lambda item: item[0])]
+            for route, items in groups.items()
+        }
+
+
+def get_router(connection_factory=None):
+    return Router(load_routes(settings.MAILING_ROUTES),
+                  default_route(connection_factory))
@@ -0,0 +1,127 @@
+"""Планировщик рассылок по времени.
+
+Держит в памяти кучу (heapq) событий, упорядоченных по времени
+наступления: запуск рассылки в start_time и ее завершение в end_time.
+Процесс спит ровно до ближайшего события; база перечитывается только
+в пределах окна rescan_interval через индексы (status, start_time)
+и (status, end_time), чтобы подхватывать новые и измененные рассылки.
+"""
+import heapq
+import logging
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .caching import invalidate_owners
+from .jobs import enqueue_mailing
+from .models import Mailing
+
+
+logger = logging.getLogger(__name__)
+
+ACTION_START = 'start'
+ACTION_FINISH = 'finish'
+
+
+class MailingScheduler:
+
+    def __init__(self, rescan_interval=60.0):
+        self.rescan_interval = timedelta(seconds=rescan_interval)
+        self.heap = []
+        self.scheduled = set()
+        self.next_rescan = None
+
+    def push(self, due, mailing_id, action):
+        key = (mailing_id, action, due)
+        if key not in self.scheduled:
+            self.scheduled.add(key)
+            heapq.heappush(self.heap, (due, mailing_id, action))
+
+    def rescan(self, now):
+        """Загружает события, наступающие до конца следующего окна."""
+        horizon = now + self.rescan_interval
+        to_start = Mailing.objects.filter(
+            status=Mailing.STATUS_CREATED,
+            start_time__lte=horizon,
+        ).values_list('pk', 'start_time')
+        to_finish = Mailing.objects.filter(
+            status=Mailing.STATUS_STARTED,
+            end_time__lte=horizon,
+        ).values_list('pk', 'end_time')
+        for mailing_id, due in to_start:
+            self.push(due, mailing_id, ACTION_START)
+        for mailing_id, due in to_finish:
+            self.push(due, mailing_id, ACTION_FINISH)
+        self.next_rescan = horizon
+
+    def start(self, mailing_id, now):
+        mailing = Mailing.objects.filter(
+            pk=mailing_id,
+            status=Mailing.STATUS_CREATED,
+            start_time__lte=now,
+        ).first()
+        if mailing is None:
+            # Рассылку успели изменить, удалить или запустить вручную
+            return
+        if mailing.end_time and mailing.end_time <= now:
+            logger.warning(
+                f"Рассылка {mailing_id}: окно отправки уже закрыто, "
+                f"рассылка завершена без отправки"
+            )
+            Mailing.objects.filter(
+                pk=mailing_id, status=Mailing.STATUS_CREATED,
+            ).update(status=Mailing.STATUS_FINISHED)
+            invalidate_owners([mailing.owner_id])
+            return
+        started = Mailing.objects.filter(
+            pk=mailing_id, status=Mailing.STATUS_CREATED,
+        ).update(status=Mailing.STATUS_STARTED)
+        if started:
+            invalidate_owners([mailing.owner_id])
+            job = enqueue_mailing(mailing)
+            logger.info(f"Рассылка {mailing_id} запущена (задание #{job.pk})")
+            if mailing.end_time:
+                self.push(mailing.end_time, mailing_id, ACTION_FINISH)
+
+    def finish(self, mailing_id, now):
+        finished = Mailing.objects.filter(
+            pk=mailing_id,
+            status=Mailing.STATUS_STARTED,
+            end_time__lte=now,
+        ).update(status=Mailing.STATUS_FINISHED)
+        if finished:
+            invalidate_owners(
+                Mailing.objects.filter(pk=mailing_id)
+                .values_list('owner_id', flat=True)
+            )
+            logger.info(f"Рассылка {mailing_id} завершена")
+
+    def run_due(self, now):
+        """Выполняет все наступившие события. Возвращает их количество."""
+        processed = 0
+        while self.heap and self.heap[0][0] <= now:
+            due, mailing_id, action = heapq.heappop(self.heap)
+            self.scheduled.discard((mailing_id, action, due))
+            if action == ACTION_START:
+                self.start(mailing_id, now)
+            else:
+                self.finish(mailing_id, now)
+            processed += 1
+        return processed
+
+    def seconds_until_next(self, now):
+        wake_at = self.next_rescan
+        if self.heap and self.heap[0][0] < wake_at:
+            wake_at = self.heap[0][0]
+        return max((wake_at - now).total_seconds(), 0.0)
+
+    def run(self, stop_event, once=False):
+        """Основной цикл: спит до ближайшего события или до перечитывания."""
+        while not stop_event.is_set():
+            now = timezone.now()
+            if self.next_rescan is None or now >= self.next_rescan:
+                self.rescan(now)
+            self.run_due(now)
+            if once:
+                break
+            stop_event.wait(self.seconds_until_next(timezone.now()))
@@ -0,0 +1,83 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete,
+)
+from django.dispatch import Signal, receiver
+
+from .caching import invalidate_owners
+from .models import Mailing, Message, Recipient, RecipientList
+from .roles import invalidate_roles
+
+
+# Сигналы для замеров доставки; без подписчиков почти ничего не стоят.
+# Отправлено (или отклонено) одно письмо: sender — движок доставки,
+# аргументы status и duration (секунды SMTP-транзакции).
+message_sent = Signal()
+# Записана пачка попыток вместе со счетчиками: sender — MailingAttempt,
+# аргументы mailing, count и duration (секунды, включая фиксацию).
+attempts_written = Signal()
+# Завершена фаза отправки (профилирование): sender — имя фазы
+# из mailing/profiling.py, аргумент duration (секунды).
+delivery_phase = Signal()
+
+
+@receiver(m2m_changed, sender=get_user_model().groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # instance — группа, pk_set — пользователи
+        if action == 'pre_clear':
+            invalidate_roles(instance.user_set.values_list('pk', flat=True))
+        elif action in ('post_add', 'post_remove'):
+            invalidate_roles(pk_set)
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_roles([instance.pk])
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # Переименование или удаление группы меняет роли всех ее участников
+    invalidate_roles(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Mailing)
+@receiver(post_save, sender=Message)
+@receiver(post_save, sender=Recipient)
+@receiver(post_save, sender=RecipientList)
+@receiver(post_delete, sender=Mailing)
+@receiver(post_delete, sender=Message)
+@receiver(post_delete, sender=Recipient)
+@receiver(post_delete, sender=RecipientList)
+def owner_data_changed(sender, instance, **kwargs):
+    invalidate_owners([instance.owner_id])
+
+
+@receiver(m2m_changed, sender=Mailing.recipients.through)
+def mailing_recipients_changed(sender, instance, action, reverse, pk_set,
+                               **kwargs):
+    if not action.startswith('post_'):
+        return
+    owner_ids = [instance.owner_id]
+    if reverse and pk_set:
+        # instance — получатель, pk_set — рассылки
+        owner_ids.extend(
+            Mailing.objects.filter(pk__in=pk_set)
+            .values_list('owner_id', flat=True)
+        )
+    invalidate_owners(owner_ids)
+
+
+@receiver(m2m_changed, sender=RecipientList.recipients.through)
+def recipient_list_members_changed(sender, instance, action, reverse, pk_set,
+                                   **kwargs):
+    if not action.startswith('post_'):
+        return
+    owner_ids = [instance.owner_id]
+    if reverse and pk_set:
+        # instance — получатель, pk_set — списки
+        owner_ids.extend(
+            RecipientList.objects.filter(pk__in=pk_set)
+            .values_list('owner_id', flat=True)
+        )
+    invalidate_owners(owner_ids)
@@ -0,0 +1,91 @@
+// Подбор получателей рассылки: подгружает варианты по мере ввода
+// и добавляет выбранных в <select multiple> формы.
+(function () {
+    'use strict';
+
+    var DEBOUNCE_MS = 250;
+
+    function init(container) {
+        var url = container.dataset.autocompleteUrl;
+        var input = container.querySelector('.recipient-autocomplete-input');
+        var results = container.querySelector('.recipient-autocomplete-results');
+        var select = container.querySelector('select');
+        var timer = null;
+        var request = 0;
+
+        function addOption(item) {
+            var value = String(item.id);
+            for (var i = 0; i < select.options.length; i++) {
+                if (select.options[i].value === value) {
+                    select.options[i].selected = true;
+                    return;
+                }
+            }
+            select.add(new Option(item.text, value, true, true));
+        }
+
+        function render(items) {
+            results.innerHTML = '';
+            items.forEach(function (item) {
+                var button = document.createElement('button');
+                button.type = 'button';
+                button.className = 'list-group-item list-group-item-action';
+                button.textContent = item.text;
+                button.addEventListener('click', function () {
+                    addOption(item);
+                    results.innerHTML = '';
+                    input.value = '';
+                    input.focus();
+                });
+                results.appendChild(button);
+            });
+        }
+
+        function search() {
+            var term = input.value.trim();
+            var current = ++request;
+            if (!term) {
+                render([]);
+                return;
+            }
+            fetch(url + '?q=' + encodeURIComponent(term), {
+                headers: {'X-Requested-With': 'XMLHttpRequest'},
+                credentials: 'same-origin'
+            })
+                .then(function (response) { return response.json(); })
+                .then(function (data) {
+                    // Ответ на устаревший запрос не перетирает новый
+                    if (current === request) {
+                        render(data.results);
+                    }
+                });
+        }
+
+        input.addEventListener('input', function () {
+            clearTimeout(timer);
+            timer = setTimeout(search, DEBOUNCE_MS);
+        });
+        input.addEventListener('keydown', function (event) {
+            // Enter в поле поиска не отправляет форму
+            if (event.key === 'Enter') {
+                event.preventDefault();
+            }
+        });
+        select.addEventListener('dblclick', function (event) {
+            if (event.target.tagName === 'OPTION') {
+                event.target.remove();
+            }
+        });
+        if (select.form) {
+            select.form.addEventListener('submit', function () {
+                for (var i = 0; i < select.options.length; i++) {
+                    select.options[i].selected = true;
+                }
+            });
+        }
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('.recipient-autocomplete').forEach(init);
+    });
+})();
@@ -0,0 +1,126 @@
+"""Сводные счетчики доставки (rollup) по рассылкам и владельцам.
+
+Счетчики увеличиваются в той же транзакции, что и bulk_create попыток,
+поэтому страницы и дашборды читают готовые значения одной строкой,
+не агрегируя журнал попыток.
+"""
+import time
+from itertools import chain
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .caching import invalidate_owners
+from .models import (
+    Mailing, MailingAttempt, MailingDailyStats, MailingStats, OwnerStats,
+)
+from .signals import attempts_written
+
+
+def increment_stats(mailing, sent, failed, last_attempt_time):
+    """Прибавляет счетчики рассылки и ее владельца атомарными UPDATE."""
+    if not sent and not failed:
+        return
+    changes = {
+        'sent': F('sent') + sent,
+        'failed': F('failed') + failed,
+        'last_attempt_time': Greatest(
+            Coalesce('last_attempt_time', Value(last_attempt_time)),
+            Value(last_attempt_time),
+        ),
+    }
+    for model, lookup in (
+        (MailingStats, {'mailing_id': mailing.pk}),
+        (OwnerStats, {'owner_id': mailing.owner_id}),
+    ):
+        counters = model.objects.filter(**lookup)
+        if not counters.update(**changes):
+            model.objects.get_or_create(**lookup)
+            counters.update(**changes)
+    invalidate_owners([mailing.owner_id])
+
+
+def write_attempts(mailing, attempts, also=None):
+    """Сохраняет пачку попыток и обновляет счетчики в одной транзакции.
+    also — функция, которая выполняется в той же транзакции (очередь
+    повторов, прогресс задания)."""
+    if not attempts:
+        return
+    started = time.perf_counter()
+    with transaction.atomic():
+        MailingAttempt.objects.bulk_create(attempts)
+        sent = sum(a.status == MailingAttempt.STATUS_SUCCESS for a in attempts)
+        # Отложенные попытки не считаются ни доставкой, ни отказом
+        failed = sum(a.status == MailingAttempt.STATUS_FAILED for a in attempts)
+        increment_stats(
+            mailing,
+            sent,
+            failed,
+            max(a.attempt_time for a in attempts),
+        )
+        if also is not None:
+            also()
+    attempts_written.send(
+        sender=MailingAttempt,
+        mailing=mailing,
+        count=len(attempts),
+        duration=time.perf_counter() - started,
+    )
+
+
+def rebuild_stats(batch_size=1000):
+    """Пересчитывает все счетчики по журналу попыток и итогам по дням
+    уже перенесенных в архив попыток (для заполнения и восстановления).
+    Возвращает количество рассылок со статистикой."""
+    per_mailing = (
+        MailingAttempt.objects.order_by()
+        .values('mailing_id')
+        .annotate(
+            sent=Count('pk', filter=Q(status=MailingAttempt.STATUS_SUCCESS)),
+            failed=Count('pk', filter=Q(status=MailingAttempt.STATUS_FAILED)),
+            last_attempt_time=Max('attempt_time'),
+        )
+    )
+    archived = (
+        MailingDailyStats.objects.order_by()
+        .values('mailing_id')
+        .annotate(
+            sent=Sum('sent'),
+            failed=Sum('failed'),
+            last_attempt_time=Max('last_attempt_time'),
+        )
+    )
+    with transaction.atomic():
+        owner_ids = set(OwnerStats.objects.values_list('owner_id', flat=True))
+        MailingStats.objects.all().delete()
+        OwnerStats.objects.all().delete()
+        totals = {}
+        for row in chain(per_mailing.iterator(), archived.iterator()):
+            total = totals.setdefault(row['mailing_id'], MailingStats(
+                mailing_id=row['mailing_id'],
+            ))
+            total.sent += row['sent']
+            total.failed += row['failed']
+            total.last_attempt_time = max(
+                filter(None, [total.last_attempt_time,
+                              row['last_attempt_time']]),
+                default=None,
+            )
+        rows = list(totals.values())
+        MailingStats.objects.bulk_create(rows, batch_size=batch_size)
+
+        per_owner = (
+            Mailing.objects.filter(stats__isnull=False).order_by()
+            .values('owner_id')
+            .annotate(
+                sent=Sum('stats__sent'),
+                failed=Sum('stats__failed'),
+                last_attempt_time=Max('stats__last_attempt_time'),
+            )
+        )
+        owner_rows = [OwnerStats(**row) for row in per_owner]
+        OwnerStats.objects.bulk_create(owner_rows, batch_size=batch_size)
+        owner_ids.update(row.owner_id for row in owner_rows)
+        invalidate_owners(owner_ids)
+    return len(rows)
@@ -0,0 +1,147 @@
+"""Стоп-лист адресов и его проверка при отправке.
+
+Адрес попадает в стоп-лист после жесткого отказа релея (коды
+MAILING_SUPPRESS_CODES, для всех владельцев), после отписки (для владельца
+рассылки) или вручную. Отправка проверяет каждую пачку получателей
+по фильтру Блума в памяти процесса: он загружается из таблицы один раз,
+а затем раз в MAILING_SUPPRESSION_REFRESH секунд дочитывает новые записи
+по pk. В фильтр попадают адреса всех записей, и общих, и владельцев.
+Фильтр не дает ложных отрицаний, а его срабатывания (настоящие, ложные
+~1% и записи других владельцев) сверяются с таблицей одним запросом
+на пачку, поэтому удаление адреса из стоп-листа тоже учитывается сразу.
+
+Фильтр использует встроенный hash(): он быстрее криптографических хешей
+и стабилен в пределах процесса (и его дочерних процессов после fork),
+а между процессами фильтр не передается.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Suppression
+
+
+# Сколько записей стоп-листа читать одним запросом при загрузке
+LOAD_BATCH_SIZE = 10000
+# Доля ложных срабатываний фильтра при заполнении до емкости
+ERROR_RATE = 0.01
+
+
+def normalize(email):
+    return email.strip().lower()
+
+
+class BloomFilter:
+    """Битовый массив на capacity элементов с долей ложных срабатываний
+    error_rate; позиции битов — двойное хеширование по половинам hash()."""
+
+    def __init__(self, capacity, error_rate=ERROR_RATE):
+        self.capacity = capacity
+        self.size = math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2
+        )
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def add(self, key):
+        h = hash(key)
+        position = h & 0xFFFFFFFF
+        step = (h >> 32 & 0xFFFFFFFF) | 1
+        bits, size = self.bits, self.size
+        for _ in range(self.hashes):
+            position = (position + step) % size
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        h = hash(key)
+        position = h & 0xFFFFFFFF
+        step = (h >> 32 & 0xFFFFFFFF) | 1
+        bits, size = self.bits, self.size
+        for _ in range(self.hashes):
+            position = (position + step) % size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+def suppressed_emails(emails, owner_id):
+    """Точная проверка по таблице: какие из адресов (в нижнем регистре)
+    в стоп-листе для всех или для владельца owner_id."""
+    return set(Suppression.objects.filter(
+        Q(owner__isnull=True) | Q(owner_id=owner_id),
+        email__in=list(emails),
+    ).values_list('email', flat=True))
+
+
+class SuppressionList:
+    """Фильтр Блума стоп-листа, общий для потоков процесса."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.last_pk = 0
+        self.entries = 0
+        self.refreshed_at = 0.0
+
+    def load_new(self):
+        """Дочитывает записи, добавленные после last_pk."""
+        entries = Suppression.objects.order_by('pk').values_list('pk', 'email')
+        while rows := list(entries.filter(pk__gt=self.last_pk)
+                           [:LOAD_BATCH_SIZE]):
+            for pk, email in rows:
+                self.bloom.add(email)
+            self.entries += len(rows)
+            self.last_pk = rows[-1][0]
+
+    def rebuild(self):
+        # Запас емкости вдвое, чтобы дочитывание не переполняло фильтр
+        capacity = max(settings.MAILING_SUPPRESSION_MIN_CAPACITY,
+                       2 * Suppression.objects.count())
+        self.bloom = BloomFilter(capacity)
+        self.last_pk = 0
+        self.entries = 0
+        self.load_new()
+
+    def refresh(self, force=False):
+        with self.lock:
+            if self.bloom is None:
+                self.rebuild()
+            elif force or (time.monotonic() - self.refreshed_at
+                           >= settings.MAILING_SUPPRESSION_REFRESH):
+                self.load_new()
+                if self.entries > self.bloom.capacity:
+                    self.rebuild()
+            else:
+                return
+            self.refreshed_at = time.monotonic()
+
+    def exclude(self, recipients, owner_id):
+        """Возвращает получателей пачки без адресов из стоп-листа."""
+        self.refresh()
+        bloom = self.bloom
+        candidates = {
+            email for recipient in recipients
+            if (email := normalize(recipient.email)) in bloom
+        }
+        if not candidates:
+            return recipients
+        suppressed = suppressed_emails(candidates, owner_id)
+        if not suppressed:
+            return recipients
+        return [recipient for recipient in recipients
+                if normalize(recipient.email) not in suppressed]
+
+
+suppressions = SuppressionList()
+
+
+def exclude_suppressed(recipients, owner_id):
+    return suppressions.exclude(recipients, owner_id)
+
+
+def suppress(entries):
+    """Добавляет записи Suppression; уже существующие пропускаются."""
+    Suppression.objects.bulk_create(entries, ignore_conflicts=True)
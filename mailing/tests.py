@@ -0,0 +1,816 @@
+import io
+import json
+import os
+import pstats
+import smtplib
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+
+from . import chunks, metrics
+from .chunks import (
+    Heartbeat, claim_chunk, finish_chunk, release_chunk,
+)
+from .delivery import (
+    AttemptWriter, deliver_mailing, deliver_threaded, iter_recipient_batches,
+    recipient_batches,
+)
+from .importers import RecipientImporter, import_recipients
+from .jobs import (
+    claim_job, enqueue_mailing, process_chunk, process_due_retries,
+)
+from .metrics import Shard
+from .models import (
+    Mailing, MailingAttempt, MailingChunk, MailingRetry, Message, Recipient,
+)
+from .profiling import PhaseProfiler
+from .progress import DeliveryProgress
+from .roles import MANAGER_GROUP_NAME, get_role, role_cache_key
+from .routing import get_router
+from .signals import message_sent
+
+
+# Тесты не требуют Redis: кеш — локальный в памяти процесса
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+def create_user(email, **extra_fields):
+    return get_user_model().objects.create_user(
+        email=email, password='password', username=email, **extra_fields,
+    )
+
+
+def create_manager(email):
+    user = create_user(email)
+    user.groups.add(Group.objects.get_or_create(name=MANAGER_GROUP_NAME)[0])
+    return user
+
+
+def create_mailing(owner, recipients=()):
+    message = Message.objects.create(subject='Тема', body='Текст',
+                                     owner=owner)
+    mailing = Mailing.objects.create(message=message, owner=owner)
+    mailing.recipients.set(recipients)
+    return mailing
+
+
+def expire_lease(chunk):
+    MailingChunk.objects.filter(pk=chunk.pk).update(
+        lease_until=timezone.now() - timedelta(seconds=1),
+    )
+
+
+def query_plan(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return ' | '.join(row[-1] for row in cursor.fetchall())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'план запроса в формате SQLite')
+@override_settings(CACHES=LOCMEM_CACHES)
+class AttemptQueryPlanTests(TestCase):
+    """Выборки попыток в списке и админке читают индексы, а не всю
+    таблицу с сортировкой в памяти."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = create_user('owner@example.com')
+        cls.manager = create_manager('manager@example.com')
+        cls.admin = get_user_model().objects.create_superuser(
+            email='admin@example.com', password='password', username='admin',
+        )
+        cls.recipient = Recipient.objects.create(
+            email='to@example.com', full_name='Получатель', owner=cls.owner,
+        )
+        # Фильтр админки по рассылке показывается, если рассылок больше одной
+        cls.mailing, other = (create_mailing(cls.owner, [cls.recipient])
+                              for _ in range(2))
+        MailingAttempt.objects.bulk_create(
+            MailingAttempt(mailing=mailing, recipient=cls.recipient,
+                           status=status)
+            for mailing in (cls.mailing, other)
+            for status in [MailingAttempt.STATUS_SUCCESS,
+                           MailingAttempt.STATUS_FAILED] * 5
+        )
+
+    def attempt_query_plans(self, user, url):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # {запрос: план} для выборок из журнала попыток (страница и COUNT)
+        plans = {query['sql']: query_plan(query['sql']) for query in queries
+                 if query['sql'].startswith('SELECT')
+                 and 'FROM "mailing_mailingattempt"' in query['sql']}
+        self.assertTrue(plans)
+        return plans
+
+    def assertUsesIndex(self, plans, index):
+        """Страница читается по индексу index в нужном порядке, остальные
+        запросы к журналу — тоже по индексу."""
+        for sql, plan in plans.items():
+            self.assertNotIn('USE TEMP B-TREE', plan)
+            self.assertRegex(plan, r'mailing_mailingattempt USING '
+                                   r'(COVERING )?INDEX')
+            if 'ORDER BY' in sql:
+                self.assertIn(f'USING INDEX {index}', plan)
+
+    def test_recipient_attempts_use_recipient_index(self):
+        queryset = MailingAttempt.objects.filter(recipient=self.recipient)
+        self.assertIn('USING INDEX attempt_recipient',
+                      query_plan(str(queryset.query)))
+
+    def test_attempt_list_filtered_by_mailing(self):
+        url = reverse('mailing:mailing_attempt_list')
+        plans = self.attempt_query_plans(
+            self.owner, f'{url}?mailing={self.mailing.pk}',
+        )
+        self.assertUsesIndex(plans, 'attempt_mailing_time')
+
+    def test_attempt_list_without_filters(self):
+        plans = self.attempt_query_plans(
+            self.manager, reverse('mailing:mailing_attempt_list'),
+        )
+        self.assertUsesIndex(plans, 'attempt_time_id')
+
+    def test_admin_filtered_by_mailing(self):
+        url = reverse('admin:mailing_mailingattempt_changelist')
+        plans = self.attempt_query_plans(
+            self.admin, f'{url}?mailing__id__exact={self.mailing.pk}',
+        )
+        self.assertUsesIndex(plans, 'attempt_mailing_time')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RoleResolverTests(TestCase):
+    """Роль пользователя: один запрос к группам за HTTP-запрос, между
+    запросами — из кеша, сброс при изменении членства в группах."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = create_user('owner@example.com')
+        cls.manager = create_manager('manager@example.com')
+        cls.mailing = create_mailing(cls.owner)
+
+    def setUp(self):
+        cache.clear()
+
+    def group_queries(self, queries):
+        return [query for query in queries
+                if 'FROM "auth_group"' in query['sql']]
+
+    def assertResolvesGroupOnce(self, user, url):
+        """Без роли в кеше страница ищет группы пользователя ровно один
+        раз, с ролью в кеше — ни разу, и запросов на один меньше."""
+        self.client.force_login(user)
+        # Прогрев кеша страниц, чтобы запросы ниже различались только ролью
+        self.client.get(url)
+        cache.delete(role_cache_key(user.pk))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.group_queries(queries)), 1)
+        with self.assertNumQueries(len(queries) - 1):
+            self.client.get(url)
+
+    def test_list_page_for_user(self):
+        self.assertResolvesGroupOnce(self.owner,
+                                     reverse('mailing:mailing_list'))
+
+    def test_list_page_for_manager(self):
+        self.assertResolvesGroupOnce(self.manager,
+                                     reverse('mailing:mailing_list'))
+
+    def test_detail_page_for_user(self):
+        self.assertResolvesGroupOnce(
+            self.owner, reverse('mailing:mailing_detail',
+                                args=[self.mailing.pk]),
+        )
+
+    def test_detail_page_for_manager(self):
+        self.assertResolvesGroupOnce(
+            self.manager, reverse('mailing:mailing_detail',
+                                  args=[self.mailing.pk]),
+        )
+
+    def test_role_memoized_on_user(self):
+        user = get_user_model().objects.get(pk=self.manager.pk)
+        with self.assertNumQueries(1):
+            for _ in range(3):
+                self.assertTrue(get_role(user).is_manager)
+        # Повторные вызовы за запрос не обращаются и к кешу
+        self.assertIs(get_role(user), get_role(user))
+        # Новый объект пользователя (следующий запрос) читает роль из кеша
+        user = get_user_model().objects.get(pk=self.manager.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(get_role(user).is_manager)
+
+    def fresh_role(self, user):
+        return get_role(get_user_model().objects.get(pk=user.pk))
+
+    def test_group_membership_change_clears_cached_role(self):
+        group = Group.objects.get(name=MANAGER_GROUP_NAME)
+        self.assertFalse(self.fresh_role(self.owner).is_manager)
+
+        self.owner.groups.add(group)
+        self.assertIsNone(cache.get(role_cache_key(self.owner.pk)))
+        self.assertTrue(self.fresh_role(self.owner).is_manager)
+
+        # Изменение с другой стороны связи: group.user_set
+        group.user_set.remove(self.owner)
+        self.assertIsNone(cache.get(role_cache_key(self.owner.pk)))
+        self.assertFalse(self.fresh_role(self.owner).is_manager)
+
+    def test_group_rename_clears_cached_role(self):
+        self.assertTrue(self.fresh_role(self.manager).is_manager)
+        group = Group.objects.get(name=MANAGER_GROUP_NAME)
+        group.name = 'Бывшие менеджеры'
+        group.save()
+        self.assertIsNone(cache.get(role_cache_key(self.manager.pk)))
+        self.assertFalse(self.fresh_role(self.manager).is_manager)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RecipientImportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = create_user('owner@example.com')
+        Recipient.objects.create(email='old@example.com', full_name='Старый',
+                                 owner=cls.owner)
+
+    def run_import(self, text):
+        with self.captureOnCommitCallbacks(execute=True):
+            return import_recipients(io.StringIO(text), self.owner)
+
+    def test_existing_and_repeated_addresses_are_not_created(self):
+        report = self.run_import(
+            'email,full_name\n'
+            'new@example.com,Новый\n'
+            'old@example.com,Старый\n'
+            'new@example.com,Новый\n'
+            'bad-address,Ошибка\n'
+        )
+        self.assertEqual((report.total, report.created, report.duplicates,
+                          report.skipped, report.rejected), (4, 1, 2, 0, 1))
+
+    def test_concurrently_inserted_address_is_skipped(self):
+        existing_emails = RecipientImporter.existing_emails
+        checks = []
+
+        def stale_first_check(importer, emails):
+            # Первая проверка пачки прошла до того, как параллельный
+            # импорт добавил race@example.com
+            checks.append(emails)
+            if len(checks) == 1:
+                return set()
+            return existing_emails(importer, emails)
+
+        Recipient.objects.create(email='race@example.com', full_name='Гонка',
+                                 owner=self.owner)
+        with mock.patch.object(RecipientImporter, 'existing_emails',
+                               autospec=True, side_effect=stale_first_check):
+            report = self.run_import('race@example.com\nnew@example.com\n')
+        self.assertEqual((report.created, report.duplicates, report.skipped),
+                         (1, 0, 1))
+        self.assertEqual(Recipient.objects.count(), 3)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PageCacheTests(TestCase):
+    """Кеш страниц по версии данных владельца и условные ответы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = create_user('owner@example.com')
+        cls.other = create_user('other@example.com')
+        cls.mailing = create_mailing(cls.owner)
+        cls.other_mailing = create_mailing(cls.other)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.owner)
+        self.list_url = reverse('mailing:mailing_list')
+        self.detail_url = reverse('mailing:mailing_detail',
+                                  args=[self.mailing.pk])
+
+    def rename_message(self, mailing, subject, save=True):
+        """Меняет тему сообщения рассылки; save=False — мимо сигналов,
+        версия владельца при этом не меняется."""
+        message = mailing.message
+        if not save:
+            Message.objects.filter(pk=message.pk).update(subject=subject)
+            return
+        message.subject = subject
+        # Версия обновляется после фиксации транзакции
+        with self.captureOnCommitCallbacks(execute=True):
+            message.save()
+
+    def test_version_bump_invalidates_list_and_detail(self):
+        for url in (self.list_url, self.detail_url):
+            self.assertContains(self.client.get(url), 'Тема')
+
+        # Без смены версии страницы отдаются из кеша
+        self.rename_message(self.mailing, 'Без сигнала', save=False)
+        for url in (self.list_url, self.detail_url):
+            self.assertNotContains(self.client.get(url), 'Без сигнала')
+
+        self.rename_message(self.mailing, 'Новая тема')
+        for url in (self.list_url, self.detail_url):
+            self.assertContains(self.client.get(url), 'Новая тема')
+
+    def test_etag_returns_not_modified(self):
+        for url in (self.list_url, self.detail_url):
+            response = self.client.get(url)
+            etag = response['ETag']
+            self.assertNotIn('Last-Modified', response)
+            self.assertEqual(
+                self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+                304,
+            )
+
+        self.rename_message(self.mailing, 'Новая тема')
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_if_modified_since_alone_is_not_answered_with_304(self):
+        response = self.client.get(
+            self.list_url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60),
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_other_owner_change_keeps_pages(self):
+        etags = {url: self.client.get(url)['ETag']
+                 for url in (self.list_url, self.detail_url)}
+
+        self.rename_message(self.other_mailing, 'Чужая тема')
+        for url, etag in etags.items():
+            self.assertEqual(
+                self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+                304,
+            )
+
+
+@override_settings(CACHES=LOCMEM_CACHES, MAILING_METRICS_TOKEN='',
+                   MAILING_METRICS_ALLOWED_IPS=[])
+class MetricsAccessTests(TestCase):
+    """В метриках данные владельцев и очередей: без настройки доступа
+    они закрыты."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        metrics_dir = override_settings(MAILING_METRICS_DIR=directory.name)
+        metrics_dir.enable()
+        self.addCleanup(metrics_dir.disable)
+        self.url = reverse('metrics')
+
+    def test_denied_by_default(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    @override_settings(MAILING_METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_allowed_address_without_token(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(
+            self.client.get(self.url, REMOTE_ADDR='10.0.0.1').status_code,
+            403,
+        )
+
+    @override_settings(MAILING_METRICS_TOKEN='secret',
+                       MAILING_METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_token_required_when_configured(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        response = self.client.get(self.url,
+                                   HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+
+class MetricsCollectTests(TestCase):
+    """Сбор метрик узла: файлы завершившихся процессов сворачиваются
+    в DEAD_FILE без изменения сумм."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        metrics_dir = override_settings(MAILING_METRICS_DIR=self.directory)
+        metrics_dir.enable()
+        self.addCleanup(metrics_dir.disable)
+
+    def write(self, name, value):
+        shard = Shard()
+        shard.counters[('mailing_test_total', ('a',))] = value
+        with open(os.path.join(self.directory, name), 'w',
+                  encoding='utf-8') as file:
+            json.dump(shard.dump(), file)
+
+    @skipUnless(metrics.fcntl is not None, 'сворачивание требует fcntl')
+    def test_dead_process_is_counted_once(self):
+        finished = subprocess.Popen([sys.executable, '-c', 'pass'])
+        finished.wait()
+        self.write(f'{os.getpid()}-live.json', 1)
+        self.write(f'{finished.pid}-dead.json', 10)
+        self.write(metrics.DEAD_FILE, 100)
+
+        for _ in range(2):
+            total = metrics.collect()
+            self.assertEqual(
+                total.counters[('mailing_test_total', ('a',))], 111,
+            )
+        self.assertFalse(os.path.exists(
+            os.path.join(self.directory, f'{finished.pid}-dead.json'),
+        ))
+        with open(os.path.join(self.directory, metrics.DEAD_FILE),
+                  encoding='utf-8') as file:
+            dead = Shard()
+            dead.load(json.load(file))
+        self.assertEqual(dead.counters[('mailing_test_total', ('a',))], 110)
+
+
+class FakeSMTPConnection:
+    """Соединение бэкенда почты без сети: отвечает на письма адресов
+    из replies исключением, остальные принимает. Адреса всех писем
+    записываются в sent."""
+
+    def __init__(self, sent, replies=None, delay=0):
+        self.sent = sent
+        self.replies = replies or {}
+        self.delay = delay
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def send_messages(self, messages):
+        for message in messages:
+            time.sleep(self.delay)
+            self.sent.append(message.to[0])
+            if (error := self.replies.get(message.to[0])) is not None:
+                raise error
+        return len(messages)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProfiledThreadsTests(TransactionTestCase):
+    """Под профилировщиком потоки отправки, записи и продления аренды
+    работают, а профиль включает и их."""
+
+    def test_threads_run_under_profiler(self):
+        owner = create_user('owner@example.com')
+        recipients = [
+            Recipient.objects.create(email=f'to{i}@example.com',
+                                     full_name='Получатель', owner=owner)
+            for i in range(6)
+        ]
+        mailing = create_mailing(owner, recipients)
+        enqueue_mailing(mailing)
+        claim_job('worker')
+        chunk = claim_chunk('worker')
+        sent = []
+        router = get_router(lambda: FakeSMTPConnection(sent, delay=0.05))
+        results = []
+
+        def deliver():
+            results.append(deliver_threaded(
+                mailing, recipient_batches(mailing, 3), 3, router, 2,
+                AttemptWriter(mailing),
+            ))
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'delivery.pstats')
+            with PhaseProfiler(output=output):
+                with Heartbeat(chunk, 'worker', interval=0.01) as heartbeat:
+                    # Если потоки не запустятся, доставка зависнет
+                    # на очереди шарда, а не весь прогон тестов
+                    delivery = threading.Thread(target=deliver, daemon=True)
+                    delivery.start()
+                    delivery.join(timeout=30)
+            functions = {name for _, _, name in pstats.Stats(output).stats}
+
+        self.assertFalse(delivery.is_alive())
+        self.assertEqual(results[0].success, len(recipients))
+        self.assertCountEqual(sent, [r.email for r in recipients])
+        self.assertEqual(
+            MailingAttempt.objects.filter(
+                mailing=mailing, status=MailingAttempt.STATUS_SUCCESS,
+            ).count(),
+            len(recipients),
+        )
+        self.assertFalse(heartbeat.lost.is_set())
+        chunk_heartbeat = MailingChunk.objects.values_list(
+            'heartbeat_at', flat=True,
+        ).get(pk=chunk.pk)
+        self.assertGreater(chunk_heartbeat, chunk.heartbeat_at)
+        self.assertIn('send_chunk', functions)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, MAILING_CHUNK_SIZE=2)
+class ChunkLeaseTests(TestCase):
+    """Аренда диапазонов: диапазон у одного воркера, истекшая аренда
+    переходит другому, а прежний владелец уже ничего не меняет."""
+
+    def setUp(self):
+        owner = create_user('owner@example.com')
+        recipients = [
+            Recipient.objects.create(email=f'to{i}@example.com',
+                                     full_name='Получатель', owner=owner)
+            for i in range(4)
+        ]
+        enqueue_mailing(create_mailing(owner, recipients))
+        self.job = claim_job('worker-a')
+
+    def test_chunk_is_claimed_once(self):
+        first = claim_chunk('worker-a')
+        second = claim_chunk('worker-b')
+        self.assertNotEqual(first.pk, second.pk)
+        self.assertIsNone(claim_chunk('worker-c'))
+        self.assertEqual(
+            dict(MailingChunk.objects.values_list('pk', 'claimed_by')),
+            {first.pk: 'worker-a', second.pk: 'worker-b'},
+        )
+
+    def test_expired_lease_is_reclaimed(self):
+        chunk = claim_chunk('worker-a')
+        claim_chunk('worker-a')
+        self.assertIsNone(claim_chunk('worker-b'))
+
+        expire_lease(chunk)
+        reclaimed = claim_chunk('worker-b')
+        self.assertEqual(reclaimed.pk, chunk.pk)
+        self.assertEqual(reclaimed.claimed_by, 'worker-b')
+        self.assertGreater(reclaimed.lease_until, timezone.now())
+
+    def test_stale_owner_changes_nothing(self):
+        chunk = claim_chunk('worker-a')
+        expire_lease(chunk)
+        reclaimed = claim_chunk('worker-b')
+
+        self.assertEqual(finish_chunk(chunk, 'worker-a'), 0)
+        release_chunk(chunk, 'worker-a')
+        self.assertEqual(Heartbeat(chunk, 'worker-a').beat(), 0)
+        chunk.refresh_from_db()
+        self.assertEqual(chunk.status, MailingChunk.STATUS_RUNNING)
+        self.assertEqual(chunk.claimed_by, 'worker-b')
+        self.assertEqual(chunk.lease_until, reclaimed.lease_until)
+        self.assertIsNone(chunk.finished_at)
+
+        self.assertEqual(finish_chunk(chunk, 'worker-b'), 1)
+        chunk.refresh_from_db()
+        self.assertEqual(chunk.status, MailingChunk.STATUS_DONE)
+
+    def test_conditional_update_skips_chunk_claimed_meanwhile(self):
+        """Без SKIP LOCKED диапазон, который другой воркер захватил
+        между выбором кандидатов и UPDATE, пропускается."""
+        first, second = MailingChunk.objects.order_by('start_after')
+        claimable = chunks.claimable
+        calls = []
+
+        def claimed_meanwhile():
+            calls.append(None)
+            if len(calls) == 2:
+                # UPDATE первого кандидата: его успел забрать worker-a
+                MailingChunk.objects.filter(pk=first.pk).update(
+                    status=MailingChunk.STATUS_RUNNING,
+                    claimed_by='worker-a',
+                    lease_until=chunks.lease_until(),
+                )
+            return claimable()
+
+        with mock.patch.object(connection.features,
+                               'has_select_for_update_skip_locked', False), \
+                mock.patch.object(chunks, 'claimable',
+                                  side_effect=claimed_meanwhile):
+            chunk = claim_chunk('worker-b')
+
+        self.assertEqual(chunk.pk, second.pk)
+        self.assertEqual(
+            dict(MailingChunk.objects.values_list('pk', 'claimed_by')),
+            {first.pk: 'worker-a', second.pk: 'worker-b'},
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES, MAILING_BATCH_SIZE=2,
+                   MAILING_DELIVERY_ENGINE='sync', MAILING_ROUTES={})
+class ChunkResumeTests(TestCase):
+    """Диапазон, остановленный или брошенный посреди отправки,
+    досылается другим воркером: каждому получателю ровно одна попытка."""
+
+    def setUp(self):
+        owner = create_user('owner@example.com')
+        self.recipients = [
+            Recipient.objects.create(email=f'to{i}@example.com',
+                                     full_name='Получатель', owner=owner)
+            for i in range(8)
+        ]
+        self.mailing = create_mailing(owner, self.recipients)
+        enqueue_mailing(self.mailing)
+        claim_job('worker-a')
+        self.chunk = claim_chunk('worker-a')
+
+    def assertAttemptedOnce(self):
+        attempts = Counter(MailingAttempt.objects.filter(
+            mailing=self.mailing,
+        ).values_list('recipient_id', flat=True))
+        self.assertEqual(attempts, Counter(
+            recipient.pk for recipient in self.recipients
+        ))
+
+    def test_stopped_chunk_resumes_from_cursor(self):
+        stop_event = threading.Event()
+
+        def stop_after_three(**kwargs):
+            if len(mail.outbox) == 3:
+                stop_event.set()
+
+        message_sent.connect(stop_after_three)
+        try:
+            process_chunk(self.chunk, 'worker-a', connections=1,
+                          stop_event=stop_event)
+        finally:
+            message_sent.disconnect(stop_after_three)
+
+        # Начатая пачка дописывается, следующая уже не выдается
+        self.chunk.refresh_from_db()
+        self.assertEqual(self.chunk.status, MailingChunk.STATUS_PENDING)
+        self.assertEqual(self.chunk.cursor, self.recipients[3].pk)
+        self.assertEqual(len(mail.outbox), 4)
+
+        chunk = claim_chunk('worker-b')
+        self.assertEqual(chunk.pk, self.chunk.pk)
+        process_chunk(chunk, 'worker-b', connections=1)
+
+        chunk.refresh_from_db()
+        self.assertEqual(chunk.status, MailingChunk.STATUS_DONE)
+        self.assertCountEqual(
+            [message.to[0] for message in mail.outbox],
+            [recipient.email for recipient in self.recipients],
+        )
+        self.assertAttemptedOnce()
+
+    def test_abandoned_chunk_skips_processed_after_cursor(self):
+        progress = DeliveryProgress(self.chunk, 'worker-a')
+        batches = progress.batches(self.mailing, 2, iter_recipient_batches)
+        first, second, third = next(batches), next(batches), next(batches)
+        writer = AttemptWriter(self.mailing, progress=progress)
+        # Пачки завершаются не по порядку: третья раньше первых двух
+        for recipient in [*third, second[1], first[0]]:
+            writer.add(recipient, MailingAttempt.STATUS_SUCCESS,
+                       'Отправлено успешно')
+            writer.flush()
+
+        self.chunk.refresh_from_db()
+        self.assertEqual(self.chunk.cursor, self.chunk.start_after)
+        self.assertEqual(self.chunk.high_water, third[-1].pk)
+
+        # Воркер worker-a умер, не дописав первые две пачки
+        expire_lease(self.chunk)
+        chunk = claim_chunk('worker-b')
+        self.assertEqual(chunk.pk, self.chunk.pk)
+        process_chunk(chunk, 'worker-b', connections=1)
+
+        chunk.refresh_from_db()
+        self.assertEqual(chunk.status, MailingChunk.STATUS_DONE)
+        self.assertEqual(chunk.cursor, self.recipients[-1].pk)
+        self.assertEqual(
+            [message.to[0] for message in mail.outbox],
+            [recipient.email for recipient
+             in [first[1], second[0], *self.recipients[6:]]],
+        )
+        self.assertAttemptedOnce()
+
+
+@override_settings(CACHES=LOCMEM_CACHES, MAILING_DELIVERY_ENGINE='sync',
+                   MAILING_ROUTES={}, MAILING_RETRY_ATTEMPTS=2,
+                   MAILING_RETRY_BASE_DELAY=60, MAILING_RETRY_MAX_DELAY=3600)
+class RetryTests(TestCase):
+    """Ответ 4xx откладывает письмо и ставит повтор с растущей
+    задержкой, 5xx — окончательный отказ; доставленным повтор
+    не отправляется."""
+
+    def setUp(self):
+        owner = create_user('owner@example.com')
+        self.ok, self.soft, self.hard = (
+            Recipient.objects.create(email=f'{name}@example.com',
+                                     full_name='Получатель', owner=owner)
+            for name in ('ok', 'soft', 'hard')
+        )
+        self.mailing = create_mailing(owner, [self.ok, self.soft, self.hard])
+        self.sent = []
+        self.replies = {
+            self.soft.email: smtplib.SMTPRecipientsRefused(
+                {self.soft.email: (451, b'Try again later')},
+            ),
+            self.hard.email: smtplib.SMTPRecipientsRefused(
+                {self.hard.email: (550, b'No such user')},
+            ),
+        }
+        factory = mock.patch(
+            'mailing.delivery.default_connection_factory',
+            lambda: FakeSMTPConnection(self.sent, self.replies),
+        )
+        factory.start()
+        self.addCleanup(factory.stop)
+
+    def statuses(self):
+        return sorted(MailingAttempt.objects.filter(
+            mailing=self.mailing,
+        ).values_list('recipient__email', 'status', 'smtp_code'))
+
+    def make_due(self):
+        MailingRetry.objects.update(
+            next_attempt_at=timezone.now() - timedelta(seconds=1),
+        )
+
+    def assertRetryDelay(self, retry, started, min_delay, max_delay):
+        self.assertGreaterEqual(retry.next_attempt_at,
+                                started + timedelta(seconds=min_delay))
+        self.assertLessEqual(retry.next_attempt_at,
+                             timezone.now() + timedelta(seconds=max_delay))
+
+    def test_soft_bounce_is_retried_with_backoff(self):
+        started = timezone.now()
+        result = deliver_mailing(self.mailing)
+
+        self.assertEqual((result.success, result.deferred, result.failed),
+                         (1, 1, 1))
+        self.assertEqual(self.statuses(), [
+            ('hard@example.com', MailingAttempt.STATUS_FAILED, 550),
+            ('ok@example.com', MailingAttempt.STATUS_SUCCESS, None),
+            ('soft@example.com', MailingAttempt.STATUS_DEFERRED, 451),
+        ])
+        retry = MailingRetry.objects.get()
+        self.assertEqual((retry.recipient_id, retry.retries, retry.smtp_code),
+                         (self.soft.pk, 1, 451))
+        # Задержка первого повтора — от половины базовой до базовой
+        self.assertRetryDelay(retry, started, 30, 60)
+
+        self.sent.clear()
+        self.make_due()
+        started = timezone.now()
+        self.assertEqual(process_due_retries(), 1)
+
+        self.assertEqual(self.sent, [self.soft.email])
+        retry = MailingRetry.objects.get()
+        self.assertEqual(retry.retries, 2)
+        self.assertRetryDelay(retry, started, 60, 120)
+
+        # Попытки исчерпаны: повтор становится окончательным отказом
+        self.sent.clear()
+        self.make_due()
+        process_due_retries()
+        self.assertEqual(self.sent, [self.soft.email])
+        self.assertFalse(MailingRetry.objects.exists())
+        self.assertEqual(
+            MailingAttempt.objects.filter(
+                recipient=self.soft,
+            ).values_list('status', flat=True).latest('pk'),
+            MailingAttempt.STATUS_FAILED,
+        )
+
+    def test_delivered_recipients_are_not_resent(self):
+        deliver_mailing(self.mailing)
+        # Устаревшая запись очереди получателя, которому письмо доставлено
+        MailingRetry.objects.create(
+            mailing=self.mailing, recipient=self.ok, retries=1,
+            next_attempt_at=timezone.now(),
+        )
+        del self.replies[self.soft.email]
+        self.sent.clear()
+        self.make_due()
+
+        self.assertEqual(process_due_retries(), 2)
+        self.assertEqual(self.sent, [self.soft.email])
+        self.assertFalse(MailingRetry.objects.exists())
+
+        self.sent.clear()
+        self.assertEqual(process_due_retries(), 0)
+        self.assertEqual(self.sent, [])
+        self.assertEqual(
+            MailingAttempt.objects.filter(
+                mailing=self.mailing, status=MailingAttempt.STATUS_SUCCESS,
+            ).count(),
+            2,
+        )
@@ -1,9 +1,13 @@
 from django.urls import path
 from .views import (
     RecipientListView, RecipientCreateView, RecipientUpdateView, RecipientDeleteView,
+    RecipientImportView,
     MessageListView, MessageCreateView, MessageUpdateView, MessageDeleteView,
     MailingListView, MailingCreateView, MailingUpdateView, MailingDeleteView,
     MailingDetailView, send_mailing, MailingAttemptListView,
+    MailingApiView, MessageApiView, RecipientApiView, MailingAttemptApiView,
+    delivery_stats, export_attempts, export_recipients, recipient_autocomplete,
+    unsubscribe,
 )
 
 app_name = 'mailing'
@@ -12,6 +16,11 @@ urlpatterns = [
     # Получатели рассылки
     path('recipients/', RecipientListView.as_view(), name='recipient_list'),
     path('recipients/create/', RecipientCreateView.as_view(), name='recipient_create'),
+    path('recipients/import/', RecipientImportView.as_view(), name='recipient_import'),
+    path('recipients/export/', export_recipients, name='recipient_export'),
+    path('recipients/autocomplete/',
+         recipient_autocomplete, name='recipient_autocomplete'),
+    path('unsubscribe/<str:token>/', unsubscribe, name='unsubscribe'),
     path('recipients/<int:pk>/update/',
          RecipientUpdateView.as_view(),
          name='recipient_update'),
@@ -43,4 +52,17 @@ urlpatterns = [
     path('mailing_attempts/',
          MailingAttemptListView.as_view(),
          name='mailing_attempt_list'),
+    path('mailing_attempts/export/',
+         export_attempts,
+         name='mailing_attempt_export'),
+
+    # JSON-API для дашбордов (курсорная пагинация, ?cursor=)
+    path('api/mailings/', MailingApiView.as_view(), name='api_mailing_list'),
+    path('api/messages/', MessageApiView.as_view(), name='api_message_list'),
+    path('api/recipients/',
+         RecipientApiView.as_view(), name='api_recipient_list'),
+    path('api/mailing_attempts/',
+         MailingAttemptApiView.as_view(),
+         name='api_mailing_attempt_list'),
+    path('api/stats/', delivery_stats, name='api_delivery_stats'),
 ]
@@ -1,57 +1,164 @@
+import csv
+import io
 import logging
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_http_methods, require_POST
 from django.contrib.auth.decorators import login_required
 from django.views.generic import (
+    FormView,
     ListView,
     CreateView,
     UpdateView,
     DeleteView,
     DetailView,
 )
-from django.shortcuts import get_object_or_404, redirect
-from django.urls import reverse_lazy
-from django.core.mail import send_mail
 from django.conf import settings
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden,
+    JsonResponse, StreamingHttpResponse,
+)
+from django.core import signing
+from django.shortcuts import get_object_or_404, redirect, render
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.csrf import csrf_exempt
+from django.urls import reverse_lazy
 from django.contrib import messages
-from .models import Mailing, Message, Recipient, MailingAttempt
-from .forms import MailingForm, MessageForm, RecipientForm
+from .models import (
+    Mailing, Message, Recipient, RecipientList, MailingAttempt, OwnerStats,
+    Suppression,
+)
+from .forms import (
+    MailingForm, MessageForm, RecipientForm, RecipientImportForm,
+)
+from .autocomplete import search_recipients
+from .caching import CachedPageMixin
+from .exporters import (
+    ATTEMPT_COLUMNS, CONTENT_TYPES, FORMAT_CSV, RECIPIENT_COLUMNS,
+    export_rows, parse_attempt_filters, parse_recipient_filters,
+)
+from .importers import import_recipients
+from .jobs import enqueue_mailing
+from .metrics import CONTENT_TYPE, render_metrics
+from .pagination import InvalidCursor, KeysetPaginator
+from .personalization import UnsubscribeSigner
+from .roles import get_role, scope_queryset
+from .suppression import normalize, suppress
 
 
-MANAGER_GROUP_NAME = 'Менеджеры'
 logger = logging.getLogger(__name__)
 
 
 class OwnerMixin(UserPassesTestMixin):
     def test_func(self):
-        obj = self.get_object()
-        user = self.request.user
-        if user.groups.filter(name=MANAGER_GROUP_NAME).exists():
-            return True
-        return obj.owner == user
+        return get_role(self.request.user).can_access(self.get_object())
 
     def handle_no_permission(self):
         messages.error(self.request, "У вас нет доступа к этому объекту.")
         return redirect('mailing:mailing_list')
 
 
-class MailingListView(LoginRequiredMixin, ListView):
+class KeysetPaginationMixin:
+    """Постраничный вывод ListView по курсору (?cursor=) вместо OFFSET."""
+
+    keyset_ordering = ('id',)
+
+    def get_page_size(self):
+        return settings.MAILING_PAGE_SIZE
+
+    def get_cursor_page(self):
+        paginator = KeysetPaginator(
+            self.object_list, self.keyset_ordering, self.get_page_size(),
+        )
+        try:
+            return paginator.page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404("Некорректный курсор страницы.")
+
+    def get_context_data(self, **kwargs):
+        page = self.get_cursor_page()
+        return super().get_context_data(
+            object_list=page.object_list, cursor_page=page, **kwargs
+        )
+
+
+class CachedListMixin(CachedPageMixin):
+    """Кеширует страницу списка по версии данных владельца."""
+
+    def get_cursor_page(self):
+        return self.cached('page', super().get_cursor_page)
+
+
+class CursorJsonMixin:
+    """Отдает страницу списка в JSON для дашбордов: тот же курсор,
+    те же фильтры и права, что и у HTML-списка."""
+
+    api_fields = ('id',)
+
+    def render_to_response(self, context, **response_kwargs):
+        page = context['cursor_page']
+        return JsonResponse({
+            'results': [
+                {name: getattr(obj, name) for name in self.api_fields}
+                for obj in page.object_list
+            ],
+            'next_cursor': page.next_cursor,
+            'previous_cursor': page.previous_cursor,
+        })
+
+
+class MailingListView(LoginRequiredMixin, CachedListMixin,
+                      KeysetPaginationMixin, ListView):
     model = Mailing
     context_object_name = 'mailings'
     template_name = 'mailing/mailing_list.html'
 
     def get_queryset(self):
-        user = self.request.user
-        if user.groups.filter(name=MANAGER_GROUP_NAME).exists():
-            return Mailing.objects.all()
-        return Mailing.objects.filter(owner=user)
-
-
-class MailingDetailView(LoginRequiredMixin, OwnerMixin, DetailView):
+        # Число получателей — подзапросом по строкам страницы, чтобы
+        # закешированная страница не обращалась к БД при выводе
+        recipient_count = Subquery(
+            Mailing.recipients.through.objects
+            .filter(mailing_id=OuterRef('pk'))
+            .values('mailing_id')
+            .annotate(count=Count('pk'))
+            .values('count')
+        )
+        list_size = Subquery(
+            RecipientList.recipients.through.objects
+            .filter(recipientlist_id=OuterRef('recipient_list_id'))
+            .values('recipientlist_id')
+            .annotate(count=Count('pk'))
+            .values('count')
+        )
+        return scope_queryset(
+            self.request.user,
+            Mailing.objects.select_related(
+                'message', 'stats', 'recipient_list',
+            ).annotate(
+                recipient_count=Coalesce(recipient_count, 0),
+                list_size=Coalesce(list_size, 0),
+            ),
+        )
+
+
+class MailingDetailView(LoginRequiredMixin, OwnerMixin, CachedPageMixin,
+                        DetailView):
     model = Mailing
     template_name = 'mailing/mailing_detail.html'
 
+    def get_object(self, queryset=None):
+        # Проверка доступа и вывод карточки читают один и тот же объект
+        if not hasattr(self, 'object'):
+            get_object = super().get_object
+            self.object = self.cached('object', lambda: get_object(queryset))
+        return self.object
+
+    def get_queryset(self):
+        return Mailing.objects.select_related('message', 'stats',
+                                              'recipient_list')
+
 
 class MailingCreateView(LoginRequiredMixin, CreateView):
     model = Mailing
@@ -72,7 +179,7 @@ class MailingCreateView(LoginRequiredMixin, CreateView):
 class MailingUpdateView(LoginRequiredMixin, OwnerMixin, UpdateView):
     model = Mailing
     form_class = MailingForm
-    template_name = 'mailing/mailing_update.html'
+    template_name = 'mailing/mailing_form.html'
     success_url = reverse_lazy('mailing:mailing_list')
 
     def get_form_kwargs(self):
@@ -87,16 +194,14 @@ class MailingDeleteView(LoginRequiredMixin, OwnerMixin, DeleteView):
     success_url = reverse_lazy('mailing:mailing_list')
 
 
-class MessageListView(LoginRequiredMixin, ListView):
+class MessageListView(LoginRequiredMixin, CachedListMixin,
+                      KeysetPaginationMixin, ListView):
     model = Message
     context_object_name = 'messages'
     template_name = 'mailing/message_list.html'
 
     def get_queryset(self):
-        user = self.request.user
-        if user.groups.filter(name=MANAGER_GROUP_NAME).exists():
-            return Message.objects.all()
-        return Message.objects.filter(owner=user)
+        return scope_queryset(self.request.user, Message.objects.all())
 
 
 class MessageCreateView(LoginRequiredMixin, CreateView):
@@ -123,16 +228,14 @@ class MessageDeleteView(LoginRequiredMixin, OwnerMixin, DeleteView):
     success_url = reverse_lazy('mailing:message_list')
 
 
-class RecipientListView(LoginRequiredMixin, ListView):
+class RecipientListView(LoginRequiredMixin, CachedListMixin,
+                        KeysetPaginationMixin, ListView):
     model = Recipient
     context_object_name = 'recipients'
     template_name = 'mailing/recipient_list.html'
 
     def get_queryset(self):
-        user = self.request.user
-        if user.groups.filter(name=MANAGER_GROUP_NAME).exists():
-            return Recipient.objects.all()
-        return Recipient.objects.filter(owner=user)
+        return scope_queryset(self.request.user, Recipient.objects.all())
 
 
 class RecipientCreateView(LoginRequiredMixin, CreateView):
@@ -146,6 +249,38 @@ class RecipientCreateView(LoginRequiredMixin, CreateView):
         return super().form_valid(form)
 
 
+class RecipientImportView(LoginRequiredMixin, FormView):
+    form_class = RecipientImportForm
+    template_name = 'mailing/recipient_import.html'
+
+    def form_valid(self, form):
+        upload = form.cleaned_data['file']
+        # Файл читается построчно, без загрузки целиком в память
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig',
+                                  newline='')
+        recipient_list = None
+        if list_name := form.cleaned_data['list_name'].strip():
+            recipient_list, _ = RecipientList.objects.get_or_create(
+                owner=self.request.user, name=list_name,
+            )
+        try:
+            report = import_recipients(stream, self.request.user,
+                                       recipient_list=recipient_list)
+        except (UnicodeDecodeError, csv.Error) as e:
+            form.add_error('file', f"Не удалось прочитать CSV: {e}")
+            return self.form_invalid(form)
+        messages.success(
+            self.request,
+            f"Импорт завершен: добавлено - {report.created}, "
+            f"дубликатов - {report.duplicates}, "
+            f"пропущено - {report.skipped}, "
+            f"отклонено - {report.rejected}",
+        )
+        return self.render_to_response(
+            self.get_context_data(form=self.form_class(), report=report)
+        )
+
+
 class RecipientUpdateView(LoginRequiredMixin, OwnerMixin, UpdateView):
     model = Recipient
     form_class = RecipientForm
@@ -159,18 +294,152 @@ class RecipientDeleteView(LoginRequiredMixin, OwnerMixin, DeleteView):
     success_url = reverse_lazy('mailing:recipient_list')
 
 
-class MailingAttemptListView(LoginRequiredMixin, ListView):
+class MailingAttemptListView(LoginRequiredMixin, KeysetPaginationMixin,
+                             ListView):
     model = MailingAttempt
     context_object_name = 'attempts'
     template_name = 'mailing/mailing_attempt_list.html'
+    keyset_ordering = ('-attempt_time', '-id')
 
     def get_queryset(self):
-        user = self.request.user
-        if user.groups.filter(name=MANAGER_GROUP_NAME).exists():
-            return MailingAttempt.objects.all().select_related('mailing')
-        return MailingAttempt.objects.filter(
-            mailing__owner=user
-        ).select_related('mailing')
+        queryset = scope_queryset(
+            self.request.user, MailingAttempt.objects.all(), 'mailing__owner'
+        )
+
+        # Фильтры работают по индексам (mailing, attempt_time)
+        # и (mailing, status)
+        mailing_id = self.request.GET.get('mailing', '')
+        if mailing_id.isdigit():
+            queryset = queryset.filter(mailing_id=mailing_id)
+        status = self.request.GET.get('status')
+        if status in dict(MailingAttempt.STATUS_CHOICES):
+            queryset = queryset.filter(status=status)
+
+        return queryset.select_related('mailing', 'recipient')
+
+
+class MailingApiView(CursorJsonMixin, MailingListView):
+    api_fields = ('id', 'status', 'start_time', 'end_time',
+                  'message_id', 'owner_id')
+
+
+class MessageApiView(CursorJsonMixin, MessageListView):
+    api_fields = ('id', 'subject', 'owner_id')
+
+
+class RecipientApiView(CursorJsonMixin, RecipientListView):
+    api_fields = ('id', 'email', 'full_name', 'owner_id')
+
+
+class MailingAttemptApiView(CursorJsonMixin, MailingAttemptListView):
+    api_fields = ('id', 'mailing_id', 'recipient_id', 'attempt_time',
+                  'status', 'server_response')
+
+
+@login_required
+def recipient_autocomplete(request):
+    """Подбор получателей для формы рассылки (?q=): поиск по началу
+    email или Ф.И.О. среди своих получателей."""
+    recipients = search_recipients(
+        Recipient.objects.filter(owner=request.user),
+        request.GET.get('q', ''),
+    )
+    return JsonResponse({
+        'results': [
+            {
+                'id': recipient.pk,
+                'email': recipient.email,
+                'full_name': recipient.full_name,
+                'text': str(recipient),
+            }
+            for recipient in recipients
+        ],
+    })
+
+
+@login_required
+def delivery_stats(request):
+    """Счетчики доставки по владельцам для дашбордов (без агрегации
+    журнала попыток)."""
+    stats = scope_queryset(request.user, OwnerStats.objects.all())
+    return JsonResponse({
+        'results': [
+            {
+                'owner_id': item.owner_id,
+                'sent': item.sent,
+                'failed': item.failed,
+                'success_rate': item.success_rate,
+                'last_attempt_time': item.last_attempt_time,
+            }
+            for item in stats
+        ],
+    })
+
+
+@require_http_methods(['GET'])
+def metrics(request):
+    """Метрики узла в текстовом формате Prometheus. Если задан
+    MAILING_METRICS_TOKEN, нужен заголовок Authorization: Bearer <токен>,
+    иначе метрики отдаются только адресам из MAILING_METRICS_ALLOWED_IPS:
+    в них данные владельцев и очередей."""
+    token = settings.MAILING_METRICS_TOKEN
+    if token:
+        allowed = constant_time_compare(
+            request.headers.get('Authorization', ''), f'Bearer {token}',
+        )
+    else:
+        allowed = (request.META.get('REMOTE_ADDR')
+                   in settings.MAILING_METRICS_ALLOWED_IPS)
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
+
+
+def streaming_export(request, queryset, columns, name):
+    export_format = request.GET.get('format', FORMAT_CSV)
+    try:
+        chunks = export_rows(queryset, columns, export_format)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    response = StreamingHttpResponse(
+        chunks, content_type=CONTENT_TYPES[export_format],
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{name}.{export_format}"'
+    )
+    # Не даем прокси (nginx) буферизовать выгрузку целиком
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+def export_attempts(request):
+    """Потоковая выгрузка журнала попыток (?format=csv|ndjson,
+    фильтры ?mailing=, ?status=, ?date_from=, ?date_to=)."""
+    try:
+        filters = parse_attempt_filters(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    queryset = scope_queryset(
+        request.user, MailingAttempt.objects.filter(**filters),
+        'mailing__owner',
+    )
+    return streaming_export(request, queryset, ATTEMPT_COLUMNS,
+                            'mailing_attempts')
+
+
+@login_required
+def export_recipients(request):
+    """Потоковая выгрузка получателей (?format=csv|ndjson, ?mailing=)."""
+    try:
+        filters = parse_recipient_filters(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    queryset = scope_queryset(
+        request.user, Recipient.objects.filter(**filters),
+    )
+    return streaming_export(request, queryset, RECIPIENT_COLUMNS,
+                            'recipients')
 
 
 @require_POST
@@ -183,50 +452,37 @@ def send_mailing(request, pk):
         messages.error(request, "У вас нет прав для запуска этой рассылки.")
         return redirect('mailing:mailing_list')
 
-    recipients = mailing.recipients.all()
-    message = mailing.message
-
-    success_count = 0
-    fail_count = 0
-
-    for recipient in recipients:
-        try:
-            send_mail(
-                subject=message.subject,
-                message=message.body,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[recipient.email],
-                fail_silently=False,
-            )
-            MailingAttempt.objects.create(
-                mailing=mailing,
-                status='success',
-                server_response='Отправлено успешно',
-            )
-            success_count += 1
-        except Exception as e:
-            MailingAttempt.objects.create(
-                mailing=mailing,
-                status='failed',
-                server_response=str(e),
-            )
-            logger.error(
-                f"Ошибка отправки письма "
-                f"получателю {recipient.email}: {e}",
-                exc_info=True,
-            )
-            fail_count += 1
-
-    now = timezone.now()
-    if mailing.status == Mailing.STATUS_CREATED:
-        mailing.status = Mailing.STATUS_STARTED
-        if not mailing.start_time:
-            mailing.start_time = now
-    mailing.end_time = now
-    mailing.save()
+    job = enqueue_mailing(mailing)
 
     messages.success(
         request,
-        f"Рассылка выполнена: успешно - {success_count}, неуспешно - {fail_count}",
+        f"Рассылка поставлена в очередь на отправку (задание #{job.pk}).",
     )
     return redirect('mailing:mailing_list')
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+def unsubscribe(request, token):
+    """Отписка получателя по подписанной ссылке из письма. POST без
+    CSRF-токена нужен для отписки в один клик из почтового клиента."""
+    try:
+        recipient_id = UnsubscribeSigner().unsign(token)
+    except signing.BadSignature:
+        raise Http404("Некорректная ссылка отписки.")
+    recipient = get_object_or_404(Recipient, pk=recipient_id)
+
+    if request.method == 'POST' and recipient.unsubscribed_at is None:
+        recipient.unsubscribed_at = timezone.now()
+        recipient.save(update_fields=['unsubscribed_at'])
+        # Стоп-лист владельца переживает удаление и повторный импорт
+        # получателя
+        suppress([Suppression(
+            email=normalize(recipient.email),
+            owner_id=recipient.owner_id,
+            reason=Suppression.REASON_UNSUBSCRIBE,
+        )])
+        logger.info(f"Получатель {recipient.pk} отписался от рассылок")
+
+    return render(request, 'mailing/unsubscribe.html',
+                  {'recipient': recipient})
@@ -3,6 +3,7 @@ from django.contrib.auth.models import Group, Permission
 from django.contrib.contenttypes.models import ContentType
 
 from mailing.models import Mailing, Recipient, Message
+from mailing.roles import MANAGER_GROUP_NAME
 
 
 class Command(BaseCommand):
@@ -12,7 +13,7 @@ class Command(BaseCommand):
     )
 
     def handle(self, *args, **options):
-        group_name = 'Managers'
+        group_name = MANAGER_GROUP_NAME
         managers_group, created = Group.objects.get_or_create(name=group_name)
 
         # Список моделей, к которым нужно дать права просмотра для менеджеров